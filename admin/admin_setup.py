@@ -1,8 +1,8 @@
 import os
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
-from core.security import pwd_context
-from db.session import get_db
+from core.security import get_password_hash_async
+from db.session import get_sync_db
 from user.models import Gender, User, UserRole, UserStatus
 
 load_dotenv()
@@ -62,7 +62,7 @@ async def create_initial_admin():
         return
     
     # Check if an admin already exists
-    db = next(get_db())
+    db = next(get_sync_db())
     existing_admin = db.query(User).filter(User.user_role == UserRole.ADMIN).first()
     
     if existing_admin:
@@ -70,7 +70,7 @@ async def create_initial_admin():
         return
     
     # Create the admin user with all required fields
-    hashed_password = pwd_context.hash(admin_password) # type: ignore
+    hashed_password = await get_password_hash_async(admin_password) # type: ignore
     
     new_admin = User(
         username=admin_username,
@@ -1,23 +1,46 @@
 from typing import List
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from db.session import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.db_routing import get_write_db
+from core.query_counter import query_budget
 from doctor import interface
 from doctor.schemas import DoctorProfileWithVerificationResponse
 from user.models import UserRole
+from core.cache import CACHES
+from db.pool import POOL_METRICS
 from core.permissions import role_required
-from user.schemas import UserDB
+from user.schemas import CurrentUser
 
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 @router.get("/dcotor-profile-with-doctor-verifications/", response_model=List[DoctorProfileWithVerificationResponse])
+@query_budget(6)
 async def get_doctor_profile_with_verification(
     skip: int = 0, 
     limit: int = 10,
-    db: Session = Depends(get_db),
-    current_user: UserDB = Depends(role_required(
+    db: AsyncSession = Depends(get_write_db),
+    current_user: CurrentUser = Depends(role_required(
         allowed_user_roles=[UserRole.ADMIN]
     ))    
 ):
-    return interface.get_doctor_profile_with_verification(db=db, skip=skip, limit=limit)
+    return await interface.get_doctor_profile_with_verification(db=db, skip=skip, limit=limit)
+
+
+@router.get("/cache-metrics", response_model=dict)
+async def get_cache_metrics(
+    current_user: CurrentUser = Depends(role_required(
+        allowed_user_roles=[UserRole.ADMIN]
+    ))
+):
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+
+# Connection pool occupancy and checkout wait times, to size the pools against the worker count
+@router.get("/pool-metrics", response_model=dict)
+async def get_pool_metrics(
+    current_user: CurrentUser = Depends(role_required(
+        allowed_user_roles=[UserRole.ADMIN]
+    ))
+):
+    return {name: metrics.stats() for name, metrics in POOL_METRICS.items()}
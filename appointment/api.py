@@ -1,12 +1,16 @@
-from typing import List
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from appointment.schemas import CreateAppointment, DoctorAvailableSlotsResponse, PatientAppointmentResponse
+from datetime import date
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from appointment.models import AppointmentStatus
+from appointment.schemas import AppointmentExportFormat, BulkCreateAppointments, BulkCreateAppointmentsResponse, CreateAppointment, DoctorAvailableSlotsResponse, EarliestAvailableDoctorsResponse, EarliestSlotSort, PatientAppointmentPage
 from core.permissions import role_required
-from db.session import get_db
+from core.db_routing import get_read_db, get_write_db
+from core.query_counter import query_budget
 from user.models import UserRole
-from user.schemas import UserDB
-from .interface import create_doctor_appointment, get_all_doctor_appointments, get_doctor_all_slot, get_all_patient_appointments
+from user.schemas import CurrentUser
+from .interface import bulk_create_appointments, export_appointments, cancel_patient_appointment, create_doctor_appointment, get_all_doctor_appointments, get_doctor_all_slot, get_all_patient_appointments, get_earliest_available_doctors
 
 
 
@@ -15,49 +19,189 @@ router = APIRouter(prefix="/appointment", tags=["Appointment"])
 
 
 @router.get("/select-appointment-slot/{doctor_id}", response_model=DoctorAvailableSlotsResponse)
+@query_budget(8)
 async def get_all_slot(
     doctor_id: int, 
-    db: Session = Depends(get_db),
-    current_user: UserDB = Depends(role_required(
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    clinic_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit_days: Optional[int] = Query(default=None, ge=1),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: CurrentUser = Depends(role_required(
         allowed_user_roles=[UserRole.PATIENT]
     ))
 ):
-    return get_doctor_all_slot(db=db, doctor_id=doctor_id)
+    return await get_doctor_all_slot(
+        db=db, 
+        doctor_id=doctor_id,
+        from_date=from_date,
+        to_date=to_date,
+        clinic_id=clinic_id,
+        cursor=cursor,
+        limit_days=limit_days
+    )
+
+
+# Doctors with the earliest free slot, replaces one slot call per doctor
+@router.get("/earliest-available", response_model=EarliestAvailableDoctorsResponse)
+async def get_earliest_available(
+    speciality: Optional[str] = None,
+    city: Optional[str] = None,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    limit: int = Query(default=10, ge=1, le=100),
+    sort_by: EarliestSlotSort = EarliestSlotSort.EARLIEST,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_write_db),
+    current_user: CurrentUser = Depends(role_required(
+        allowed_user_roles=[UserRole.PATIENT, UserRole.ADMIN]
+    ))
+):
+    return await get_earliest_available_doctors(
+        db=db,
+        speciality=speciality,
+        city=city,
+        from_date=from_date,
+        to_date=to_date,
+        limit=limit,
+        sort_by=sort_by,
+        cursor=cursor
+    )
 
 
 @router.post("/create-appointment/{doctor_id}")
+@query_budget(8)
 async def create_appointment(
     doctor_id: int, 
     appointment_data: CreateAppointment, 
-    db: Session = Depends(get_db),
-    current_user: UserDB = Depends(role_required(
+    db: AsyncSession = Depends(get_write_db),
+    current_user: CurrentUser = Depends(role_required(
         allowed_user_roles=[UserRole.PATIENT]
     ))
 ):
-    return create_doctor_appointment(
+    return await create_doctor_appointment(
         db=db, 
         doctor_id=doctor_id, 
         appointment_data=appointment_data, 
-        user_id=current_user.id
+        user_id=current_user.id,
+        patient_id=current_user.patient_id
+    )
+
+# Clinics booking many appointments on behalf of patients
+@router.post("/bulk-create-appointments", response_model=BulkCreateAppointmentsResponse)
+async def bulk_create_appointment(
+    bulk_appointments: BulkCreateAppointments,
+    db: AsyncSession = Depends(get_write_db),
+    current_user: CurrentUser = Depends(role_required(
+        allowed_user_roles=[UserRole.DOCTOR, UserRole.ADMIN]
+    ))
+):
+    return await bulk_create_appointments(
+        db=db,
+        appointment_items=bulk_appointments.appointments,
+        user_id=current_user.id,
+        user_role=current_user.user_role
+    )
+
+
+@router.patch("/cancel-appointment/{appointment_id}")
+async def cancel_appointment(
+    appointment_id: int,
+    db: AsyncSession = Depends(get_write_db),
+    current_user: CurrentUser = Depends(role_required(
+        allowed_user_roles=[UserRole.PATIENT]
+    ))
+):
+    return await cancel_patient_appointment(
+        db=db,
+        appointment_id=appointment_id,
+        user_id=current_user.id,
+        patient_id=current_user.patient_id
     )
 
 # create api for get patient appointment
-@router.get("/all-patient-appointment", response_model=List[PatientAppointmentResponse])
+@router.get("/all-patient-appointment", response_model=PatientAppointmentPage)
 async def get_patient_appointments(
-    db: Session = Depends(get_db),
-    current_user: UserDB = Depends(role_required(
+    appointment_status: Optional[AppointmentStatus] = None,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    db: AsyncSession = Depends(get_write_db),
+    current_user: CurrentUser = Depends(role_required(
         allowed_user_roles=[UserRole.PATIENT]
     )),
 ):
-    return get_all_patient_appointments( db=db, user_id=current_user.id) 
+    return await get_all_patient_appointments(
+        db=db,
+        user_id=current_user.id,
+        appointment_status=appointment_status,
+        from_date=from_date,
+        to_date=to_date,
+        cursor=cursor,
+        limit=limit,
+        patient_id=current_user.patient_id
+    )
 
 
 # API endpoint for doctor to get all appointments
-@router.get("/doctor-appointments", response_model=List[PatientAppointmentResponse])
+@router.get("/doctor-appointments", response_model=PatientAppointmentPage)
 async def get_doctor_appointments(
-    db: Session = Depends(get_db),
-    current_user: UserDB = Depends(role_required(
+    appointment_status: Optional[AppointmentStatus] = None,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    db: AsyncSession = Depends(get_write_db),
+    current_user: CurrentUser = Depends(role_required(
         allowed_user_roles=[UserRole.DOCTOR]
     )),
 ):
-    return get_all_doctor_appointments(db=db, user_id=current_user.id)
\ No newline at end of file
+    return await get_all_doctor_appointments(
+        db=db,
+        user_id=current_user.id,
+        appointment_status=appointment_status,
+        from_date=from_date,
+        to_date=to_date,
+        cursor=cursor,
+        limit=limit,
+        doctor_id=current_user.doctor_id
+    )
+
+
+# Back office export of a doctor's or clinic's full appointment history
+@router.get("/export")
+async def export_appointment_history(
+    export_format: AppointmentExportFormat = AppointmentExportFormat.NDJSON,
+    doctor_id: Optional[int] = None,
+    clinic_id: Optional[int] = None,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_write_db),
+    current_user: CurrentUser = Depends(role_required(
+        allowed_user_roles=[UserRole.DOCTOR, UserRole.ADMIN]
+    ))
+):
+    lines = await export_appointments(
+        db=db,
+        user_id=current_user.id,
+        user_role=current_user.user_role,
+        export_format=export_format,
+        doctor_id=doctor_id,
+        clinic_id=clinic_id,
+        from_date=from_date,
+        to_date=to_date,
+        user_doctor_id=current_user.doctor_id
+    )
+
+    if export_format == AppointmentExportFormat.CSV:
+        media_type = "text/csv"
+    else:
+        media_type = "application/x-ndjson"
+
+    return StreamingResponse(
+        lines,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=appointments.{export_format.value}"}
+    )
@@ -1,40 +1,59 @@
-from datetime import datetime, timedelta
-from typing import List
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import List, Optional
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session, joinedload, selectinload
-from appointment.models import Appointment
-from appointment.schemas import CreateAppointment
+from sqlalchemy import Integer, and_, bindparam, case, column, func, insert, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from appointment.models import Appointment, AppointmentStatus, DoctorSlot
+from appointment import slot_cache, slot_calendar
+from appointment import slot_engine
+from appointment.slot_engine import decode_mask, to_minutes
+from appointment.schemas import AppointmentExportFormat, BulkAppointmentItem, BulkItemStatus, CreateAppointment, EarliestSlotSort
+from core.pagination import decode_cursor, encode_cursor
+from db.session import AsyncSessionLocal
 from doctor.models import Doctor, DoctorAvailability, DoctorClinics
 from patient.models import Patient
-from user.models import User
+from user.models import Address, User, UserRole
 
 
 
-def filter_booked_slots(db: Session, doctor_id: int, generated_slots: List):
-    filtered_slots = []
+async def filter_booked_slots(db: AsyncSession, doctor_id: int, generated_slots: List, slot_duration_minutes=30):
+    if not generated_slots:
+        return []
 
-    for day_slot in generated_slots:
-        date_obj = datetime.strptime(day_slot["date"], "%y-%m-%d").date()
-        booked_appointments = db.query(Appointment).filter(
-            Appointment.doctor_id == doctor_id,
-            Appointment.date == date_obj
-        ).all()
+    # Load every appointment of the horizon in one range query instead of one query per day
+    booked_masks = await db.run_sync(
+        slot_calendar.booked_masks_by_date,
+        doctor_id=doctor_id,
+        start_date=generated_slots[0]["date"],
+        end_date=generated_slots[-1]["date"]
+    )
 
-        booked_time_ranges = [
-            f"{appt.start_time.strftime('%H:%M')}-{appt.end_time.strftime('%H:%M')}"
-            for appt in booked_appointments
-        ]
+    now = datetime.now()
+    filtered_slots = []
 
-        # Remove booked slots from the day's time slots
-        available_time_slots = [
-            slot for slot in day_slot["time_slot"]
-            if slot not in booked_time_ranges
-        ]
+    for day_slot in generated_slots:
+        not_before = to_minutes(now.time()) if day_slot["date"] == now.date() else 0
+
+        # Mask the booked minutes out of the day and cut the rest into free slots
+        available_time_slots = slot_engine.available_time_slots(
+            day_slot["open_mask"],
+            booked_masks.get(day_slot["date"], 0),
+            slot_duration_minutes,
+            not_before
+        )
 
         if available_time_slots:
             filtered_slots.append({
                 "doctor_id": doctor_id,
-                "date": day_slot["date"],
+                "date": day_slot["date"].strftime("%y-%m-%d"),
                 "day": day_slot["day"],
                 "time_slot": available_time_slots
             })
@@ -45,170 +64,480 @@ def filter_booked_slots(db: Session, doctor_id: int, generated_slots: List):
 def generate_slots_for_next_30_days(
     doctor_id: int, 
     doctor_availability: List[DoctorAvailability], 
-    slot_duration_minutes=30,
+    horizon_days=30,
+    start_date: Optional[date] = None,
+):
+    """Open-minute bitmap of every day of the window, slots are cut from it in filter_booked_slots"""
+    start_date = start_date or datetime.today().date()
+
+    weekly_masks = slot_engine.weekly_open_masks(
+        availability for availability in doctor_availability
+        if availability.doctor_id == doctor_id # type: ignore
+    )
+
+    return [
+        {
+            "doctor_id": doctor_id,
+            "date": current_date,
+            "day": day_name,
+            "open_mask": open_mask
+        }
+        for current_date, day_name, open_mask in slot_engine.day_open_masks(weekly_masks, start_date, horizon_days)
+    ]
+
+
+async def get_doctor_all_slot(
+    db: AsyncSession, 
+    doctor_id: int, 
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    clinic_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit_days: Optional[int] = None,
+    slot_duration_minutes: int = slot_calendar.SLOT_DURATION_MINUTES
 ):
     today = datetime.today().date()
-    slots = []
-
-    for i in range(30):
-        current_date = today + timedelta(days=i)
-        day_name = current_date.strftime("%A").lower()  # e.g., 'Monday'
-        print(f"Checking slots for date: {current_date} ({day_name})")
-
-        for availability in doctor_availability:
-            print(f"  Availability: doctor_id={availability.doctor_id}, day={availability.days_of_week.value}, is_available={availability.is_available}")
-
-            if (
-                availability.doctor_id == doctor_id and
-                availability.days_of_week.value == day_name and
-                availability.is_available
-            ): # type: ignore 
-                start_time = datetime.combine(current_date, availability.start_time) # type: ignore
-                end_time = datetime.combine(current_date, availability.end_time) # type: ignore
-                
-
-                current_time = start_time
-                time_slots = []
-                while start_time < end_time:
-
-                    if current_date == today and start_time < datetime.now():
-                        print(f"Skipping past slot: {current_time}")
-                        current_time += timedelta(minutes=slot_duration_minutes)
-                        start_time += timedelta(minutes=slot_duration_minutes)
-                        continue
-
-                    slot_start = start_time.strftime("%H:%M")
-                    slot_end = (start_time + timedelta(minutes=slot_duration_minutes)).strftime("%H:%M")
-                    time_slots.append(f"{slot_start}-{slot_end}")
-                    start_time += timedelta(minutes=slot_duration_minutes)
-
-                # Append formatted result
-                slots.append({
-                    "doctor_id": doctor_id,
-                    "date": current_date.strftime("%y-%m-%d"),
-                    "day": day_name,
-                    "time_slot": time_slots
-                })
-
-    print(f"Total slots generated: {len(slots)}")
-    return slots
-
-
-def get_doctor_all_slot(db: Session, doctor_id: int):
-    doctor_availability = db.query(DoctorAvailability).filter(DoctorAvailability.doctor_id == doctor_id).all()
+
+    start_date = max(from_date or today, today)
+    end_date = to_date or today + timedelta(days=slot_calendar.SLOT_HORIZON_DAYS - 1)
+
+    # The cursor carries the first day of the next page
+    if cursor:
+        (cursor_date,) = decode_cursor(cursor, size=1)
+        try:
+            start_date = max(start_date, date.fromisoformat(cursor_date))
+        except (TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid pagination cursor"
+            )
+
+    if end_date < start_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="to_date must not be before from_date"
+        )
+
+    if (end_date - start_date).days >= slot_calendar.SLOT_MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Slot range can not exceed {slot_calendar.SLOT_MAX_RANGE_DAYS} days"
+        )
+
+    page_end_date = end_date
+    if limit_days:
+        page_end_date = min(end_date, start_date + timedelta(days=limit_days - 1))
+    days = (page_end_date - start_date).days + 1
+
+    available_slots = slot_cache.get_cached_slots(doctor_id, start_date, days, slot_duration_minutes, clinic_id)
+    if available_slots is None:
+        available_slots = await _load_doctor_slots(db, doctor_id, start_date, days, slot_duration_minutes, clinic_id)
+        # A lagging replica could put back the slots a booking just invalidated, only primary reads fill the cache
+        if not db.info.get("replica"):
+            slot_cache.cache_slots(doctor_id, start_date, days, slot_duration_minutes, clinic_id, available_slots)
+
+    next_cursor = None
+    if page_end_date < end_date:
+        next_cursor = encode_cursor([page_end_date + timedelta(days=1)])
+
+    return {"slots": available_slots, "next_cursor": next_cursor}
+
+
+async def _load_doctor_slots(
+    db: AsyncSession, 
+    doctor_id: int, 
+    start_date: date, 
+    days: int, 
+    slot_duration_minutes: int, 
+    clinic_id: Optional[int] = None
+):
+    horizon_end_date = datetime.today().date() + timedelta(days=slot_calendar.SLOT_HORIZON_DAYS - 1)
+
+    # Windows reaching past the materialized horizon are generated live
+    use_calendar = (
+        slot_calendar.SLOT_READ_MODEL == "calendar" and
+        start_date + timedelta(days=days - 1) <= horizon_end_date
+    )
+
+    if use_calendar:
+        calendar_slots = await db.run_sync(
+            slot_calendar.get_calendar_slots,
+            doctor_id=doctor_id,
+            start_date=start_date,
+            days=days,
+            slot_duration_minutes=slot_duration_minutes,
+            clinic_id=clinic_id
+        )
+        if calendar_slots is not None:
+            return calendar_slots
+
+    availability_query = select(DoctorAvailability).filter(DoctorAvailability.doctor_id == doctor_id)
+    if clinic_id is not None:
+        availability_query = availability_query.filter(DoctorAvailability.clinic_id == clinic_id)
+    doctor_availability = (await db.scalars(availability_query)).all()
 
     if not doctor_availability:
-        print("logging doctor availability")
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No doctor availability found for this doctor id {doctor_id}"
         )
-    
-    slot_duration_minutes=30
+
+    # Days missing from the calendar are generated live, reads never write. The calendar is
+    # filled by doctor onboarding and by the nightly roll (python -m appointment.slot_calendar)
     slots = generate_slots_for_next_30_days(
         doctor_id=doctor_id, 
-        doctor_availability=doctor_availability, slot_duration_minutes=slot_duration_minutes 
+        doctor_availability=doctor_availability, 
+        horizon_days=days,
+        start_date=start_date
     )
     
-    available_slots = filter_booked_slots(db=db, doctor_id=doctor_id, generated_slots=slots)
-    return {"slots": available_slots}
+    return await filter_booked_slots(
+        db=db, 
+        doctor_id=doctor_id, 
+        generated_slots=slots, 
+        slot_duration_minutes=slot_duration_minutes
+    )
 
 
-def create_doctor_appointment(
-    db: Session, 
-    doctor_id: int, 
-    appointment_data: CreateAppointment, 
-    user_id: int
-):
-    
-    doctor = db.query(Doctor).options(joinedload(Doctor.clinics)).filter(Doctor.id == doctor_id).first()
+# Constraints that turn a racing booking into a 409 at insert time
+BOOKING_CONFLICTS = {
+    "ex_appointments_doctor_time_overlap": "This time slot overlaps with an existing appointment",
+    "uq_appointments_patient_doctor_date": "You already have an appointment with this doctor on {date}",
+}
 
-    if not doctor:
+
+def _booking_conflict_detail(error: IntegrityError, appointment_date: date) -> Optional[str]:
+    diag = getattr(error.orig, "diag", None)
+    constraint_name = getattr(diag, "constraint_name", None)
+    message = constraint_name or str(error.orig)
+
+    for name, detail in BOOKING_CONFLICTS.items():
+        if name in message:
+            return detail.format(date=appointment_date)
+
+    # SQLite reports the columns of the unique index instead of its name
+    if "appointments.patient_id" in message:
+        return BOOKING_CONFLICTS["uq_appointments_patient_doctor_date"].format(date=appointment_date)
+    return None
+
+
+async def _lock_doctors_for_booking(db: AsyncSession, doctor_ids):
+    """Off Postgres, hold the write lock of these doctors from the overlap check to the commit.
+
+    Postgres rejects overlaps through the exclusion constraint. Elsewhere a no-op update of the
+    doctor rows takes their write lock, on SQLite the whole database, so a racing booking waits
+    for this transaction and its overlap check then sees the new appointment.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return
+
+    await db.execute(
+        text("UPDATE doctors SET id = id WHERE id IN :doctor_ids").bindparams(bindparam("doctor_ids", expanding=True)),
+        {"doctor_ids": sorted(set(doctor_ids))}
+    )
+
+
+async def _patient_id_for_user(db: AsyncSession, user_id: int, patient_id: Optional[int] = None) -> int:
+    """Use the patient id carried by the authenticated identity, look it up for older tokens"""
+    if patient_id is not None:
+        return patient_id
+
+    patient_id = await db.scalar(select(Patient.id).filter(Patient.user_id == user_id))
+
+    if patient_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"No doctor found for this doctor id {doctor_id}"
+            detail=f"No Patient found for this user id {user_id}"
         )
-    
-    user = db.query(User).filter(User.id == user_id).first()
+    return patient_id
 
-    if not user:
+
+async def _doctor_id_for_user(db: AsyncSession, user_id: int, doctor_id: Optional[int] = None) -> int:
+    """Use the doctor id carried by the authenticated identity, look it up for older tokens"""
+    if doctor_id is not None:
+        return doctor_id
+
+    doctor_id = await db.scalar(select(Doctor.id).filter(Doctor.user_id == user_id))
+
+    if doctor_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"No user found for this user id {user_id}"
+            detail=f"No Doctor found for this user id {user_id}"
         )
+    return doctor_id
 
-    patient = db.query(Patient).filter(Patient.user_id == user_id).first()
 
-    if not patient:
+async def create_doctor_appointment(
+    db: AsyncSession, 
+    doctor_id: int, 
+    appointment_data: CreateAppointment, 
+    user_id: int,
+    patient_id: Optional[int] = None
+):
+    if appointment_data.end_time <= appointment_data.start_time:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"No Patient found for this user id {user_id}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="end_time must be after start_time"
         )
     
-    
-     
-    # Complete time overlap check with all edge cases
-    overlapping_appointments = db.query(Appointment).filter(
-        Appointment.doctor_id == doctor_id,
-        Appointment.date == appointment_data.date,
-        # Time overlap logic - covers all possible overlap scenarios:
-        (
-            # Case 1: New appointment starts during existing appointment
-            ((Appointment.start_time <= appointment_data.start_time) & (Appointment.end_time > appointment_data.start_time)) |
-            # Case 2: New appointment ends during existing appointment  
-            ((Appointment.start_time < appointment_data.end_time) & (Appointment.end_time >= appointment_data.end_time)) |
-            # Case 3: New appointment is completely inside existing appointment
-            ((Appointment.start_time >= appointment_data.start_time) & (Appointment.end_time <= appointment_data.end_time)) |
-            # Case 4: New appointment completely encompasses existing appointment (MISSING CASE)
-            ((Appointment.start_time >= appointment_data.start_time) & (Appointment.start_time < appointment_data.end_time))
-        )
-    ).all()
-    
-    if overlapping_appointments:
+    doctor = await db.scalar(select(Doctor).options(selectinload(Doctor.clinics)).filter(Doctor.id == doctor_id))
+
+    if not doctor:
         raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f"This time slot overlaps with an existing appointment"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No doctor found for this doctor id {doctor_id}"
         )
+
+    patient_id = await _patient_id_for_user(db, user_id, patient_id)
+
+    # Postgres rejects overlaps through the exclusion constraint, other databases check under the doctor's lock
+    await _lock_doctors_for_booking(db, [doctor_id])
+    if db.get_bind().dialect.name != "postgresql":
+        overlapping_appointment = await db.scalar(select(Appointment.id).filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.date == appointment_data.date,
+            Appointment.appointment_status != AppointmentStatus.CANCELLED,
+            Appointment.start_time < appointment_data.end_time,
+            Appointment.end_time > appointment_data.start_time
+        ))
+
+        if overlapping_appointment:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=BOOKING_CONFLICTS["ex_appointments_doctor_time_overlap"]
+            )
     
-    # Optional: Check if patient already has an appointment with this doctor on the same day
-    existing_patient_appointment = db.query(Appointment).filter(
-        Appointment.patient_id == patient.id,
-        Appointment.doctor_id == doctor_id,
-        Appointment.date == appointment_data.date
-    ).first()
-    
-    if existing_patient_appointment:
+    appointment_dict = appointment_data.model_dump()
+
+    appointment_obj = Appointment(**appointment_dict, doctor_id=doctor_id, patient_id=patient_id, clinic_id=doctor.clinics[0].id, fees=doctor.consultation_fee)
+
+    db.add(appointment_obj)
+
+    try:
+        # The insert itself is the conflict check, a racing booking waits on it and then fails
+        await db.flush()
+    except IntegrityError as e:
+        await db.rollback()
+        conflict_detail = _booking_conflict_detail(e, appointment_data.date)
+        if conflict_detail is None:
+            raise
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
-            detail=f"You already have an appointment with this doctor on {appointment_data.date}"
+            detail=conflict_detail
         )
-    
-    
-    appointment_dict = appointment_data.model_dump()
 
-    appointment_obj = Appointment(**appointment_dict, doctor_id=doctor_id, patient_id=patient.id, clinic_id=doctor.clinics[0].id, fees=doctor.consultation_fee)
+    # Keep the slot calendar in step with the booking inside the same transaction
+    await db.run_sync(
+        slot_calendar.mark_slot_booked,
+        doctor_id=doctor_id,
+        slot_date=appointment_data.date,
+        start_time=appointment_data.start_time,
+        end_time=appointment_data.end_time
+    )
+    await slot_cache.invalidate_doctor_slots(db, doctor_id, appointment_data.date)
 
-  
-    db.add(appointment_obj)
-    db.commit()
-    db.refresh(appointment_obj)
+    await db.commit()
+    await db.refresh(appointment_obj)
     
     return appointment_obj
 
-    
-# create get all patient appointments
-def get_all_patient_appointments(db: Session, user_id: int):
-    patient = db.query(Patient).filter(Patient.user_id == user_id).first()
 
-    if not patient:
+async def bulk_create_appointments(
+    db: AsyncSession,
+    appointment_items: List[BulkAppointmentItem],
+    user_id: int,
+    user_role: UserRole
+):
+    results = {}
+
+    def reject(index: int, item_status: BulkItemStatus, detail: str):
+        results[index] = {"index": index, "status": item_status, "detail": detail}
+
+    doctor_ids = {item.doctor_id for item in appointment_items}
+    patient_ids = {item.patient_id for item in appointment_items}
+
+    # Off Postgres the checks below are only race free under the doctors' locks
+    await _lock_doctors_for_booking(db, doctor_ids)
+
+    doctors = {
+        doctor.id: doctor
+        for doctor in await db.scalars(select(Doctor).options(selectinload(Doctor.clinics)).filter(Doctor.id.in_(doctor_ids)))
+    }
+    existing_patient_ids = {
+        patient_id for (patient_id,) in await db.execute(select(Patient.id).filter(Patient.id.in_(patient_ids)))
+    }
+
+    # Every active appointment on the requested doctor days, fetched in one set-based query
+    doctor_days = list({(item.doctor_id, item.date) for item in appointment_items})
+    booked = defaultdict(list)
+    booked_patient_days = set()
+    for appt_doctor_id, appt_patient_id, appt_date, appt_start, appt_end in await db.execute(
+        select(
+            Appointment.doctor_id,
+            Appointment.patient_id,
+            Appointment.date,
+            Appointment.start_time,
+            Appointment.end_time
+        )
+        .filter(
+            tuple_(Appointment.doctor_id, Appointment.date).in_(doctor_days),
+            Appointment.appointment_status != AppointmentStatus.CANCELLED
+        )
+    ):
+        booked[(appt_doctor_id, appt_date)].append((appt_start, appt_end))
+        booked_patient_days.add((appt_patient_id, appt_doctor_id, appt_date))
+
+    accepted = []
+    for index, item in enumerate(appointment_items):
+        doctor = doctors.get(item.doctor_id)
+
+        if item.end_time <= item.start_time:
+            reject(index, BulkItemStatus.INVALID, "end_time must be after start_time")
+        elif not doctor or not doctor.clinics:
+            reject(index, BulkItemStatus.INVALID, f"No doctor found for this doctor id {item.doctor_id}")
+        elif user_role == UserRole.DOCTOR and doctor.user_id != user_id: # type: ignore
+            reject(index, BulkItemStatus.INVALID, f"Doctor {item.doctor_id} can only be booked by its own doctor")
+        elif item.patient_id not in existing_patient_ids:
+            reject(index, BulkItemStatus.INVALID, f"No Patient found for this patient id {item.patient_id}")
+        elif any(
+            booked_start < item.end_time and item.start_time < booked_end
+            for booked_start, booked_end in booked[(item.doctor_id, item.date)]
+        ):
+            reject(index, BulkItemStatus.CONFLICT, BOOKING_CONFLICTS["ex_appointments_doctor_time_overlap"])
+        elif (item.patient_id, item.doctor_id, item.date) in booked_patient_days:
+            reject(index, BulkItemStatus.CONFLICT, BOOKING_CONFLICTS["uq_appointments_patient_doctor_date"].format(date=item.date))
+        else:
+            # Later items of the same batch conflict with the accepted ones too
+            booked[(item.doctor_id, item.date)].append((item.start_time, item.end_time))
+            booked_patient_days.add((item.patient_id, item.doctor_id, item.date))
+            accepted.append((index, item, doctor))
+
+    created_ids = {}
+    if accepted:
+        rows = [
+            {
+                "patient_id": item.patient_id,
+                "doctor_id": item.doctor_id,
+                "clinic_id": doctor.clinics[0].id,
+                "date": item.date,
+                "start_time": item.start_time,
+                "end_time": item.end_time,
+                "reason_for_visit": item.reason_for_visit,
+                "fees": doctor.consultation_fee
+            }
+            for _, item, doctor in accepted
+        ]
+
+        returned_columns = (Appointment.id, Appointment.doctor_id, Appointment.date, Appointment.start_time)
+
+        # One multi-row INSERT, rows lost to a racing booking are skipped by Postgres
+        if db.get_bind().dialect.name == "postgresql":
+            inserted = (await db.execute(
+                pg_insert(Appointment).values(rows).on_conflict_do_nothing().returning(*returned_columns)
+            )).all()
+        else:
+            inserted = await _insert_skipping_conflicts(db, rows, returned_columns)
+        created_ids = {(row.doctor_id, row.date, row.start_time): row.id for row in inserted}
+
+    created_bookings = []
+    for index, item, _ in accepted:
+        appointment_id = created_ids.get((item.doctor_id, item.date, item.start_time))
+        if appointment_id is None:
+            reject(index, BulkItemStatus.CONFLICT, BOOKING_CONFLICTS["ex_appointments_doctor_time_overlap"])
+            continue
+        results[index] = {"index": index, "status": BulkItemStatus.CREATED, "appointment_id": appointment_id}
+        created_bookings.append((item.doctor_id, item.date, item.start_time, item.end_time))
+
+    await db.run_sync(slot_calendar.mark_slots_booked, created_bookings)
+    await slot_cache.invalidate_doctor_days(db, {(booking[0], booking[1]) for booking in created_bookings})
+    await db.commit()
+
+    ordered_results = [results[index] for index in range(len(appointment_items))]
+    return {
+        "created": sum(result["status"] == BulkItemStatus.CREATED for result in ordered_results),
+        "conflicts": sum(result["status"] == BulkItemStatus.CONFLICT for result in ordered_results),
+        "invalid": sum(result["status"] == BulkItemStatus.INVALID for result in ordered_results),
+        "results": ordered_results
+    }
+
+
+async def _insert_skipping_conflicts(db: AsyncSession, rows: List[dict], returned_columns):
+    """Multi-row INSERT without ON CONFLICT, a failing batch is retried row by row and the conflicting rows are left out"""
+    try:
+        async with db.begin_nested():
+            return (await db.execute(insert(Appointment).values(rows).returning(*returned_columns))).all()
+    except IntegrityError:
+        pass
+
+    inserted = []
+    for row in rows:
+        try:
+            async with db.begin_nested():
+                inserted.extend((await db.execute(insert(Appointment).values(row).returning(*returned_columns))).all())
+        except IntegrityError:
+            continue
+    return inserted
+
+
+async def cancel_patient_appointment(db: AsyncSession, appointment_id: int, user_id: int, patient_id: Optional[int] = None):
+    query = select(Appointment).filter(Appointment.id == appointment_id)
+    if patient_id is not None:
+        query = query.filter(Appointment.patient_id == patient_id)
+    else:
+        query = query.join(Patient, Patient.id == Appointment.patient_id).filter(Patient.user_id == user_id)
+
+    appointment = await db.scalar(query)
+
+    if not appointment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"No Patient found for this user id {user_id}"
+            detail=f"No appointment found for this appointment id {appointment_id}"
         )
+
+    if appointment.appointment_status != AppointmentStatus.SCHEDULED: # type: ignore
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Only scheduled appointments can be cancelled"
+        )
+
+    appointment.appointment_status = AppointmentStatus.CANCELLED # type: ignore
+    await db.flush()
+
+    # Free the slot in the calendar inside the same transaction
+    await db.run_sync(
+        slot_calendar.refresh_booked_mask,
+        doctor_id=appointment.doctor_id, # type: ignore
+        slot_date=appointment.date # type: ignore
+    )
+    await slot_cache.invalidate_doctor_slots(db, appointment.doctor_id, appointment.date) # type: ignore
+
+    await db.commit()
+    await db.refresh(appointment)
+
+    return {"id": appointment.id, "appointment_status": appointment.appointment_status}
+
     
-    patient_appointments = (
-        db.query(Appointment)
-        .filter(Appointment.patient_id == patient.id)
+async def _appointment_page(
+    db: AsyncSession,
+    owner_filter,
+    appointment_status: Optional[AppointmentStatus] = None,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = 20
+):
+    """One keyset page of appointments ordered by (date, start_time, id)"""
+    if from_date and to_date and to_date < from_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="to_date must not be before from_date"
+        )
+
+    sort_columns = (Appointment.date, Appointment.start_time, Appointment.id)
+
+    query = (
+        select(Appointment)
+        .filter(owner_filter)
         .options(
             joinedload(Appointment.patient)
                 .joinedload(Patient.user),
@@ -217,47 +546,372 @@ def get_all_patient_appointments(db: Session, user_id: int):
             selectinload(Appointment.clinic)
                 .joinedload(DoctorClinics.address)
         )
-        .all()
     )
+    if appointment_status is not None:
+        query = query.filter(Appointment.appointment_status == appointment_status)
+    if from_date:
+        query = query.filter(Appointment.date >= from_date)
+    if to_date:
+        query = query.filter(Appointment.date <= to_date)
+
+    if cursor:
+        cursor_date, cursor_start, cursor_id = decode_cursor(cursor, size=3)
+        try:
+            cursor_values = (date.fromisoformat(cursor_date), time.fromisoformat(cursor_start), int(cursor_id))
+        except (TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid pagination cursor"
+            )
+        query = query.filter(tuple_(*sort_columns) > tuple_(*cursor_values))
+
+    appointments = (await db.scalars(query.order_by(*sort_columns).limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(appointments) > limit:
+        appointments = appointments[:limit]
+        last_appointment = appointments[-1]
+        next_cursor = encode_cursor([last_appointment.date, last_appointment.start_time, last_appointment.id])
+
+    return {"items": appointments, "next_cursor": next_cursor}
 
-    if not patient_appointments:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"No Patient Appointments found for this patient id {user_id}"
-        )
+
+# create get all patient appointments
+async def get_all_patient_appointments(
+    db: AsyncSession,
+    user_id: int,
+    appointment_status: Optional[AppointmentStatus] = None,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    patient_id: Optional[int] = None
+):
+    patient_id = await _patient_id_for_user(db, user_id, patient_id)
     
-    return patient_appointments
+    return await _appointment_page(
+        db=db,
+        owner_filter=Appointment.patient_id == patient_id,
+        appointment_status=appointment_status,
+        from_date=from_date,
+        to_date=to_date,
+        cursor=cursor,
+        limit=limit
+    )
 
 
-def get_all_doctor_appointments(db: Session, user_id: int):
+async def get_all_doctor_appointments(
+    db: AsyncSession,
+    user_id: int,
+    appointment_status: Optional[AppointmentStatus] = None,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    doctor_id: Optional[int] = None
+):
     # Find the doctor associated with this user
-    doctor = db.query(Doctor).filter(Doctor.user_id == user_id).first()
+    doctor_id = await _doctor_id_for_user(db, user_id, doctor_id)
+    
+    return await _appointment_page(
+        db=db,
+        owner_filter=Appointment.doctor_id == doctor_id,
+        appointment_status=appointment_status,
+        from_date=from_date,
+        to_date=to_date,
+        cursor=cursor,
+        limit=limit
+    )
 
-    if not doctor:
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = [
+    Appointment.id.label("appointment_id"),
+    Appointment.date,
+    Appointment.start_time,
+    Appointment.end_time,
+    Appointment.appointment_status,
+    Appointment.payment_status,
+    Appointment.fees,
+    Appointment.doctor_id,
+    Appointment.clinic_id,
+    DoctorClinics.clinic_name,
+    Appointment.patient_id,
+    User.first_name.label("patient_first_name"),
+    User.last_name.label("patient_last_name"),
+    Appointment.reason_for_visit,
+]
+
+
+async def _export_rows(statement):
+    # The request session is closed before the response body is sent, the stream owns its own
+    async with AsyncSessionLocal() as db:
+        # yield_per streams through a server side cursor, only one batch is held in memory
+        result = await db.stream(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for row in result:
+            row = row._asdict()
+            row["appointment_status"] = row["appointment_status"].value
+            row["payment_status"] = row["payment_status"].value
+            yield row
+
+
+async def _ndjson_lines(rows):
+    async for row in rows:
+        yield json.dumps(row, default=str) + "\n"
+
+
+async def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.key for column in EXPORT_COLUMNS])
+
+    count = 0
+    async for row in rows:
+        count += 1
+        writer.writerow(row.values())
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+async def export_appointments(
+    db: AsyncSession,
+    user_id: int,
+    user_role: UserRole,
+    export_format: AppointmentExportFormat,
+    doctor_id: Optional[int] = None,
+    clinic_id: Optional[int] = None,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    user_doctor_id: Optional[int] = None
+):
+    """Validate the export scope and return an async generator streaming the matching appointments"""
+    if from_date and to_date and to_date < from_date:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"No Doctor found for this user id {user_id}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="to_date must not be before from_date"
         )
-    
-    # Query all appointments for this doctor
-    doctor_appointments = (
-        db.query(Appointment)
-        .filter(Appointment.doctor_id == doctor.id)
-        .options(
-            joinedload(Appointment.patient)
-                .joinedload(Patient.user),
-            joinedload(Appointment.doctor)
-                .joinedload(Doctor.user),
-            selectinload(Appointment.clinic)
-                .joinedload(DoctorClinics.address)
+
+    if user_role == UserRole.DOCTOR:
+        own_doctor_id = await _doctor_id_for_user(db, user_id, user_doctor_id)
+        if doctor_id is not None and doctor_id != own_doctor_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Doctors can only export their own appointments"
+            )
+        doctor_id = own_doctor_id
+    elif doctor_id is None and clinic_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Either doctor_id or clinic_id is required"
         )
-        .all()
+
+    if clinic_id is not None:
+        clinic = await db.scalar(select(DoctorClinics).filter(DoctorClinics.id == clinic_id))
+        if not clinic or (doctor_id is not None and clinic.doctor_id != doctor_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No clinic found for this clinic id {clinic_id}"
+            )
+
+    statement = (
+        select(*EXPORT_COLUMNS)
+        .join(DoctorClinics, DoctorClinics.id == Appointment.clinic_id)
+        .join(Patient, Patient.id == Appointment.patient_id)
+        .join(User, User.id == Patient.user_id)
     )
+    if doctor_id is not None:
+        statement = statement.where(Appointment.doctor_id == doctor_id)
+    if clinic_id is not None:
+        statement = statement.where(Appointment.clinic_id == clinic_id)
+    if from_date:
+        statement = statement.where(Appointment.date >= from_date)
+    if to_date:
+        statement = statement.where(Appointment.date <= to_date)
+    statement = statement.order_by(Appointment.date, Appointment.start_time, Appointment.id)
+
+    rows = _export_rows(statement)
+    if export_format == AppointmentExportFormat.CSV:
+        return _csv_lines(rows)
+    return _ndjson_lines(rows)
+
+
+def _later_today_slots(dialect_name: str, later_today: List[dict]):
+    """(doctor_id, clinic_id, first_free_minute) rows as a subquery, sent as one json parameter"""
+    if dialect_name == "postgresql":
+        statement = text(
+            "SELECT * FROM jsonb_to_recordset(CAST(:later_today AS jsonb)) "
+            "AS later_today(doctor_id integer, clinic_id integer, first_free_minute integer)"
+        )
+    else:
+        statement = text(
+            "SELECT json_extract(value, '$.doctor_id') AS doctor_id, "
+            "json_extract(value, '$.clinic_id') AS clinic_id, "
+            "json_extract(value, '$.first_free_minute') AS first_free_minute "
+            "FROM json_each(:later_today)"
+        )
+
+    return (
+        statement.bindparams(later_today=json.dumps(later_today))
+        .columns(column("doctor_id", Integer), column("clinic_id", Integer), column("first_free_minute", Integer))
+        .subquery("later_today")
+    )
+
+
+async def _later_today_first_free_minutes(db: AsyncSession, doctor_filters: List, today: date, now_minute: int):
+    """First free slot at or after now of today's rows whose whole-day first free slot already started"""
+    rows = await db.execute(
+        select(DoctorSlot.doctor_id, DoctorSlot.clinic_id, DoctorSlot.open_mask, DoctorSlot.booked_mask)
+        .join(Doctor, Doctor.id == DoctorSlot.doctor_id)
+        .join(DoctorClinics, DoctorClinics.id == DoctorSlot.clinic_id)
+        .join(Address, Address.id == DoctorClinics.address_id)
+        .filter(*doctor_filters, DoctorSlot.date == today, DoctorSlot.first_free_minute < now_minute)
+    )
+
+    later_today = []
+    for row in rows:
+        minute = slot_calendar.first_free_minute(decode_mask(row.open_mask), decode_mask(row.booked_mask), now_minute)
+        if minute is not None:
+            later_today.append({"doctor_id": row.doctor_id, "clinic_id": row.clinic_id, "first_free_minute": minute})
+    return later_today
+
+
+async def get_earliest_available_doctors(
+    db: AsyncSession,
+    speciality: Optional[str] = None,
+    city: Optional[str] = None,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    limit: int = 10,
+    sort_by: EarliestSlotSort = EarliestSlotSort.EARLIEST,
+    cursor: Optional[str] = None
+):
+    now = datetime.now()
+    today = now.date()
+
+    from_date = max(from_date or today, today)
+    to_date = to_date or from_date + timedelta(days=slot_calendar.SLOT_HORIZON_DAYS - 1)
 
-    if not doctor_appointments:
+    if to_date < from_date:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"No appointments found for this doctor id {user_id}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="to_date must not be before from_date"
         )
-    
-    return doctor_appointments
\ No newline at end of file
+
+    doctor_filters = [Doctor.is_verified == True]
+    if speciality:
+        doctor_filters.append(func.lower(Doctor.speciality) == speciality.lower())
+    if city:
+        doctor_filters.append(func.lower(Address.city) == city.lower())
+
+    first_free_minute = DoctorSlot.first_free_minute
+    later_today_slots = None
+
+    if from_date == today:
+        # first_free_minute covers the whole day, today's rows whose first free slot already
+        # started use their first free slot at or after now, cut from the masks
+        now_minute = to_minutes(now.time())
+        started_today = and_(DoctorSlot.date == today, DoctorSlot.first_free_minute < now_minute)
+        later_today_slots = _later_today_slots(
+            db.get_bind().dialect.name,
+            await _later_today_first_free_minutes(db, doctor_filters, today, now_minute)
+        )
+        first_free_minute = case((started_today, later_today_slots.c.first_free_minute), else_=DoctorSlot.first_free_minute)
+
+    # First free calendar day of every matching doctor, ranked in SQL
+    ranked_query = (
+        select(
+            DoctorSlot.doctor_id.label("doctor_id"),
+            DoctorSlot.clinic_id.label("clinic_id"),
+            DoctorSlot.date.label("date"),
+            first_free_minute.label("first_free_minute"),
+            func.row_number().over(
+                partition_by=DoctorSlot.doctor_id,
+                order_by=(DoctorSlot.date, first_free_minute, DoctorSlot.clinic_id)
+            ).label("slot_rank")
+        )
+        .join(Doctor, Doctor.id == DoctorSlot.doctor_id)
+        .join(DoctorClinics, DoctorClinics.id == DoctorSlot.clinic_id)
+        .join(Address, Address.id == DoctorClinics.address_id)
+    )
+    if later_today_slots is not None:
+        ranked_query = ranked_query.outerjoin(later_today_slots, and_(
+            started_today,
+            later_today_slots.c.doctor_id == DoctorSlot.doctor_id,
+            later_today_slots.c.clinic_id == DoctorSlot.clinic_id
+        ))
+
+    ranked_slots = ranked_query.filter(
+        *doctor_filters,
+        DoctorSlot.date >= from_date,
+        DoctorSlot.date <= to_date,
+        first_free_minute.isnot(None)
+    ).subquery()
+
+    sort_columns = [ranked_slots.c.date, ranked_slots.c.first_free_minute, ranked_slots.c.doctor_id]
+    if sort_by == EarliestSlotSort.FEE:
+        sort_columns.insert(0, Doctor.consultation_fee)
+
+    query = (
+        select(
+            ranked_slots.c.doctor_id,
+            ranked_slots.c.clinic_id,
+            ranked_slots.c.date,
+            ranked_slots.c.first_free_minute,
+            Doctor.speciality,
+            Doctor.experience,
+            Doctor.consultation_fee,
+            User.first_name,
+            User.last_name,
+            DoctorClinics.clinic_name,
+            Address.city
+        )
+        .join(Doctor, Doctor.id == ranked_slots.c.doctor_id)
+        .join(User, User.id == Doctor.user_id)
+        .join(DoctorClinics, DoctorClinics.id == ranked_slots.c.clinic_id)
+        .join(Address, Address.id == DoctorClinics.address_id)
+        .filter(ranked_slots.c.slot_rank == 1)
+    )
+
+    if cursor:
+        cursor_values = decode_cursor(cursor, size=len(sort_columns))
+        try:
+            cursor_values[-3:] = [date.fromisoformat(cursor_values[-3]), int(cursor_values[-2]), int(cursor_values[-1])]
+            if sort_by == EarliestSlotSort.FEE:
+                cursor_values[0] = Decimal(cursor_values[0])
+        except (IndexError, TypeError, ValueError, InvalidOperation):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid pagination cursor"
+            )
+        query = query.filter(tuple_(*sort_columns) > tuple_(*cursor_values))
+
+    rows = (await db.execute(query.order_by(*sort_columns).limit(limit + 1))).all()
+
+    results = []
+    for row in rows[:limit]:
+        results.append({
+            "doctor_id": row.doctor_id,
+            "doctor_name": row.first_name + " " + row.last_name,
+            "speciality": row.speciality,
+            "experience": row.experience,
+            "consultation_fee": row.consultation_fee,
+            "clinic_id": row.clinic_id,
+            "clinic_name": row.clinic_name,
+            "city": row.city,
+            "date": row.date,
+            "start_time": time(row.first_free_minute // 60, row.first_free_minute % 60)
+        })
+
+    next_cursor = None
+    if len(rows) > limit:
+        last_row = rows[limit - 1]
+        cursor_values = [last_row.date, last_row.first_free_minute, last_row.doctor_id]
+        if sort_by == EarliestSlotSort.FEE:
+            cursor_values.insert(0, last_row.consultation_fee)
+        next_cursor = encode_cursor(cursor_values)
+
+    return {"results": results, "next_cursor": next_cursor}
@@ -1,4 +1,5 @@
-from sqlalchemy import CheckConstraint, Column, ForeignKey, Integer, String, Float, Date, Time, Text, Enum
+from sqlalchemy import DDL, CheckConstraint, Column, ForeignKey, Index, Integer, LargeBinary, String, Float, Date, Time, Text, Enum, UniqueConstraint, event, text
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
 from db.base_model import BaseModel
 from sqlalchemy.orm import relationship
 import enum
@@ -39,15 +40,15 @@ class PaymentMethod(str, enum.Enum):
 class Appointment(BaseModel):
     __tablename__ = "appointments"
 
+    # Indexed as the leading column of ix_appointments_patient_date_start
     patient_id = Column(Integer,
         ForeignKey("patient.id", ondelete="CASCADE"),
-        nullable=False,
-        index=True                    
+        nullable=False
     )
+    # Indexed as the leading column of ix_appointments_doctor_date_start
     doctor_id = Column(Integer,
         ForeignKey("doctors.id", ondelete="CASCADE"),
-        nullable=False,
-        index=True                  
+        nullable=False
     )
     clinic_id = Column(Integer,
         ForeignKey("doctor_clinics.id", ondelete="CASCADE"),
@@ -69,6 +70,25 @@ class Appointment(BaseModel):
       # Add constraint to ensure end_time is after start_time
     __table_args__ = (
         CheckConstraint('end_time > start_time', name='check_end_time_after_start'),
+        # No two active appointments of a doctor may overlap, enforced by Postgres at insert time
+        ExcludeConstraint(
+            ('doctor_id', '='),
+            (text('tsrange(date + start_time, date + end_time)'), '&&'),
+            name='ex_appointments_doctor_time_overlap',
+            using='gist',
+            where=text("appointment_status <> 'CANCELLED'")
+        ).ddl_if(dialect='postgresql'),
+        # Slot filtering, overlap checks and the keyset paged listings walk (date, start_time, id) per owner
+        Index('ix_appointments_doctor_date_start', 'doctor_id', 'date', 'start_time', 'id'),
+        Index('ix_appointments_patient_date_start', 'patient_id', 'date', 'start_time', 'id'),
+        # One active appointment per patient, doctor and day, also serves the patient/doctor/day lookups
+        Index(
+            'uq_appointments_patient_doctor_date',
+            'patient_id', 'doctor_id', 'date',
+            unique=True,
+            postgresql_where=text("appointment_status <> 'CANCELLED'"),
+            sqlite_where=text("appointment_status <> 'CANCELLED'")
+        ),
     )
 
     # Relationship with Patient
@@ -86,6 +106,14 @@ class Appointment(BaseModel):
 
 
 
+# The exclusion constraint mixes an integer equality with a range overlap in one gist index
+event.listen(
+    Appointment.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql")
+)
+
+
 class Payment(BaseModel):
     __tablename__ = "payment"
 
@@ -103,7 +131,29 @@ class Payment(BaseModel):
     appointment = relationship("Appointment", back_populates="payment")
 
 
-    
 
+# Materialized slot calendar, one row per doctor/clinic/date.
+# open_mask and booked_mask are minute bitmaps of the day (bit n = minute n after midnight).
+class DoctorSlot(BaseModel):
+    __tablename__ = "doctor_slot"
 
+    doctor_id = Column(Integer,
+        ForeignKey("doctors.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    clinic_id = Column(Integer,
+        ForeignKey("doctor_clinics.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    date = Column(Date, nullable=False)
+    open_mask = Column(LargeBinary, nullable=False)
+    booked_mask = Column(LargeBinary, nullable=False)
+    # Start minute of the first free slot of the day, NULL when the day is full
+    first_free_minute = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint('doctor_id', 'clinic_id', 'date', name='uq_doctor_slot_doctor_clinic_date'),
+        Index('ix_doctor_slot_doctor_date', 'doctor_id', 'date'),
+        Index('ix_doctor_slot_date_first_free', 'date', 'first_free_minute'),
+    )
 
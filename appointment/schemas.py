@@ -1,6 +1,7 @@
 from datetime import datetime, time, date
-from pydantic import BaseModel
-from typing import List
+import enum
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 from appointment.models import AppointmentPayment, AppointmentStatus
 
@@ -15,6 +16,7 @@ class DoctorSlot(BaseModel):
 
 class DoctorAvailableSlotsResponse(BaseModel):
     slots: List[DoctorSlot]
+    next_cursor: Optional[str] = None
 
 
 class CreateAppointment(BaseModel):
@@ -23,6 +25,35 @@ class CreateAppointment(BaseModel):
     end_time: time
     reason_for_visit: str
 
+# Bulk booking on behalf of patients
+class BulkAppointmentItem(CreateAppointment):
+    patient_id: int
+    doctor_id: int
+
+
+class BulkCreateAppointments(BaseModel):
+    appointments: List[BulkAppointmentItem] = Field(min_length=1, max_length=500)
+
+
+class BulkItemStatus(str, enum.Enum):
+    CREATED = "created"
+    CONFLICT = "conflict"
+    INVALID = "invalid"
+
+
+class BulkAppointmentResult(BaseModel):
+    index: int
+    status: BulkItemStatus
+    appointment_id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class BulkCreateAppointmentsResponse(BaseModel):
+    created: int
+    conflicts: int
+    invalid: int
+    results: List[BulkAppointmentResult]
+
 class UserResponse(BaseModel):
     first_name: str
     last_name: str
@@ -67,8 +98,37 @@ class PatientAppointmentResponse(BaseModel):
     clinic: ClinicResponse
 
 
+class PatientAppointmentPage(BaseModel):
+    items: List[PatientAppointmentResponse]
+    next_cursor: Optional[str] = None
 
 
+# Streaming appointment export
+class AppointmentExportFormat(str, enum.Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+# Earliest available appointment search
+class EarliestSlotSort(str, enum.Enum):
+    EARLIEST = "earliest"
+    FEE = "fee"
+
+
+class EarliestAvailableDoctor(BaseModel):
+    doctor_id: int
+    doctor_name: str
+    speciality: str
+    experience: int
+    consultation_fee: float
+    clinic_id: int
+    clinic_name: str
+    city: str
+    date: date
+    start_time: time
+
+
+class EarliestAvailableDoctorsResponse(BaseModel):
+    results: List[EarliestAvailableDoctor]
+    next_cursor: Optional[str] = None
 
-    
-    
\ No newline at end of file
@@ -0,0 +1,94 @@
+import os
+from datetime import date, timedelta
+from typing import Iterable, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.cache import TTLCache, get_invalidation_backend
+from db.session import engine
+
+load_dotenv()
+
+
+SLOT_CACHE_TTL_SECONDS = float(os.getenv("SLOT_CACHE_TTL_SECONDS", "60"))
+SLOT_CACHE_MAXSIZE = int(os.getenv("SLOT_CACHE_MAXSIZE", "2048"))
+# "local" keeps invalidations inside the worker, "postgres" shares them through LISTEN/NOTIFY
+SLOT_CACHE_BACKEND = os.getenv("SLOT_CACHE_BACKEND", "local")
+SLOT_CACHE_CHANNEL = "doctor_slot_invalidation"
+
+
+slot_cache = TTLCache("doctor_slots", maxsize=SLOT_CACHE_MAXSIZE, ttl=SLOT_CACHE_TTL_SECONDS)
+
+invalidation_backend = get_invalidation_backend(
+    SLOT_CACHE_BACKEND,
+    dsn=engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+)
+
+
+def _slot_cache_key(doctor_id: int, start_date: date, days: int, slot_duration_minutes: int, clinic_id: Optional[int]):
+    return (doctor_id, start_date, days, slot_duration_minutes, clinic_id)
+
+
+def get_cached_slots(doctor_id: int, start_date: date, days: int, slot_duration_minutes: int, clinic_id: Optional[int] = None):
+    return slot_cache.get(_slot_cache_key(doctor_id, start_date, days, slot_duration_minutes, clinic_id))
+
+
+def cache_slots(
+    doctor_id: int, 
+    start_date: date, 
+    days: int, 
+    slot_duration_minutes: int, 
+    clinic_id: Optional[int], 
+    slots: list
+):
+    slot_cache.set(
+        _slot_cache_key(doctor_id, start_date, days, slot_duration_minutes, clinic_id),
+        slots,
+        tags=(doctor_id,)
+    )
+
+
+def _drop_doctor_slots(doctor_id: int, slot_date: Optional[date] = None):
+    if slot_date is None:
+        slot_cache.invalidate_tag(doctor_id)
+        return
+
+    # Only drop the horizons that contain the changed day
+    slot_cache.invalidate_tag(
+        doctor_id,
+        predicate=lambda key: key[1] <= slot_date < key[1] + timedelta(days=key[2])
+    )
+
+
+async def invalidate_doctor_slots(db: AsyncSession, doctor_id: int, slot_date: Optional[date] = None):
+    """Call before the commit of any change that books, frees or reshapes a doctor's slots"""
+    await invalidate_doctor_days(db, [(doctor_id, slot_date)])
+
+
+async def invalidate_doctor_days(db: AsyncSession, doctor_days: Iterable[Tuple[int, Optional[date]]]):
+    """Drop the cached slots of these (doctor_id, date) pairs when the session commits, in every worker"""
+    doctor_days = list(doctor_days)
+
+    def drop_local(session):
+        for doctor_id, slot_date in doctor_days:
+            _drop_doctor_slots(doctor_id, slot_date)
+
+    event.listen(db.sync_session, "after_commit", drop_local, once=True)
+
+    # Sent with the transaction instead of on a blocking connection of its own
+    await invalidation_backend.publish_in_transaction(
+        db,
+        SLOT_CACHE_CHANNEL,
+        [{"doctor_id": doctor_id, "date": slot_date.isoformat() if slot_date else None} for doctor_id, slot_date in doctor_days]
+    )
+
+
+def _on_remote_invalidation(message: dict):
+    slot_date = date.fromisoformat(message["date"]) if message.get("date") else None
+    _drop_doctor_slots(message["doctor_id"], slot_date)
+
+
+def start_slot_cache_listener():
+    invalidation_backend.subscribe(SLOT_CACHE_CHANNEL, _on_remote_invalidation)
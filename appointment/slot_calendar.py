@@ -0,0 +1,317 @@
+import argparse
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta
+from itertools import repeat
+from typing import Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import insert, text, tuple_
+from sqlalchemy.orm import Session
+
+from appointment.models import Appointment, AppointmentStatus, DoctorSlot
+from appointment.slot_engine import available_time_slots, decode_mask, encode_mask, free_slot_starts, minute_range_mask, to_minutes
+from db.session import SessionLocal, engine
+from doctor.models import DoctorAvailability
+
+load_dotenv()
+
+
+SLOT_HORIZON_DAYS = int(os.getenv("SLOT_HORIZON_DAYS", "30"))
+SLOT_DURATION_MINUTES = int(os.getenv("SLOT_DURATION_MINUTES", "30"))
+# Longest window a single slot request may ask for
+SLOT_MAX_RANGE_DAYS = int(os.getenv("SLOT_MAX_RANGE_DAYS", "180"))
+# "calendar" serves slots from the doctor_slot read model, "live" generates them per request
+SLOT_READ_MODEL = os.getenv("SLOT_READ_MODEL", "calendar")
+# First key of the per-doctor advisory locks, keeps them apart from other advisory lock users
+CALENDAR_LOCK_NAMESPACE = 7301
+
+
+# Calendar maintenance
+
+def first_free_minute(open_mask: int, booked_mask: int, not_before: int = 0) -> Optional[int]:
+    """Start minute of the first free slot at or after not_before, None when there is none"""
+    free_starts = free_slot_starts(open_mask, booked_mask, SLOT_DURATION_MINUTES, not_before)
+    return (free_starts & -free_starts).bit_length() - 1 if free_starts else None
+
+
+def _mask_values(open_mask: int, booked_mask: int):
+    """Both bitmaps and the precomputed first free slot used by the earliest slot search"""
+    return {
+        "open_mask": encode_mask(open_mask),
+        "booked_mask": encode_mask(booked_mask),
+        "first_free_minute": first_free_minute(open_mask, booked_mask),
+    }
+
+
+def _set_masks(row: DoctorSlot, open_mask: int, booked_mask: int):
+    for field, value in _mask_values(open_mask, booked_mask).items():
+        setattr(row, field, value)
+
+
+def lock_doctor_calendars(db: Session, doctor_ids: Iterable[int]):
+    """Serialize the calendar writes of these doctors until the end of the transaction.
+
+    Builds, bookings and cancellations take it before they read the appointments a mask is
+    computed from, so none of them writes a mask over a change it could not see yet. SQLite
+    has a single writer and needs no lock.
+    """
+    doctor_ids = sorted(set(doctor_ids))
+    if not doctor_ids or db.get_bind().dialect.name != "postgresql":
+        return
+
+    # Locked in doctor id order, two bulk bookings can not deadlock on each other
+    db.execute(
+        text(
+            "SELECT pg_advisory_xact_lock(:namespace, doctor_id) "
+            "FROM unnest(CAST(:doctor_ids AS integer[])) AS doctor_id ORDER BY doctor_id"
+        ),
+        {"namespace": CALENDAR_LOCK_NAMESPACE, "doctor_ids": doctor_ids}
+    )
+
+
+def booked_masks_by_date(db: Session, doctor_id: int, start_date: date, end_date: date):
+    booked_masks = booked_masks_by_doctor_date(db, [doctor_id], start_date, end_date)
+    return defaultdict(int, {appt_date: mask for (_, appt_date), mask in booked_masks.items()})
+
+
+def booked_masks_by_doctor_date(db: Session, doctor_ids: List[int], start_date: date, end_date: date):
+    """Booked minutes of every (doctor_id, date) of the window, read with one range query"""
+    booked_appointments = (
+        db.query(Appointment.doctor_id, Appointment.date, Appointment.start_time, Appointment.end_time)
+        .filter(
+            Appointment.doctor_id.in_(doctor_ids),
+            Appointment.date >= start_date,
+            Appointment.date <= end_date,
+            Appointment.appointment_status != AppointmentStatus.CANCELLED
+        )
+        .all()
+    )
+
+    booked_masks = defaultdict(int)
+    for appt_doctor_id, appt_date, appt_start, appt_end in booked_appointments:
+        booked_masks[(appt_doctor_id, appt_date)] |= minute_range_mask(to_minutes(appt_start), to_minutes(appt_end))
+    return booked_masks
+
+
+def build_doctor_calendar(db: Session, doctor_id: int, start_date: date, days: int = SLOT_HORIZON_DAYS):
+    """(Re)build the doctor_slot rows of a doctor for the given horizon, the caller commits"""
+    build_doctor_calendars(db, [doctor_id], start_date, days)
+
+
+def build_doctor_calendars(db: Session, doctor_ids: Iterable[int], start_date: date, days: int = SLOT_HORIZON_DAYS):
+    """(Re)build the doctor_slot rows of many doctors with one query per table, the caller commits"""
+    doctor_ids = sorted(set(doctor_ids))
+    if not doctor_ids:
+        return
+    end_date = start_date + timedelta(days=days - 1)
+
+    # Lock before reading the appointments, a racing booking either waits or is already visible
+    lock_doctor_calendars(db, doctor_ids)
+
+    existing_rows = {
+        (row.doctor_id, row.clinic_id, row.date): row
+        for row in db.query(DoctorSlot).filter(
+            DoctorSlot.doctor_id.in_(doctor_ids),
+            DoctorSlot.date >= start_date,
+            DoctorSlot.date <= end_date
+        ).with_for_update()
+    }
+
+    availabilities = (
+        db.query(DoctorAvailability)
+        .filter(
+            DoctorAvailability.doctor_id.in_(doctor_ids),
+            DoctorAvailability.is_available == True
+        )
+        .all()
+    )
+
+    # OR every availability window into one weekly template per clinic
+    weekly_masks = defaultdict(int)
+    doctor_clinics = set()
+    for availability in availabilities:
+        doctor_clinics.add((availability.doctor_id, availability.clinic_id))
+        weekly_masks[(availability.doctor_id, availability.clinic_id, availability.days_of_week.value)] |= minute_range_mask(
+            to_minutes(availability.start_time), # type: ignore
+            to_minutes(availability.end_time) # type: ignore
+        )
+
+    booked_masks = booked_masks_by_doctor_date(db, doctor_ids, start_date, end_date)
+
+    new_rows = []
+    for i in range(days):
+        current_date = start_date + timedelta(days=i)
+        day_name = current_date.strftime("%A").lower()
+
+        for doctor_id, clinic_id in sorted(doctor_clinics):
+            row = existing_rows.pop((doctor_id, clinic_id, current_date), None)
+            open_mask = weekly_masks.get((doctor_id, clinic_id, day_name), 0)
+            booked_mask = booked_masks.get((doctor_id, current_date), 0)
+
+            if row is None:
+                new_rows.append({
+                    "doctor_id": doctor_id, "clinic_id": clinic_id, "date": current_date,
+                    **_mask_values(open_mask, booked_mask)
+                })
+            else:
+                _set_masks(row, open_mask, booked_mask)
+
+    # Clinics that no longer have any availability
+    for row in existing_rows.values():
+        db.delete(row)
+
+    db.flush()
+
+    # A fresh horizon is one executemany instead of an INSERT ... RETURNING per day. Without
+    # render_nulls the rows of full or closed days, first_free_minute None, start a new batch
+    if new_rows:
+        db.execute(insert(DoctorSlot).execution_options(render_nulls=True), new_rows)
+
+
+def mark_slot_booked(db: Session, doctor_id: int, slot_date: date, start_time: time, end_time: time):
+    """Flip the booked minutes of a new appointment inside the caller's transaction"""
+    mark_slots_booked(db, [(doctor_id, slot_date, start_time, end_time)])
+
+
+def mark_slots_booked(db: Session, bookings: List[Tuple[int, date, time, time]]):
+    """Flip the booked minutes of many (doctor_id, date, start_time, end_time) bookings with one locking read"""
+    booked_ranges = defaultdict(int)
+    for doctor_id, slot_date, start_time, end_time in bookings:
+        booked_ranges[(doctor_id, slot_date)] |= minute_range_mask(to_minutes(start_time), to_minutes(end_time))
+
+    if not booked_ranges:
+        return
+
+    lock_doctor_calendars(db, [doctor_id for doctor_id, _ in booked_ranges])
+
+    rows = (
+        db.query(DoctorSlot)
+        .filter(tuple_(DoctorSlot.doctor_id, DoctorSlot.date).in_(list(booked_ranges)))
+        .with_for_update()
+        .all()
+    )
+    for row in rows:
+        booked_range = booked_ranges[(row.doctor_id, row.date)]
+        _set_masks(row, decode_mask(row.open_mask), decode_mask(row.booked_mask) | booked_range) # type: ignore
+
+
+def refresh_booked_mask(db: Session, doctor_id: int, slot_date: date):
+    """Recompute the booked minutes of a day, used when an appointment frees its slot"""
+    lock_doctor_calendars(db, [doctor_id])
+
+    rows = (
+        db.query(DoctorSlot)
+        .filter(DoctorSlot.doctor_id == doctor_id, DoctorSlot.date == slot_date)
+        .with_for_update()
+        .all()
+    )
+    # Read after the lock, a booking committed while waiting for it is included
+    booked_mask = booked_masks_by_date(db, doctor_id, slot_date, slot_date).get(slot_date, 0)
+
+    for row in rows:
+        _set_masks(row, decode_mask(row.open_mask), booked_mask) # type: ignore
+
+
+def get_calendar_slots(
+    db: Session,
+    doctor_id: int,
+    start_date: date,
+    days: int = SLOT_HORIZON_DAYS,
+    slot_duration_minutes: int = SLOT_DURATION_MINUTES,
+    clinic_id: Optional[int] = None
+) -> Optional[List]:
+    """Read the free slots of the window, returns None when the calendar does not cover it"""
+    end_date = start_date + timedelta(days=days - 1)
+
+    query = db.query(DoctorSlot).filter(
+        DoctorSlot.doctor_id == doctor_id,
+        DoctorSlot.date >= start_date,
+        DoctorSlot.date <= end_date
+    )
+    if clinic_id is not None:
+        query = query.filter(DoctorSlot.clinic_id == clinic_id)
+
+    rows = query.order_by(DoctorSlot.date, DoctorSlot.clinic_id).all()
+
+    if len({row.date for row in rows}) < days:
+        return None
+
+    # One entry per day like the live path, the open minutes of every clinic are merged
+    day_masks = defaultdict(lambda: (0, 0))
+    for row in rows:
+        open_mask, booked_mask = day_masks[row.date]
+        day_masks[row.date] = (open_mask | decode_mask(row.open_mask), booked_mask | decode_mask(row.booked_mask)) # type: ignore
+
+    now = datetime.now()
+    slots = []
+    for slot_date, (open_mask, booked_mask) in sorted(day_masks.items()):
+        not_before = to_minutes(now.time()) if slot_date == now.date() else 0
+
+        time_slots = available_time_slots(open_mask, booked_mask, slot_duration_minutes, not_before)
+        if time_slots:
+            slots.append({
+                "doctor_id": doctor_id,
+                "date": slot_date.strftime("%y-%m-%d"),
+                "day": slot_date.strftime("%A").lower(),
+                "time_slot": time_slots
+            })
+
+    return slots
+
+
+# Nightly horizon roll forward
+
+def _init_worker():
+    # Connections inherited from the parent process must not be shared with the children
+    engine.dispose(close=False)
+
+
+def _roll_doctor_chunk(doctor_ids: List[int], start_date: date, days: int):
+    db = SessionLocal()
+    try:
+        for doctor_id in doctor_ids:
+            build_doctor_calendar(db, doctor_id, start_date, days)
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return len(doctor_ids)
+
+
+def roll_slot_calendar(days: int = SLOT_HORIZON_DAYS, processes: Optional[int] = None, chunk_size: int = 100):
+    """Drop past calendar days and rebuild the horizon of every doctor in a process pool"""
+    today = date.today()
+
+    db = SessionLocal()
+    try:
+        db.query(DoctorSlot).filter(DoctorSlot.date < today).delete(synchronize_session=False)
+        db.commit()
+        doctor_ids = [
+            doctor_id for (doctor_id,) in db.query(DoctorAvailability.doctor_id).distinct().order_by(DoctorAvailability.doctor_id)
+        ]
+    finally:
+        db.close()
+
+    chunks = [doctor_ids[i:i + chunk_size] for i in range(0, len(doctor_ids), chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as pool:
+        rolled = sum(pool.map(_roll_doctor_chunk, chunks, repeat(today), repeat(days)))
+
+    print(f"Slot calendar rolled forward for {rolled} doctors ({days} days from {today})")
+    return rolled
+
+
+if __name__ == "__main__":
+    import init # noqa: F401  registers every model on the mapper
+
+    parser = argparse.ArgumentParser(description="Roll the doctor slot calendar forward")
+    parser.add_argument("--days", type=int, default=SLOT_HORIZON_DAYS)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=100)
+    args = parser.parse_args()
+
+    roll_slot_calendar(days=args.days, processes=args.processes, chunk_size=args.chunk_size)
@@ -0,0 +1,125 @@
+from datetime import date, time, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, List
+
+# Every day is a 1440 bit integer where bit n stands for minute n after midnight.
+# Availability windows are OR'd in, booked minutes are masked out and slot
+# boundaries come from whole-day shifts and masks instead of per-slot datetime math.
+
+MINUTES_PER_DAY = 24 * 60
+MASK_BYTES = MINUTES_PER_DAY // 8
+
+
+def to_minutes(value: time) -> int:
+    return value.hour * 60 + value.minute
+
+
+def minute_range_mask(start_minute: int, end_minute: int) -> int:
+    if end_minute <= start_minute:
+        return 0
+    return ((1 << (end_minute - start_minute)) - 1) << start_minute
+
+
+def encode_mask(mask: int) -> bytes:
+    return mask.to_bytes(MASK_BYTES, "little")
+
+
+def decode_mask(raw: bytes) -> int:
+    return int.from_bytes(raw, "little")
+
+
+def format_minutes(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def weekly_open_masks(availabilities: Iterable) -> Dict[str, int]:
+    """OR every available window into one open-minute mask per weekday"""
+    weekly_masks = {}
+    for availability in availabilities:
+        if not availability.is_available:
+            continue
+        day_name = availability.days_of_week.value
+        weekly_masks[day_name] = weekly_masks.get(day_name, 0) | minute_range_mask(
+            to_minutes(availability.start_time),
+            to_minutes(availability.end_time)
+        )
+    return weekly_masks
+
+
+def day_open_masks(weekly_masks: Dict[str, int], start_date: date, days: int):
+    """Yield (date, day name, open mask) for every day of the horizon that has open minutes"""
+    for i in range(days):
+        current_date = start_date + timedelta(days=i)
+        day_name = current_date.strftime("%A").lower()
+        open_mask = weekly_masks.get(day_name)
+        if open_mask:
+            yield current_date, day_name, open_mask
+
+
+@lru_cache(maxsize=4096)
+def slot_start_mask(open_mask: int, slot_duration_minutes: int) -> int:
+    """Bits of the minutes where a full slot starts, aligned to the start of every open run"""
+    starts = 0
+    run_starts = open_mask & ~(open_mask << 1)
+
+    while run_starts:
+        run_start = (run_starts & -run_starts).bit_length() - 1
+        run_starts &= run_starts - 1
+
+        # Adding one to the shifted mask carries through the trailing run of ones
+        rest = open_mask >> run_start
+        run_length = ((rest + 1) & ~rest).bit_length() - 1
+
+        slot_count = run_length // slot_duration_minutes
+        if slot_count:
+            # One bit every slot_duration_minutes: (2^(n*d) - 1) / (2^d - 1)
+            period = (1 << slot_duration_minutes) - 1
+            starts |= (((1 << (slot_count * slot_duration_minutes)) - 1) // period) << run_start
+
+    return starts
+
+
+def blocked_start_mask(booked_mask: int, slot_duration_minutes: int) -> int:
+    """Bits of the minutes whose slot would overlap at least one booked minute"""
+    # Smear every booked minute over the slot_duration_minutes - 1 minutes before it
+    blocked = booked_mask
+    span = 1
+    while span < slot_duration_minutes:
+        shift = min(span, slot_duration_minutes - span)
+        blocked |= blocked >> shift
+        span += shift
+    return blocked
+
+
+def free_slot_starts(open_mask: int, booked_mask: int, slot_duration_minutes: int, not_before: int = 0) -> int:
+    starts = slot_start_mask(open_mask, slot_duration_minutes)
+    if booked_mask:
+        starts &= ~blocked_start_mask(booked_mask, slot_duration_minutes)
+    if not_before:
+        starts &= ~((1 << not_before) - 1)
+    return starts
+
+
+@lru_cache(maxsize=32)
+def slot_labels(slot_duration_minutes: int):
+    return tuple(
+        f"{format_minutes(minute)}-{format_minutes(minute + slot_duration_minutes)}"
+        for minute in range(MINUTES_PER_DAY)
+    )
+
+
+def render_time_slots(starts: int, slot_duration_minutes: int) -> List[str]:
+    labels = slot_labels(slot_duration_minutes)
+    time_slots = []
+    while starts:
+        lowest = starts & -starts
+        time_slots.append(labels[lowest.bit_length() - 1])
+        starts ^= lowest
+    return time_slots
+
+
+def available_time_slots(open_mask: int, booked_mask: int, slot_duration_minutes: int, not_before: int = 0) -> List[str]:
+    return render_time_slots(
+        free_slot_starts(open_mask, booked_mask, slot_duration_minutes, not_before),
+        slot_duration_minutes
+    )
@@ -1,21 +1,46 @@
+from typing import Optional
 from fastapi import APIRouter, Depends
 
-from auth.schemas import TokenResponse
-from sqlalchemy.orm import Session
+from auth.schemas import LogoutRequest, RefreshTokenRequest, TokenResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth import interface
 from fastapi.security import OAuth2PasswordRequestForm
 
-from db.session import get_db
+from core.security import oauth2_scheme
+from core.db_routing import get_write_db
+from core.query_counter import query_budget
 
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
 @router.post("/token", response_model=TokenResponse)
+@query_budget(3)
 async def authenticate_token(
     user_credential: OAuth2PasswordRequestForm = Depends(), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_write_db)
 ):
-    access_token = interface.get_token(db=db, user_credential=user_credential)
+    access_token = await interface.get_token(db=db, user_credential=user_credential)
     return access_token
 
 
+# Rotate a refresh token into a new token pair with up to date claims, no password check involved
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh_token(
+    refresh_request: RefreshTokenRequest,
+    db: AsyncSession = Depends(get_write_db)
+):
+    return await interface.refresh_user_token(db=db, refresh_token=refresh_request.refresh_token)
+
+
+# Revoke the access token, and the refresh token when one is sent
+@router.post("/logout", response_model=dict)
+async def logout(
+    logout_request: Optional[LogoutRequest] = None,
+    access_token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_write_db)
+):
+    return await interface.logout_user(
+        db=db,
+        access_token=access_token,
+        refresh_token=logout_request.refresh_token if logout_request else None
+    )
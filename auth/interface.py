@@ -1,29 +1,58 @@
-from datetime import datetime, timedelta
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth.models import RevokedToken
 from auth.schemas import TokenResponse
-from core.security import create_access_token, verify_password
+from core.revocation import revoked_tokens
+from core.security import (
+    ACCESS_TOKEN_EXPIRE_MINUTES, ACCESS_TOKEN_TYPE, AUTH_TOKEN_MODE, REFRESH_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_TYPE,
+    STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token, get_token_payload, identity_claims, load_current_user, verify_and_update_password
+)
 from user.models import User
 from fastapi.security import OAuth2PasswordRequestForm
 
 
 
-def get_user_token(user):
-    
-    expiry_time = datetime.utcnow() + timedelta(minutes=15) 
-
+async def get_user_token(db: AsyncSession, user_id: int):
+    issued_at = datetime.utcnow()
     payload = {
-        "id": user.id,
-        "exp": expiry_time
+        "id": user_id,
+        "type": ACCESS_TOKEN_TYPE,
+        "jti": uuid.uuid4().hex
     }
 
+    if AUTH_TOKEN_MODE == "stateless":
+        current_user = await load_current_user(db, user_id)
+        if not current_user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Unauthorized User"
+            )
+        payload.update(identity_claims(current_user))
+        expiry_time = issued_at + timedelta(minutes=STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES)
+    else:
+        expiry_time = issued_at + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+
+    payload["exp"] = expiry_time
     access_token = create_access_token(payload=payload)
-    return TokenResponse(access_token=access_token, expiry_time=expiry_time)
 
+    refresh_token = create_access_token(payload={
+        "id": user_id,
+        "type": REFRESH_TOKEN_TYPE,
+        "jti": uuid.uuid4().hex,
+        "exp": issued_at + timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
+    })
+
+    return TokenResponse(access_token=access_token, expiry_time=expiry_time, refresh_token=refresh_token)
 
 
-def get_token(db: Session, user_credential: OAuth2PasswordRequestForm):
-    db_user = db.query(User).filter(User.username == user_credential.username).first()
+
+async def get_token(db: AsyncSession, user_credential: OAuth2PasswordRequestForm):
+    db_user = await db.scalar(select(User).filter(User.username == user_credential.username))
 
     if not db_user:
         raise HTTPException(
@@ -31,15 +60,95 @@ def get_token(db: Session, user_credential: OAuth2PasswordRequestForm):
             detail=f"Username not found"
         )
     
-    verified_password = verify_password(user_credential.password, db_user.password) # type: ignore
+    verified_password, new_password_hash = await verify_and_update_password(user_credential.password, db_user.password) # type: ignore
 
     if not verified_password:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Wrong Password"
         )
+
+    # The configured work factor changed since this password was hashed
+    if new_password_hash:
+        db_user.password = new_password_hash # type: ignore
+        await db.commit()
     
-    return get_user_token(user=db_user)
+    return await get_user_token(db=db, user_id=db_user.id) # type: ignore
 
 
-    
+def _revoked_token(payload: dict):
+    return RevokedToken(
+        jti=payload["jti"],
+        user_id=payload["id"],
+        token_type=payload["type"],
+        expires_at=datetime.fromtimestamp(payload["exp"], timezone.utc)
+    )
+
+
+async def refresh_user_token(db: AsyncSession, refresh_token: str):
+    """Rotate a refresh token into a new token pair, re-reading the identity so role and profile changes reach the claims"""
+    payload = get_token_payload(token=refresh_token)
+
+    if not payload or payload.get("type") != REFRESH_TOKEN_TYPE or not payload.get("id") or not payload.get("jti"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token"
+        )
+
+    if not await db.scalar(select(User.id).filter(User.id == payload["id"])):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token"
+        )
+
+    # Every refresh token is single use, the unique jti rejects a replay or a concurrent rotation
+    db.add(_revoked_token(payload))
+    try:
+        await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token has already been used"
+        )
+
+    token_response = await get_user_token(db=db, user_id=payload["id"])
+    await db.commit()
+    return token_response
+
+
+async def logout_user(db: AsyncSession, access_token: str, refresh_token: Optional[str] = None):
+    payload = get_token_payload(token=access_token)
+
+    if not payload or payload.get("type", ACCESS_TOKEN_TYPE) != ACCESS_TOKEN_TYPE or not payload.get("id"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized User"
+        )
+
+    revoked = []
+    if payload.get("jti"):
+        revoked.append(payload)
+
+    if refresh_token:
+        refresh_payload = get_token_payload(token=refresh_token)
+        if (
+            refresh_payload
+            and refresh_payload.get("type") == REFRESH_TOKEN_TYPE
+            and refresh_payload.get("id") == payload["id"]
+            and refresh_payload.get("jti")
+        ):
+            revoked.append(refresh_payload)
+
+    already_revoked = {
+        jti for (jti,) in await db.execute(select(RevokedToken.jti).filter(RevokedToken.jti.in_([p["jti"] for p in revoked])))
+    }
+    for revoked_payload in revoked:
+        if revoked_payload["jti"] not in already_revoked:
+            db.add(_revoked_token(revoked_payload))
+    await db.commit()
+
+    if payload.get("jti"):
+        revoked_tokens.add(payload["jti"])
+
+    return {"message": "Logged out"}
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+from db.base_model import BaseModel
+
+
+
+# Revoked token ids, kept until the token would have expired anyway
+class RevokedToken(BaseModel):
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String(32), unique=True, nullable=False)
+    user_id = Column(Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True
+    )
+    token_type = Column(String(10), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Optional
 from pydantic import BaseModel
 
 
@@ -6,9 +7,17 @@ from pydantic import BaseModel
 class TokenResponse(BaseModel):
     access_token: str
     expiry_time: datetime
+    refresh_token: Optional[str] = None
 
     class Config:
         json_encoders = {
             datetime: lambda v: v.isoformat() + "Z"
         }
-    
\ No newline at end of file
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import statistics
+import sys
+import time as timer
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+import httpx
+from sqlalchemy import and_, func, select, text
+from sqlalchemy.orm import aliased
+
+from main import app
+from appointment import slot_engine
+from appointment.models import Appointment, AppointmentStatus
+from auth.interface import get_user_token
+from benchmarks.endpoints import git_revision, percentile
+from db.pool import POOL_METRICS
+from db.session import DB_POOL_SIZE, AsyncSessionLocal, async_engine
+from doctor.models import Doctor, DoctorAvailability
+from patient.models import Patient
+from populate_db.interface import bulk_populate
+from populate_db.schema import TestUserRole
+from populate_db.workload import WEEK
+from user.models import User
+
+
+# Booking storm: many patients race for the same few slots of one doctor on one day.
+#
+# Clients are spread over worker processes, each with its own app and connection pool like
+# uvicorn workers, and all of them fire at the same instant. Afterwards the appointments of
+# that day are checked for double bookings. Exits with 1 when one is found.
+#
+#   python -m benchmarks.booking_storm --clients 500 --processes 4 --slots 3
+
+
+def _init_worker():
+    # Connections inherited from the parent process must not be shared with the children
+    async_engine.sync_engine.dispose(close=False)
+
+
+async def _storm(doctor_id: int, bookings, start_at: float):
+    async def warm_connection():
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    # Open the pool up front so the first bookings do not pay for the connects
+    await asyncio.gather(*(warm_connection() for _ in range(min(len(bookings), DB_POOL_SIZE))))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://storm", timeout=None) as client:
+        async def book(token: str, payload: dict):
+            await asyncio.sleep(max(0.0, start_at - timer.time()))
+            started = timer.perf_counter()
+            response = await client.post(
+                f"/appointment/create-appointment/{doctor_id}", json=payload, headers={"Authorization": f"Bearer {token}"}
+            )
+            return response.status_code, (timer.perf_counter() - started) * 1000
+
+        results = await asyncio.gather(*(book(token, payload) for token, payload in bookings))
+
+    checkout_wait = POOL_METRICS["async"].stats()["checkout_wait_ms"]
+    await async_engine.dispose()
+    return results, checkout_wait
+
+
+def storm_worker(doctor_id: int, bookings, start_at: float):
+    return asyncio.run(_storm(doctor_id, bookings, start_at))
+
+
+async def storm_patients(db, clients: int):
+    """User ids of the latest seeded patients, seeding the missing ones"""
+    def latest():
+        return (
+            select(User.id).join(Patient, Patient.user_id == User.id)
+            .filter(User.username.like("%.seed%")).order_by(User.id.desc()).limit(clients)
+        )
+
+    user_ids = (await db.scalars(latest())).all()
+    if len(user_ids) < clients:
+        await bulk_populate(db=db, no_of_users=clients - len(user_ids), role=TestUserRole.PATIENT)
+        user_ids = (await db.scalars(latest())).all()
+    return user_ids
+
+
+async def storm_doctor(db, doctor_id=None):
+    """A seeded verified doctor with a weekly schedule, and that schedule"""
+    if doctor_id is None:
+        doctor_id = await db.scalar(
+            select(Doctor.id).join(DoctorAvailability, DoctorAvailability.doctor_id == Doctor.id)
+            .filter(Doctor.is_verified).order_by(Doctor.id.desc()).limit(1)
+        )
+    if doctor_id is None:
+        doctor_id = (await bulk_populate(db=db, no_of_users=1, role=TestUserRole.DOCTOR))[0][0]
+
+    availabilities = (await db.scalars(
+        select(DoctorAvailability).filter(DoctorAvailability.doctor_id == doctor_id, DoctorAvailability.is_available)
+    )).all()
+    if not availabilities:
+        raise SystemExit(f"Doctor {doctor_id} has no availability to book")
+    return doctor_id, availabilities
+
+
+async def storm_slots(db, doctor_id: int, availabilities, slots: int, slot_duration_minutes: int):
+    """First working day of the doctor after all of their appointments, and its first free slots"""
+    last_date = await db.scalar(select(func.max(Appointment.date)).filter(Appointment.doctor_id == doctor_id))
+    storm_date = max(last_date or date.today(), date.today()) + timedelta(days=1)
+
+    while not any(WEEK.index(availability.days_of_week) == storm_date.weekday() for availability in availabilities):
+        storm_date += timedelta(days=1)
+
+    starts = sorted(
+        minute
+        for availability in availabilities if WEEK.index(availability.days_of_week) == storm_date.weekday()
+        for minute in range(
+            slot_engine.to_minutes(availability.start_time),
+            slot_engine.to_minutes(availability.end_time) - slot_duration_minutes + 1,
+            slot_duration_minutes
+        )
+    )
+    return storm_date, starts[:slots]
+
+
+async def double_bookings(db, doctor_id: int, storm_date: date):
+    active = and_(Appointment.doctor_id == doctor_id, Appointment.date == storm_date, Appointment.appointment_status != AppointmentStatus.CANCELLED)
+    other = aliased(Appointment)
+
+    overlapping = await db.scalar(
+        select(func.count()).select_from(Appointment).join(other, and_(
+            other.doctor_id == Appointment.doctor_id,
+            other.date == Appointment.date,
+            other.id > Appointment.id,
+            other.appointment_status != AppointmentStatus.CANCELLED,
+            other.start_time < Appointment.end_time,
+            other.end_time > Appointment.start_time
+        )).filter(active)
+    )
+    same_patient = await db.scalar(
+        select(func.count()).select_from(
+            select(Appointment.patient_id).filter(active).group_by(Appointment.patient_id).having(func.count() > 1).subquery()
+        )
+    )
+    booked = await db.scalar(select(func.count()).select_from(Appointment).filter(active))
+    return {"booked_rows": booked, "overlapping_pairs": overlapping, "patients_booked_twice": same_patient}
+
+
+async def sample_lock_waits(stop: asyncio.Event, interval: float):
+    """Sessions waiting on a row or constraint lock, sampled on Postgres while the storm runs"""
+    samples = []
+    async with async_engine.connect() as connection:
+        while not stop.is_set():
+            samples.append(await connection.scalar(text("SELECT count(*) FROM pg_locks WHERE NOT granted")))
+            await asyncio.sleep(interval)
+    return {
+        "samples": len(samples),
+        "max_waiting": max(samples, default=0),
+        "mean_waiting": round(statistics.mean(samples), 2) if samples else 0.0,
+    }
+
+
+async def run(clients: int, processes: int, slots: int, slot_duration_minutes: int, doctor_id, start_delay: float):
+    async with AsyncSessionLocal() as db:
+        patient_user_ids = await storm_patients(db, clients)
+        doctor_id, availabilities = await storm_doctor(db, doctor_id)
+        storm_date, starts = await storm_slots(db, doctor_id, availabilities, slots, slot_duration_minutes)
+        tokens = [(await get_user_token(db=db, user_id=user_id)).access_token for user_id in patient_user_ids]
+
+    # Client i races for slot i % slots, every client is a different patient
+    bookings = [
+        (token, {
+            "date": storm_date.isoformat(),
+            "start_time": slot_engine.format_minutes(starts[i % len(starts)]),
+            "end_time": slot_engine.format_minutes(starts[i % len(starts)] + slot_duration_minutes),
+            "reason_for_visit": "Booking storm",
+        })
+        for i, token in enumerate(tokens)
+    ]
+    await async_engine.dispose()
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    lock_waits = None
+    if async_engine.dialect.name == "postgresql":
+        lock_waits = asyncio.create_task(sample_lock_waits(stop, 0.01))
+
+    started = timer.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as pool:
+        start_at = timer.time() + start_delay
+        outcomes = await asyncio.gather(*(
+            loop.run_in_executor(pool, storm_worker, doctor_id, bookings[worker::processes], start_at)
+            for worker in range(processes)
+        ))
+    elapsed = timer.perf_counter() - started - start_delay
+
+    stop.set()
+    lock_waits = await lock_waits if lock_waits else None
+
+    results = [result for worker_results, _ in outcomes for result in worker_results]
+    statuses = Counter(status_code for status_code, _ in results)
+    latencies = [latency for _, latency in results]
+
+    async with AsyncSessionLocal() as db:
+        detected = await double_bookings(db, doctor_id, storm_date)
+    await async_engine.dispose()
+
+    return {
+        "revision": git_revision(),
+        "database": async_engine.dialect.name,
+        "clients": len(results),
+        "processes": processes,
+        "doctor_id": doctor_id,
+        "date": storm_date.isoformat(),
+        "slots": [slot_engine.format_minutes(minute) for minute in starts],
+        "seconds": round(elapsed, 3),
+        "booked": statuses.get(200, 0),
+        "conflicts": statuses.get(409, 0),
+        "other_statuses": {str(status_code): count for status_code, count in statuses.items() if status_code not in (200, 409)},
+        "double_bookings": detected,
+        "lock_waits": lock_waits,
+        "pool_checkout_wait_ms": {
+            "max": max(wait["max"] for _, wait in outcomes),
+            "sum": round(sum(wait["sum"] for _, wait in outcomes), 3),
+        },
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "max": round(max(latencies), 2),
+        },
+        "latency_ms_by_status": {
+            str(status_code): round(percentile([latency for code, latency in results if code == status_code], 0.99), 2)
+            for status_code in statuses
+        },
+    }
+
+
+def is_double_booked(report: dict):
+    detected = report["double_bookings"]
+    return (
+        detected["overlapping_pairs"] > 0 or
+        detected["patients_booked_twice"] > 0 or
+        detected["booked_rows"] > len(report["slots"]) or
+        report["booked"] > len(report["slots"])
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Many concurrent patients racing for the same slots of one doctor")
+    parser.add_argument("--clients", type=int, default=200, help="concurrent patients, one booking each")
+    parser.add_argument("--processes", type=int, default=2, help="worker processes, each with its own app and pool")
+    parser.add_argument("--slots", type=int, default=1, help="slots of the day the clients race for")
+    parser.add_argument("--slot-duration", type=int, default=30, help="minutes")
+    parser.add_argument("--doctor-id", type=int, default=None, help="defaults to the latest verified doctor with a schedule")
+    parser.add_argument("--start-delay", type=float, default=2.0, help="seconds the workers get to start before the storm")
+    args = parser.parse_args()
+
+    # The app prints its warnings, keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run(args.clients, args.processes, args.slots, args.slot_duration, args.doctor_id, args.start_delay))
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if is_double_booked(report) else 0)
@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time as timer
+from datetime import date, timedelta
+
+import httpx
+from sqlalchemy import func, insert, select
+
+from main import app
+from appointment import slot_engine
+from appointment.models import Appointment
+from core.security import get_password_hash_async
+from db.session import AsyncSessionLocal, async_engine, async_read_engine
+from doctor.models import Doctor, DoctorAvailability
+from populate_db.interface import TEST_PASSWORD
+from populate_db.schema import WorkloadProfile
+from populate_db.workload import WEEK, generate_workload
+from user.models import Gender, User, UserRole, UserStatus
+
+
+# In-process benchmark of the main endpoints. Drives the app of main.py through an httpx ASGI
+# transport against the configured database, seeded with the populate_db workload generator,
+# and prints throughput, latency percentiles and SQL statements per request as JSON so the
+# results of two commits can be diffed.
+#
+#   python -m benchmarks.endpoints --requests 500 --concurrency 20 > before.json
+#   python -m benchmarks.endpoints --skip-seed --requests 500 --concurrency 20 > after.json
+
+
+BENCHMARK_ADMIN = "benchmark.admin"
+
+def percentile(samples, fraction: float):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def ensure_admin():
+    async with AsyncSessionLocal() as db:
+        if not await db.scalar(select(User.id).filter(User.username == BENCHMARK_ADMIN)):
+            await db.execute(insert(User).values(
+                username=BENCHMARK_ADMIN, first_name="Benchmark", last_name="Admin", age=40, gender=Gender.MALE,
+                mobile_no="+899999999999", gmail="benchmark.admin@example.com", user_role=UserRole.ADMIN,
+                password=await get_password_hash_async(TEST_PASSWORD), status=UserStatus.ACTIVE
+            ))
+            await db.commit()
+
+
+async def seeded_users(limit: int):
+    """Usernames of the latest seeded patients and the latest seeded verified doctors with their schedules"""
+    async with AsyncSessionLocal() as db:
+        patient_usernames = (await db.scalars(
+            select(User.username)
+            .filter(User.user_role == UserRole.PATIENT, User.username.like("%.seed%"))
+            .order_by(User.id.desc()).limit(limit)
+        )).all()
+
+        doctor_ids = (await db.scalars(
+            select(Doctor.id).join(User, User.id == Doctor.user_id)
+            .filter(Doctor.is_verified, User.username.like("%.seed%"))
+            .order_by(Doctor.id.desc()).limit(limit)
+        )).all()
+
+        availabilities = (await db.scalars(
+            select(DoctorAvailability).filter(DoctorAvailability.doctor_id.in_(doctor_ids))
+        )).all()
+
+    schedules = {}
+    for availability in availabilities:
+        schedules.setdefault(availability.doctor_id, []).append(availability)
+    return patient_usernames, [doctor_id for doctor_id in doctor_ids if doctor_id in schedules], schedules
+
+
+def booking_candidates(doctor_ids, schedules, first_date: date, slot_duration_minutes: int):
+    """Endless free slots past the seeded history, walked doctor by doctor and day by day"""
+    for day_offset in itertools.count():
+        booking_date = first_date + timedelta(days=day_offset)
+        for doctor_id in doctor_ids:
+            for availability in schedules[doctor_id]:
+                if WEEK.index(availability.days_of_week) != booking_date.weekday():
+                    continue
+                end_minute = slot_engine.to_minutes(availability.end_time)
+                for minute in range(slot_engine.to_minutes(availability.start_time), end_minute - slot_duration_minutes + 1, slot_duration_minutes):
+                    yield doctor_id, booking_date, minute
+
+
+def patient_bookings(bookings, patient_count: int):
+    """(patient index, doctor_id, date, minute) of the booking candidates, the n-th slot of a doctor's day goes to the n-th patient.
+
+    A patient can book a doctor once a day, the slots of a day past the number of patients are skipped.
+    """
+    for (doctor_id, booking_date), day_slots in itertools.groupby(bookings, key=lambda slot: slot[:2]):
+        for patient_index, (_, _, minute) in zip(range(patient_count), day_slots):
+            yield patient_index, doctor_id, booking_date, minute
+
+
+async def login(client: httpx.AsyncClient, username: str):
+    response = await client.post("/auth/token", data={"username": username, "password": TEST_PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def build_scenarios(patient_usernames, patient_headers, admin_headers, doctor_ids, bookings, slot_duration_minutes: int):
+    """Scenario name -> function of the request number returning the request to send"""
+    patient_slots = patient_bookings(bookings, len(patient_headers))
+
+    def book(i):
+        patient_index, doctor_id, booking_date, minute = next(patient_slots)
+        return "POST", f"/appointment/create-appointment/{doctor_id}", {
+            "headers": patient_headers[patient_index],
+            "json": {
+                "date": booking_date.isoformat(),
+                "start_time": slot_engine.format_minutes(minute),
+                "end_time": slot_engine.format_minutes(minute + slot_duration_minutes),
+                "reason_for_visit": "Benchmark booking",
+            },
+        }
+
+    return {
+        "auth.token": lambda i: ("POST", "/auth/token", {
+            "data": {"username": patient_usernames[i % len(patient_usernames)], "password": TEST_PASSWORD}
+        }),
+        "patient.doctors_list": lambda i: ("GET", "/patient/doctors-list", {
+            "headers": patient_headers[i % len(patient_headers)], "params": {"skip": (i * 10) % 100, "limit": 10}
+        }),
+        "doctor.doctor_profile": lambda i: ("GET", f"/doctor/doctor-profile/{doctor_ids[i % len(doctor_ids)]}", {
+            "headers": admin_headers
+        }),
+        "appointment.select_appointment_slot": lambda i: ("GET", f"/appointment/select-appointment-slot/{doctor_ids[i % len(doctor_ids)]}", {
+            "headers": patient_headers[i % len(patient_headers)]
+        }),
+        "appointment.create_appointment": book,
+        "admin.doctor_verifications": lambda i: ("GET", "/admin/dcotor-profile-with-doctor-verifications/", {
+            "headers": admin_headers, "params": {"skip": (i * 10) % 100, "limit": 10}
+        }),
+    }
+
+
+async def timed_request(client: httpx.AsyncClient, method: str, url: str, kwargs: dict):
+    started = timer.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    # Counted by core.query_counter.QueryCounterMiddleware
+    return (timer.perf_counter() - started) * 1000, int(response.headers["x-db-queries"]), response.status_code
+
+
+async def run_scenario(client: httpx.AsyncClient, build_request, requests: int, concurrency: int, warmup: int):
+    for i in range(warmup):
+        method, url, kwargs = build_request(i)
+        await client.request(method, url, **kwargs)
+
+    numbers = iter(range(warmup, warmup + requests))
+    latencies, query_counts, errors = [], [], 0
+
+    async def worker():
+        nonlocal errors
+        for i in numbers:
+            latency_ms, queries, status_code = await timed_request(client, *build_request(i))
+            latencies.append(latency_ms)
+            query_counts.append(queries)
+            if status_code >= 400:
+                errors += 1
+
+    started = timer.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = timer.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "queries_per_request": {
+            "mean": round(statistics.mean(query_counts), 2),
+            "max": max(query_counts),
+        },
+    }
+
+
+async def run(profile: WorkloadProfile, skip_seed: bool, scenario_names, requests: int, concurrency: int, warmup: int, logins: int):
+    try:
+        if not skip_seed:
+            async with AsyncSessionLocal() as db:
+                await generate_workload(db=db, profile=profile)
+        await ensure_admin()
+        patient_usernames, doctor_ids, schedules = await seeded_users(max(logins, 1))
+        if not patient_usernames or not doctor_ids:
+            raise SystemExit("No seeded patients or verified doctors found, run without --skip-seed first")
+
+        # Bookings start the day after the last appointment, seeded or booked by an earlier run
+        async with AsyncSessionLocal() as db:
+            last_date = await db.scalar(select(func.max(Appointment.date))) or date.today()
+        bookings = booking_candidates(doctor_ids, schedules, max(last_date, date.today()) + timedelta(days=1), profile.slot_duration_minutes)
+
+        results = {}
+        # The startup hooks of the app (listeners, cache reloaders) run as they would under uvicorn
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                patient_headers = [await login(client, username) for username in patient_usernames[:logins]]
+                admin_headers = await login(client, BENCHMARK_ADMIN)
+
+                scenarios = build_scenarios(
+                    patient_usernames, patient_headers, admin_headers, doctor_ids, bookings, profile.slot_duration_minutes
+                )
+                for name in scenario_names or scenarios:
+                    results[name] = await run_scenario(client, scenarios[name], requests, concurrency, warmup)
+    finally:
+        await async_engine.dispose()
+        if async_read_engine is not async_engine:
+            await async_read_engine.dispose()
+
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "database": async_engine.dialect.name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "warmup": warmup,
+        "profile": profile.model_dump(),
+        "scenarios": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput, latency percentiles and queries per request of the main endpoints")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario, fill the caches first")
+    parser.add_argument("--logins", type=int, default=20, help="patients logged in up front and rotated through")
+    parser.add_argument("--scenario", action="append", dest="scenarios", help="run only these scenarios, repeatable")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data of an earlier run")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--doctors", type=int, default=200)
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--history-days", type=int, default=90)
+    args = parser.parse_args()
+
+    profile = WorkloadProfile(seed=args.seed, doctors=args.doctors, patients=args.patients, history_days=args.history_days)
+    # The startup hooks print their warnings, keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        result = asyncio.run(run(profile, args.skip_seed, args.scenarios, args.requests, args.concurrency, args.warmup, args.logins))
+
+    report = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(report + "\n")
+    else:
+        print(report)
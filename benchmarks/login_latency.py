@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import statistics
+import time as timer
+
+import httpx
+from fastapi import FastAPI, HTTPException
+from passlib.context import CryptContext
+
+from core import security
+
+
+# Login latency under concurrent load with bcrypt run inline on the event loop (the
+# previous behaviour) against bcrypt run in the password hash pool, together with
+# a cheap endpoint that shows how long the loop stalls for every other request.
+#
+#   python -m benchmarks.login_latency --rate 8 --requests 80 --rounds 12
+
+
+def build_app(password_hash: str, context: CryptContext):
+    app = FastAPI()
+
+    @app.post("/inline-login")
+    async def inline_login(password: str):
+        if not context.verify(password, password_hash):
+            raise HTTPException(status_code=400, detail="Wrong Password")
+        return {"ok": True}
+
+    @app.post("/pooled-login")
+    async def pooled_login(password: str):
+        loop = asyncio.get_running_loop()
+        verified = await loop.run_in_executor(security.password_hash_executor, context.verify, password, password_hash)
+        if not verified:
+            raise HTTPException(status_code=400, detail="Wrong Password")
+        return {"ok": True}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+def percentile(samples, fraction: float):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def scheduled_request(client: httpx.AsyncClient, due: float, method: str, url: str, params=None):
+    """Latency from the moment the request was due, so time spent waiting on a blocked loop counts"""
+    await asyncio.sleep(max(0.0, due - timer.perf_counter()))
+    response = await client.request(method, url, params=params)
+    response.raise_for_status()
+    return (timer.perf_counter() - due) * 1000
+
+
+async def run_scenario(app: FastAPI, path: str, password: str, rate: float, requests: int, ping_interval: float):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        # Open loop arrivals: logins at a fixed rate and pings every ping_interval seconds
+        started = timer.perf_counter()
+        duration = requests / rate
+
+        logins = [
+            scheduled_request(client, started + i / rate, "POST", path, {"password": password})
+            for i in range(requests)
+        ]
+        pings = [
+            scheduled_request(client, started + i * ping_interval, "GET", "/ping")
+            for i in range(int(duration / ping_interval))
+        ]
+
+        results = await asyncio.gather(*logins, *pings)
+        elapsed = timer.perf_counter() - started
+
+    login_latencies, ping_latencies = results[:requests], results[requests:]
+    return {
+        "path": path,
+        "logins_per_second": round(requests / elapsed, 1),
+        "login_p50_ms": round(statistics.median(login_latencies), 1),
+        "login_p99_ms": round(percentile(login_latencies, 0.99), 1),
+        "ping_p50_ms": round(statistics.median(ping_latencies), 1) if ping_latencies else None,
+        "ping_p99_ms": round(percentile(ping_latencies, 0.99), 1) if ping_latencies else None,
+    }
+
+
+def main(rate: float, requests: int, rounds: int, ping_interval: float):
+    password = "benchmark-password"
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+    app = build_app(context.hash(password), context)
+
+    print(f"bcrypt rounds={rounds} rate={rate}/s requests={requests} hash workers={security.PASSWORD_HASH_WORKERS}")
+    for path in ("/inline-login", "/pooled-login"):
+        result = asyncio.run(run_scenario(app, path, password, rate, requests, ping_interval))
+        print(
+            f"{result['path']:<15} {result['logins_per_second']:>8} logins/s  "
+            f"login p50 {result['login_p50_ms']:>8} ms  p99 {result['login_p99_ms']:>8} ms  "
+            f"ping p50 {result['ping_p50_ms']} ms  p99 {result['ping_p99_ms']} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Login latency with inline and pooled bcrypt")
+    parser.add_argument("--rate", type=float, default=8, help="login arrivals per second")
+    parser.add_argument("--requests", type=int, default=80)
+    parser.add_argument("--rounds", type=int, default=security.BCRYPT_ROUNDS)
+    parser.add_argument("--ping-interval", type=float, default=0.01, help="seconds between cheap requests")
+    args = parser.parse_args()
+
+    main(args.rate, args.requests, args.rounds, args.ping_interval)
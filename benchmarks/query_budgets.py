@@ -0,0 +1,201 @@
+import os
+
+# Budgets are only asserted in raise mode, set before core.query_counter reads it
+os.environ["QUERY_BUDGET_MODE"] = "raise"
+
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+from datetime import date, timedelta
+
+import httpx
+from sqlalchemy import func, select
+
+from main import app
+from appointment import slot_calendar, slot_engine
+from appointment.models import Appointment
+from benchmarks.endpoints import BENCHMARK_ADMIN, booking_candidates, ensure_admin, git_revision, login, seeded_users
+from core.query_counter import QueryBudgetExceeded
+from db.session import AsyncSessionLocal, async_engine
+from doctor.models import DoctorVerification, VerificationStatus
+from populate_db.interface import TEST_PASSWORD
+from populate_db.schema import WorkloadProfile
+from populate_db.workload import generate_workload
+from user.models import User
+
+
+# Query budget check: sends every route declared with @query_budget through the app in
+# QUERY_BUDGET_MODE=raise, once with cold caches and once warm, and exits with 1 when a
+# route goes over its budget, repeats a statement past QUERY_REPEAT_LIMIT, fails, or has
+# a budget but no request here.
+#
+#   python -m benchmarks.query_budgets
+#   python -m benchmarks.query_budgets --skip-seed
+
+
+def doctor_profile_payload(number: int):
+    return {
+        "doctor": {"speciality": "Cardiology", "experience": 5, "consultation_fee": 500, "bio": "Query budget check"},
+        "qualification": {"qualification_name": "MBBS", "course_duration": "5 years", "year_completed": 2010},
+        "institute": {"name": "Query budget institute", "type": "hospital"},
+        "doctor_clinic_with_address": {
+            "clinic_info": {
+                "clinic_name": f"Budget clinic {number}", "clinic_phone": f"+94{number:010d}",
+                "is_primary_location": True, "consultation_hours_notes": "Mornings"
+            },
+            "clinic_address": {
+                "street_address": "1 Main street", "area_name": "Center", "city": "Delhi", "state": "Delhi",
+                "pincode": 110001, "country": "India", "address_type": "work"
+            },
+        },
+        "doctor_availability": {"days_of_week": ["monday", "wednesday", "friday"], "start_time": "09:00", "end_time": "12:00"},
+    }
+
+
+async def register_doctor(client: httpx.AsyncClient):
+    """A new doctor user without a profile, headers and its number"""
+    async with AsyncSessionLocal() as db:
+        number = (await db.scalar(select(func.max(User.id))) or 0) + 1
+
+    username = f"budget.doctor{number}"
+    response = await client.post("/users/user-register", json={
+        "username": username, "first_name": "Budget", "last_name": "Doctor", "age": 40, "gender": "male",
+        "mobile_no": f"+93{number:010d}", "gmail": f"{username}@example.com", "password": TEST_PASSWORD, "user_role": "doctor",
+    })
+    response.raise_for_status()
+    return await login(client, username), number
+
+
+async def budget_requests(client: httpx.AsyncClient, slot_duration_minutes: int):
+    """(method, route path) -> requests to send, the first one meets cold caches"""
+    patient_usernames, doctor_ids, schedules = await seeded_users(2)
+    if not patient_usernames or not doctor_ids:
+        raise SystemExit("No seeded patients or verified doctors found, run without --skip-seed first")
+
+    async with AsyncSessionLocal() as db:
+        last_date = await db.scalar(select(func.max(Appointment.date))) or date.today()
+        verification_id = await db.scalar(select(func.min(DoctorVerification.id)))
+
+    patient_headers = [await login(client, username) for username in patient_usernames]
+    admin_headers = await login(client, BENCHMARK_ADMIN)
+    new_doctor_headers, number = await register_doctor(client)
+
+    bookings = booking_candidates(doctor_ids, schedules, max(last_date, date.today()) + timedelta(days=1), slot_duration_minutes)
+
+    def book(i):
+        # Consecutive slots of a doctor and day go to different patients
+        doctor_id, booking_date, minute = next(bookings)
+        return "POST", f"/appointment/create-appointment/{doctor_id}", {"headers": patient_headers[i % len(patient_headers)], "json": {
+            "date": booking_date.isoformat(),
+            "start_time": slot_engine.format_minutes(minute),
+            "end_time": slot_engine.format_minutes(minute + slot_duration_minutes),
+            "reason_for_visit": "Query budget check",
+        }}
+
+    beyond_horizon = date.today() + timedelta(days=slot_calendar.SLOT_HORIZON_DAYS)
+    beyond_horizon_params = {"from_date": beyond_horizon.isoformat(), "to_date": (beyond_horizon + timedelta(days=6)).isoformat()}
+    slot_url = f"/appointment/select-appointment-slot/{doctor_ids[0]}"
+
+    return {
+        ("POST", "/auth/token"): [
+            ("POST", "/auth/token", {"data": {"username": username, "password": TEST_PASSWORD}})
+            for username in patient_usernames
+        ],
+        ("GET", "/patient/doctors-list"): [
+            ("GET", "/patient/doctors-list", {"headers": patient_headers[0], "params": {"skip": skip, "limit": 10}})
+            for skip in (0, 10)
+        ],
+        ("POST", "/doctor/doctor-profile"): [
+            ("POST", "/doctor/doctor-profile", {"headers": new_doctor_headers, "json": doctor_profile_payload(number)})
+        ],
+        ("GET", "/doctor/doctor-profile/{doctor_id}"): [
+            ("GET", f"/doctor/doctor-profile/{doctor_id}", {"headers": admin_headers})
+            for doctor_id in doctor_ids[:2]
+        ],
+        ("PATCH", "/doctor/doctor-verification/{verification_id}"): [
+            ("PATCH", f"/doctor/doctor-verification/{verification_id}", {
+                "headers": admin_headers, "json": {"status": VerificationStatus.APPROVED.value, "notes": "Query budget check"}
+            })
+        ] * 2,
+        # The calendar window, a window the calendar does not cover, then the cached one
+        ("GET", "/appointment/select-appointment-slot/{doctor_id}"): [
+            ("GET", slot_url, {"headers": patient_headers[0], "params": {"limit_days": 7}}),
+            ("GET", slot_url, {"headers": patient_headers[0], "params": beyond_horizon_params}),
+            ("GET", slot_url, {"headers": patient_headers[0], "params": {"limit_days": 7}}),
+        ],
+        ("POST", "/appointment/create-appointment/{doctor_id}"): [book(0), book(1)],
+        ("GET", "/admin/dcotor-profile-with-doctor-verifications/"): [
+            ("GET", "/admin/dcotor-profile-with-doctor-verifications/", {"headers": admin_headers, "params": {"skip": skip, "limit": 10}})
+            for skip in (0, 10)
+        ],
+    }
+
+
+def budgeted_routes():
+    return {
+        (method, route.path): route.endpoint.query_budget
+        for route in app.routes
+        if hasattr(getattr(route, "endpoint", None), "query_budget")
+        for method in route.methods
+    }
+
+
+async def run(profile: WorkloadProfile, skip_seed: bool):
+    try:
+        if not skip_seed:
+            async with AsyncSessionLocal() as db:
+                await generate_workload(db=db, profile=profile)
+        await ensure_admin()
+
+        results, failures = {}, []
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://query-budgets") as client:
+                requests = await budget_requests(client, profile.slot_duration_minutes)
+
+                for (method, path), budget in sorted(budgeted_routes().items()):
+                    if (method, path) not in requests:
+                        failures.append(f"{method} {path}: has a budget of {budget} but no request in this check")
+                        continue
+
+                    statements = []
+                    for request_method, url, kwargs in requests[(method, path)]:
+                        try:
+                            response = await client.request(request_method, url, **kwargs)
+                        except QueryBudgetExceeded as e:
+                            failures.append(str(e))
+                            continue
+                        statements.append(int(response.headers["x-db-queries"]))
+                        if response.status_code >= 400:
+                            failures.append(f"{request_method} {url}: {response.status_code} {response.text[:200]}")
+
+                    results[f"{method} {path}"] = {"budget": budget, "statements": statements}
+    finally:
+        await async_engine.dispose()
+
+    return {
+        "revision": git_revision(),
+        "database": async_engine.dialect.name,
+        "routes": results,
+        "failures": failures,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail when a route goes over its declared query budget")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data of an earlier run")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--doctors", type=int, default=20)
+    parser.add_argument("--patients", type=int, default=100)
+    parser.add_argument("--history-days", type=int, default=14)
+    args = parser.parse_args()
+
+    profile = WorkloadProfile(seed=args.seed, doctors=args.doctors, patients=args.patients, history_days=args.history_days)
+    # The startup hooks print their warnings, keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run(profile, args.skip_seed))
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["failures"] else 0)
@@ -0,0 +1,257 @@
+import argparse
+import asyncio
+import json
+import sys
+from datetime import date
+from types import SimpleNamespace
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import init # noqa: F401  registers every model on the mapper
+from appointment import interface as appointment_interface
+from appointment import slot_cache, slot_calendar
+from db.session import async_engine
+from doctor import interface as doctor_interface
+
+
+# Query plan regression check for the hot paths of appointment.interface and doctor.interface.
+#
+# Seeds large synthetic tables inside one transaction, runs every hot interface call while
+# capturing the SELECT statements it issues, EXPLAINs each of them and fails when a plan
+# falls back to a sequential scan over appointments, doctor_slot or any other large table,
+# or when a listing or slot path reads its table without an index. Everything is rolled back
+# at the end.
+# Runs on the async engine the application uses, so the plans are those of the asyncpg statements.
+#
+#   python -m benchmarks.query_plans --doctors 2000 --patients 20000 --days 30
+
+
+SEED_SQL = [
+    # Doctors, patients and their users
+    """
+    INSERT INTO users (username, first_name, last_name, age, gender, mobile_no, gmail, user_role, password, status, is_profile_created, created_at)
+    SELECT 'qp_doctor_' || g, 'Doctor', 'No' || g, 30 + g % 30, 'MALE', '+7' || lpad(g::text, 12, '0'),
+           'doctor' || g || '@example.com', 'DOCTOR', 'x', 'ACTIVE', true, now()
+    FROM generate_series(1, CAST(:doctors AS integer)) AS g
+    """,
+    """
+    INSERT INTO users (username, first_name, last_name, age, gender, mobile_no, gmail, user_role, password, status, is_profile_created, created_at)
+    SELECT 'qp_patient_' || g, 'Patient', 'No' || g, 18 + g % 60, 'FEMALE', '+8' || lpad(g::text, 12, '0'),
+           'patient' || g || '@example.com', 'PATIENT', 'x', 'ACTIVE', true, now()
+    FROM generate_series(1, CAST(:patients AS integer)) AS g
+    """,
+    """
+    INSERT INTO doctors (user_id, speciality, experience, consultation_fee, bio, is_verified, created_at)
+    SELECT id, (ARRAY['Cardiology', 'Dermatology', 'Neurology', 'Pediatrics', 'Orthopedics'])[1 + id % 5],
+           1 + id % 20, 500 + id % 4500, 'Seeded doctor', id % 20 = 0, now()
+    FROM users WHERE username LIKE 'qp_doctor_%'
+    """,
+    """
+    INSERT INTO patient (user_id, visit_count, is_deleted, created_at)
+    SELECT id, 0, false, now() FROM users WHERE username LIKE 'qp_patient_%'
+    """,
+    # One clinic with an address per doctor
+    """
+    INSERT INTO address (street_address, area_name, city, state, pincode, country, address_type, created_at)
+    SELECT 'qp_clinic_' || d.id, 'Downtown', (ARRAY['Delhi', 'Mumbai', 'Bangalore'])[1 + d.id % 3],
+           'State', 100000 + d.id, 'India', 'WORK', now()
+    FROM doctors d JOIN users u ON u.id = d.user_id WHERE u.username LIKE 'qp_doctor_%'
+    """,
+    """
+    INSERT INTO doctor_clinics (doctor_id, address_id, clinic_name, clinic_phone, is_primary_location, consultation_hours_notes, created_at)
+    SELECT substring(a.street_address FROM 11)::int, a.id, 'Clinic ' || a.id, '+9' || lpad(a.id::text, 12, '0'), true, '9 to 5', now()
+    FROM address a WHERE a.street_address LIKE 'qp_clinic_%'
+    """,
+    # Weekday availability and appointment history on every working day
+    """
+    INSERT INTO doctor_availability (doctor_id, clinic_id, days_of_week, start_time, end_time, is_available, created_at)
+    SELECT c.doctor_id, c.id, day::days, '09:00', '17:00', true, now()
+    FROM doctor_clinics c
+    CROSS JOIN unnest(ARRAY['MONDAY', 'TUESDAY', 'WEDNESDAY', 'THURSDAY', 'FRIDAY']) AS day
+    WHERE c.consultation_hours_notes = '9 to 5'
+    """,
+    """
+    INSERT INTO appointments (patient_id, doctor_id, clinic_id, date, start_time, end_time, fees, reason_for_visit,
+                              payment_status, appointment_status, created_at)
+    SELECT p.min_id + (c.doctor_id * 31 + day_offset * 7 + slot) % p.patient_count,
+           c.doctor_id, c.id, current_date - CAST(:days AS integer) + day_offset,
+           time '09:00' + slot * interval '30 minutes', time '09:30' + slot * interval '30 minutes',
+           500, 'Seeded visit', 'PENDING', 'COMPLETED', now()
+    FROM doctor_clinics c
+    CROSS JOIN generate_series(0, CAST(:days AS integer) * 2) AS day_offset
+    CROSS JOIN generate_series(0, CAST(:slots AS integer) - 1) AS slot
+    CROSS JOIN (
+        SELECT min(pt.id) AS min_id, count(*) AS patient_count
+        FROM patient pt JOIN users u ON u.id = pt.user_id WHERE u.username LIKE 'qp_patient_%'
+    ) AS p
+    WHERE c.consultation_hours_notes = '9 to 5'
+    """,
+    """
+    INSERT INTO doctor_verifications (doctor_id, status, requested_at, created_at)
+    SELECT c.doctor_id, 'PENDING', now(), now() FROM doctor_clinics c WHERE c.consultation_hours_notes = '9 to 5'
+    """,
+]
+
+# Doctors whose slot calendar is built per statement while seeding
+CALENDAR_CHUNK_SIZE = 1000
+
+# A sequential scan over these fails the check whatever their size
+GUARDED_TABLES = {"appointments", "doctor_slot"}
+
+SEEDED_TABLES = [
+    "users", "doctors", "patient", "address", "doctor_clinics",
+    "doctor_availability", "appointments", "doctor_verifications", "doctor_slot",
+]
+
+
+async def seed(connection, doctors: int, patients: int, days: int, slots: int):
+    for statement in SEED_SQL:
+        await connection.execute(text(statement), {"doctors": doctors, "patients": patients, "days": days, "slots": slots})
+
+    # The calendar is built by the application code, its masks match the availability and the seeded appointments
+    doctor_ids = (await connection.scalars(
+        text("SELECT doctor_id FROM doctor_clinics WHERE consultation_hours_notes = '9 to 5' ORDER BY doctor_id")
+    )).all()
+    async with AsyncSession(bind=connection, join_transaction_mode="create_savepoint") as db:
+        for chunk_start in range(0, len(doctor_ids), CALENDAR_CHUNK_SIZE):
+            await db.run_sync(
+                slot_calendar.build_doctor_calendars,
+                doctor_ids=doctor_ids[chunk_start:chunk_start + CALENDAR_CHUNK_SIZE],
+                start_date=date.today()
+            )
+        await db.commit()
+
+    for table in SEEDED_TABLES:
+        await connection.execute(text(f"ANALYZE {table}"))
+
+
+async def seeded_ids(connection):
+    row = (await connection.execute(text("""
+        SELECT d.id AS doctor_id, d.user_id AS doctor_user_id,
+               (SELECT pt.user_id FROM appointments a JOIN patient pt ON pt.id = a.patient_id
+                WHERE a.doctor_id = d.id LIMIT 1) AS patient_user_id
+        FROM doctors d JOIN doctor_clinics c ON c.doctor_id = d.id
+        WHERE d.is_verified AND c.consultation_hours_notes = '9 to 5'
+        ORDER BY d.id DESC LIMIT 1
+    """))).one()
+    return SimpleNamespace(**row._mapping)
+
+
+async def _live_slots(db, ids):
+    slot_calendar.SLOT_READ_MODEL = "live"
+    try:
+        return await appointment_interface.get_doctor_all_slot(db=db, doctor_id=ids.doctor_id)
+    finally:
+        slot_calendar.SLOT_READ_MODEL = "calendar"
+
+
+HOT_PATHS = {
+    "appointment.get_doctor_all_slot (calendar)": lambda db, ids: appointment_interface.get_doctor_all_slot(db=db, doctor_id=ids.doctor_id),
+    "appointment.get_doctor_all_slot (live)": _live_slots,
+    "appointment.get_all_patient_appointments": lambda db, ids: appointment_interface.get_all_patient_appointments(db=db, user_id=ids.patient_user_id),
+    "appointment.get_all_doctor_appointments": lambda db, ids: appointment_interface.get_all_doctor_appointments(db=db, user_id=ids.doctor_user_id),
+    "appointment.get_earliest_available_doctors": lambda db, ids: appointment_interface.get_earliest_available_doctors(db=db, speciality="cardiology", city="delhi"),
+    "doctor.get_doctor_profile": lambda db, ids: doctor_interface.get_doctor_profile(db=db, doctor_id=ids.doctor_id),
+    "doctor.get_doctor_by_user_id": lambda db, ids: doctor_interface.get_doctor_by_user_id(db=db, user_id=ids.doctor_user_id),
+    "doctor.get_doctors_list_for_patients": lambda db, ids: doctor_interface.get_doctors_list_for_patients(db=db, skip=0, limit=10),
+    "doctor.get_doctor_verification_profile": lambda db, ids: doctor_interface.get_doctor_verification_profile(db=db, doctor_id=ids.doctor_id),
+}
+
+
+# Tables the listing and slot paths must read through an index in at least one of their statements
+INDEXED_READS = {
+    "appointment.get_doctor_all_slot (calendar)": {"doctor_slot"},
+    "appointment.get_doctor_all_slot (live)": {"appointments"},
+    "appointment.get_all_patient_appointments": {"appointments"},
+    "appointment.get_all_doctor_appointments": {"appointments"},
+    "appointment.get_earliest_available_doctors": {"doctor_slot"},
+}
+
+INDEX_SCANS = {"Index Scan", "Index Only Scan", "Bitmap Heap Scan"}
+
+
+async def capture_statements(connection, ids, hot_path):
+    statements = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    db = AsyncSession(bind=connection, join_transaction_mode="create_savepoint")
+    event.listen(connection.sync_connection, "before_cursor_execute", collect)
+    try:
+        slot_cache.slot_cache.clear()
+        await hot_path(db, ids)
+    finally:
+        event.remove(connection.sync_connection, "before_cursor_execute", collect)
+        await db.close()
+    return statements
+
+
+def scanned_tables(plan: dict, node_types: set):
+    """Relations read by the plan nodes of these types"""
+    found = set()
+    if plan.get("Node Type") in node_types and plan.get("Relation Name"):
+        found.add(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found |= scanned_tables(child, node_types)
+    return found
+
+
+async def run(doctors: int, patients: int, days: int, slots: int, min_rows: int, verbose: bool):
+    if async_engine.dialect.name != "postgresql":
+        print("Query plan checks need the Postgres database configured in db.session")
+        return 2
+
+    failures = []
+    async with async_engine.connect() as connection:
+        transaction = await connection.begin()
+        try:
+            await seed(connection, doctors, patients, days, slots)
+            ids = await seeded_ids(connection)
+
+            large_tables = {
+                relname for (relname,) in await connection.execute(
+                    text("SELECT relname FROM pg_class WHERE relkind = 'r' AND reltuples >= :min_rows"),
+                    {"min_rows": min_rows}
+                )
+            }
+
+            for name, hot_path in HOT_PATHS.items():
+                index_reads = set()
+
+                for statement, parameters in await capture_statements(connection, ids, hot_path):
+                    plan = (await connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters)).scalar()
+                    plan = plan if isinstance(plan, list) else json.loads(plan)
+                    scanned = scanned_tables(plan[0]["Plan"], {"Seq Scan"}) & (large_tables | GUARDED_TABLES)
+                    index_reads |= scanned_tables(plan[0]["Plan"], INDEX_SCANS)
+
+                    if verbose or scanned:
+                        print(f"--- {name}\n{statement}\n{json.dumps(plan[0]['Plan'], indent=2)}\n")
+                    if scanned:
+                        failures.append(f"{name}: sequential scan on {', '.join(sorted(scanned))}")
+
+                missing = INDEXED_READS.get(name, set()) - index_reads
+                if missing:
+                    failures.append(f"{name}: no index read on {', '.join(sorted(missing))}")
+        finally:
+            await transaction.rollback()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print(f"{len(HOT_PATHS)} hot paths checked, {len(failures)} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail when a hot query plan falls back to a sequential scan")
+    parser.add_argument("--doctors", type=int, default=2000)
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--days", type=int, default=30, help="days of appointment history before and after today")
+    parser.add_argument("--slots", type=int, default=4, help="appointments per doctor and day")
+    parser.add_argument("--min-rows", type=int, default=5000, help="tables with at least this many rows count as large")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(run(args.doctors, args.patients, args.days, args.slots, args.min_rows, args.verbose)))
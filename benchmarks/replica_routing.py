@@ -0,0 +1,179 @@
+import os
+import shutil
+import tempfile
+
+# Two local SQLite files stand in for the primary and its replica, set before db.session builds the engines
+CHECK_DIRECTORY = tempfile.mkdtemp(prefix="replica_routing_")
+PRIMARY_PATH = os.path.join(CHECK_DIRECTORY, "primary.db")
+REPLICA_PATH = os.path.join(CHECK_DIRECTORY, "replica.db")
+READ_YOUR_WRITES_SECONDS = 1.0
+
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{PRIMARY_PATH}",
+    "READ_DATABASE_URL": f"sqlite+aiosqlite:///{REPLICA_PATH}",
+    "READ_YOUR_WRITES_SECONDS": str(READ_YOUR_WRITES_SECONDS),
+    "READ_YOUR_WRITES_BACKEND": "local",
+})
+
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+from collections import Counter
+from datetime import date, timedelta
+
+import httpx
+from sqlalchemy import event, func, select
+
+from main import app
+from appointment import slot_engine
+from appointment.models import Appointment
+from benchmarks.endpoints import BENCHMARK_ADMIN, booking_candidates, ensure_admin, git_revision, login, seeded_users
+from db.session import AsyncSessionLocal, async_engine, async_read_engine, engine
+from populate_db.schema import WorkloadProfile
+from populate_db.workload import generate_workload
+
+
+# Read replica routing check: seeds a primary, copies it to a replica that never receives
+# another write, then asserts which engine every request runs its statements on. Read-only
+# GETs go to the replica, writes go to the primary, and so do the writer's own reads until
+# their read-your-writes window closes, even after a replica read of the same slots. Exits
+# with 1 when a request hits the wrong engine or sees the wrong data.
+#
+#   python -m benchmarks.replica_routing
+
+
+# Engine name -> statements of the current request
+statements_by_engine = Counter()
+
+
+def count_statements(name: str):
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements_by_engine[name] += 1
+    return before_cursor_execute
+
+
+async def seed(profile: WorkloadProfile):
+    async with AsyncSessionLocal() as db:
+        await generate_workload(db=db, profile=profile)
+    await ensure_admin()
+
+    patient_usernames, doctor_ids, schedules = await seeded_users(2)
+    async with AsyncSessionLocal() as db:
+        last_date = await db.scalar(select(func.max(Appointment.date))) or date.today()
+
+    first_date = max(last_date, date.today()) + timedelta(days=1)
+    booking = next(booking_candidates(doctor_ids, schedules, first_date, profile.slot_duration_minutes))
+    return patient_usernames, booking
+
+
+async def run(profile: WorkloadProfile):
+    (patient_username, other_patient_username), (doctor_id, booking_date, minute) = await seed(profile)
+    slot_label = f"{slot_engine.format_minutes(minute)}-{slot_engine.format_minutes(minute + profile.slot_duration_minutes)}"
+
+    # The replica is a snapshot of the seeded primary, later writes only reach the primary
+    await async_engine.dispose()
+    engine.dispose()
+    shutil.copyfile(PRIMARY_PATH, REPLICA_PATH)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_statements("primary"))
+    event.listen(async_read_engine.sync_engine, "before_cursor_execute", count_statements("replica"))
+
+    checks = []
+
+    async def check(name: str, expected_engine: str, method: str, url: str, data_check=None, **kwargs):
+        statements_by_engine.clear()
+        response = await client.request(method, url, **kwargs)
+
+        engines = dict(statements_by_engine)
+        other_engine = "replica" if expected_engine == "primary" else "primary"
+        failures = []
+        if response.status_code >= 400:
+            failures.append(f"{response.status_code} {response.text[:200]}")
+        if not engines.get(expected_engine) or engines.get(other_engine):
+            failures.append(f"expected every statement on the {expected_engine}")
+        if data_check and response.status_code < 400 and not data_check(response.json()):
+            failures.append("unexpected data for this engine")
+
+        checks.append({"check": name, "expected_engine": expected_engine, "statements": engines, "failures": failures})
+
+    def slot_is_free(slots):
+        return any(day["date"] == booking_date.strftime("%y-%m-%d") and slot_label in day["time_slot"] for day in slots["slots"])
+
+    def slot_params(days: int):
+        # A different window every time, a cached response would run no statements at all
+        return {"from_date": booking_date.isoformat(), "to_date": (booking_date + timedelta(days=days - 1)).isoformat()}
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replica-routing") as client:
+            patient_headers = await login(client, patient_username)
+            other_patient_headers = await login(client, other_patient_username)
+            admin_headers = await login(client, BENCHMARK_ADMIN)
+            # Resolve every identity once, the identity lookup always runs on the primary
+            for headers in (patient_headers, other_patient_headers, admin_headers):
+                await client.get("/users/user", headers=headers)
+
+            slot_url = f"/appointment/select-appointment-slot/{doctor_id}"
+
+            await check("doctors list", "replica", "GET", "/patient/doctors-list", headers=patient_headers)
+            await check("doctor profile", "replica", "GET", f"/doctor/doctor-profile/{doctor_id}", headers=admin_headers)
+            await check(
+                "slots before booking", "replica", "GET", slot_url, slot_is_free,
+                headers=patient_headers, params=slot_params(1)
+            )
+            await check(
+                "booking", "primary", "POST", f"/appointment/create-appointment/{doctor_id}",
+                headers=patient_headers, json={
+                    "date": booking_date.isoformat(),
+                    "start_time": slot_engine.format_minutes(minute),
+                    "end_time": slot_engine.format_minutes(minute + profile.slot_duration_minutes),
+                    "reason_for_visit": "Replica routing check",
+                }
+            )
+            # The replica has not seen the booking, its slots must not be cached for the writer
+            await check(
+                "another patient's slots inside the window", "replica", "GET", slot_url, slot_is_free,
+                headers=other_patient_headers, params=slot_params(2)
+            )
+            await check(
+                "slots inside the read-your-writes window", "primary", "GET", slot_url,
+                lambda slots: not slot_is_free(slots), headers=patient_headers, params=slot_params(2)
+            )
+            await check(
+                "another user inside the window", "replica", "GET", f"/doctor/doctor-profile/{doctor_id}", headers=admin_headers
+            )
+
+            await asyncio.sleep(READ_YOUR_WRITES_SECONDS + 0.5)
+            # Back on the replica, which never received the booking
+            await check(
+                "slots after the window", "replica", "GET", slot_url, slot_is_free,
+                headers=patient_headers, params=slot_params(3)
+            )
+
+    shutil.rmtree(CHECK_DIRECTORY, ignore_errors=True)
+
+    return {
+        "revision": git_revision(),
+        "read_your_writes_seconds": READ_YOUR_WRITES_SECONDS,
+        "checks": checks,
+        "failed": [entry["check"] for entry in checks if entry["failures"]],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assert which engine the read and write endpoints run on")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--doctors", type=int, default=5)
+    parser.add_argument("--patients", type=int, default=20)
+    args = parser.parse_args()
+
+    profile = WorkloadProfile(seed=args.seed, doctors=args.doctors, patients=args.patients, history_days=7)
+    # The startup hooks print their warnings, keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run(profile))
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["failed"] else 0)
@@ -0,0 +1,171 @@
+import argparse
+import contextlib
+import io
+import random
+import time as timer
+from datetime import datetime, time, timedelta
+from types import SimpleNamespace
+
+from appointment import slot_engine
+from doctor.models import Days
+
+
+# Micro-benchmark of the slot generation engine against the previous
+# per-slot datetime implementation, run with: python -m benchmarks.slot_generation
+
+
+def dense_weekly_schedule(doctor_id: int, windows_per_day: int):
+    availabilities = []
+    window_length = (14 * 60) // windows_per_day
+    for day in Days:
+        for window in range(windows_per_day):
+            start_minute = 7 * 60 + window * window_length
+            end_minute = start_minute + window_length - 10
+            availabilities.append(SimpleNamespace(
+                doctor_id=doctor_id,
+                clinic_id=1,
+                days_of_week=day,
+                start_time=time(start_minute // 60, start_minute % 60),
+                end_time=time(end_minute // 60, end_minute % 60),
+                is_available=True
+            ))
+    return availabilities
+
+
+def random_bookings(availabilities, horizon_days: int, slot_duration_minutes: int, booked_ratio: float, seed: int):
+    rng = random.Random(seed)
+    today = datetime.today().date()
+    bookings = {}
+    for i in range(horizon_days):
+        current_date = today + timedelta(days=i)
+        day_name = current_date.strftime("%A").lower()
+        day_bookings = []
+        for availability in availabilities:
+            if availability.days_of_week.value != day_name:
+                continue
+            start = datetime.combine(current_date, availability.start_time)
+            end = datetime.combine(current_date, availability.end_time)
+            while start < end:
+                if rng.random() < booked_ratio:
+                    day_bookings.append((start.time(), (start + timedelta(minutes=slot_duration_minutes)).time()))
+                start += timedelta(minutes=slot_duration_minutes)
+        bookings[current_date] = day_bookings
+    return bookings
+
+
+def legacy_slots(doctor_id, doctor_availability, bookings, slot_duration_minutes, horizon_days):
+    """Previous implementation, with the per-day booked query served from memory"""
+    today = datetime.today().date()
+    slots = []
+
+    for i in range(horizon_days):
+        current_date = today + timedelta(days=i)
+        day_name = current_date.strftime("%A").lower()
+        print(f"Checking slots for date: {current_date} ({day_name})")
+
+        for availability in doctor_availability:
+            print(f"  Availability: doctor_id={availability.doctor_id}, day={availability.days_of_week.value}, is_available={availability.is_available}")
+
+            if (
+                availability.doctor_id == doctor_id and
+                availability.days_of_week.value == day_name and
+                availability.is_available
+            ):
+                start_time = datetime.combine(current_date, availability.start_time)
+                end_time = datetime.combine(current_date, availability.end_time)
+
+                time_slots = []
+                while start_time < end_time:
+                    if current_date == today and start_time < datetime.now():
+                        start_time += timedelta(minutes=slot_duration_minutes)
+                        continue
+
+                    slot_start = start_time.strftime("%H:%M")
+                    slot_end = (start_time + timedelta(minutes=slot_duration_minutes)).strftime("%H:%M")
+                    time_slots.append(f"{slot_start}-{slot_end}")
+                    start_time += timedelta(minutes=slot_duration_minutes)
+
+                slots.append({
+                    "doctor_id": doctor_id,
+                    "date": current_date.strftime("%y-%m-%d"),
+                    "day": day_name,
+                    "time_slot": time_slots
+                })
+
+    filtered_slots = []
+    for day_slot in slots:
+        date_obj = datetime.strptime(day_slot["date"], "%y-%m-%d").date()
+        booked_time_ranges = [
+            f"{start.strftime('%H:%M')}-{end.strftime('%H:%M')}"
+            for start, end in bookings.get(date_obj, [])
+        ]
+        available_time_slots = [
+            slot for slot in day_slot["time_slot"]
+            if slot not in booked_time_ranges
+        ]
+        if available_time_slots:
+            filtered_slots.append({**day_slot, "time_slot": available_time_slots})
+
+    return filtered_slots
+
+
+def engine_slots(doctor_id, doctor_availability, bookings, slot_duration_minutes, horizon_days):
+    now = datetime.now()
+    weekly_masks = slot_engine.weekly_open_masks(doctor_availability)
+
+    filtered_slots = []
+    for current_date, day_name, open_mask in slot_engine.day_open_masks(weekly_masks, now.date(), horizon_days):
+        booked_mask = 0
+        for start, end in bookings.get(current_date, []):
+            booked_mask |= slot_engine.minute_range_mask(slot_engine.to_minutes(start), slot_engine.to_minutes(end))
+
+        not_before = slot_engine.to_minutes(now.time()) if current_date == now.date() else 0
+        available_time_slots = slot_engine.available_time_slots(open_mask, booked_mask, slot_duration_minutes, not_before)
+        if available_time_slots:
+            filtered_slots.append({
+                "doctor_id": doctor_id,
+                "date": current_date.strftime("%y-%m-%d"),
+                "day": day_name,
+                "time_slot": available_time_slots
+            })
+
+    return filtered_slots
+
+
+def measure(fn, repeat: int, *args):
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            started = timer.perf_counter()
+            fn(*args)
+            timings.append(timer.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def run(horizons, slot_durations, windows_per_day: int, booked_ratio: float, repeat: int, seed: int):
+    doctor_id = 1
+    availabilities = dense_weekly_schedule(doctor_id, windows_per_day)
+
+    print(f"{'horizon':>8} {'slot':>5} {'legacy ms':>10} {'engine ms':>10} {'speedup':>8}")
+    for horizon_days in horizons:
+        for slot_duration_minutes in slot_durations:
+            bookings = random_bookings(availabilities, horizon_days, slot_duration_minutes, booked_ratio, seed)
+            args = (doctor_id, availabilities, bookings, slot_duration_minutes, horizon_days)
+
+            legacy = measure(legacy_slots, repeat, *args)
+            engine = measure(engine_slots, repeat, *args)
+            print(f"{horizon_days:>8} {slot_duration_minutes:>5} {legacy * 1000:>10.2f} {engine * 1000:>10.2f} {legacy / engine:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the slot engine with the previous slot generation")
+    parser.add_argument("--horizons", type=int, nargs="+", default=[30, 90, 180])
+    parser.add_argument("--slot-durations", type=int, nargs="+", default=[15, 30])
+    parser.add_argument("--windows-per-day", type=int, default=4)
+    parser.add_argument("--booked-ratio", type=float, default=0.4)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    run(args.horizons, args.slot_durations, args.windows_per_day, args.booked_ratio, args.repeat, args.seed)
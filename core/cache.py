@@ -0,0 +1,199 @@
+import json
+import select
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+from sqlalchemy import text
+
+
+# Every cache registers itself here so its counters can be exposed by the admin api
+CACHES: Dict[str, "TTLCache"] = {}
+
+
+class TTLCache:
+    """Thread safe LRU cache with a per entry time to live and tag based invalidation"""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._tags = defaultdict(set)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+        CACHES[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value, _ = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[Hashable] = (), ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        tags = tuple(tags)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (expires_at, value, tags)
+            for tag in tags:
+                self._tags[tag].add(key)
+
+            while len(self._entries) > self.maxsize:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def invalidate_tag(self, tag: Hashable, predicate: Optional[Callable[[Hashable], bool]] = None):
+        """Drop every entry carrying the tag, or only the ones whose key matches the predicate"""
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                if predicate is None or predicate(key):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: Hashable):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+# Invalidation backends, used to share invalidations between uvicorn workers
+
+class InvalidationBackend:
+    """In-process backend, invalidations only reach the current worker"""
+
+    async def publish_in_transaction(self, db, channel: str, messages: List[dict]):
+        """Publish through the caller's AsyncSession, sent when it commits and dropped on rollback"""
+        pass
+
+    def publish_in_session(self, session, channel: str, messages: List[dict]):
+        """publish_in_transaction for session event hooks, which get the sync Session and can not await"""
+        pass
+
+    def subscribe(self, channel: str, callback: Callable[[dict], None]):
+        pass
+
+
+class PostgresNotifyBackend(InvalidationBackend):
+    """Broadcasts invalidations to every worker through Postgres LISTEN/NOTIFY"""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._listeners = {}
+
+    def _connect(self):
+        import psycopg2
+
+        connection = psycopg2.connect(self.dsn)
+        connection.autocommit = True
+        return connection
+
+    def _notify_statement(self, channel: str, messages: List[dict]):
+        # NOTIFY is transactional, the other workers only hear about committed changes
+        return (
+            text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+            {"channel": channel, "payloads": [json.dumps(message, default=str) for message in messages]}
+        )
+
+    async def publish_in_transaction(self, db, channel: str, messages: List[dict]):
+        if messages:
+            await db.execute(*self._notify_statement(channel, messages))
+
+    def publish_in_session(self, session, channel: str, messages: List[dict]):
+        # Inside AsyncSession.commit the sync Session runs on the async driver, this does not block the loop
+        if messages:
+            session.execute(*self._notify_statement(channel, messages))
+
+    def subscribe(self, channel: str, callback: Callable[[dict], None]):
+        if channel in self._listeners:
+            return
+
+        listener = threading.Thread(
+            target=self._listen,
+            args=(channel, callback),
+            name=f"cache-invalidation-{channel}",
+            daemon=True
+        )
+        self._listeners[channel] = listener
+        listener.start()
+
+    def _listen(self, channel: str, callback: Callable[[dict], None]):
+        while True:
+            try:
+                connection = self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{channel}"')
+
+                while True:
+                    if select.select([connection], [], [], 5) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        callback(json.loads(notify.payload))
+            except Exception as e:
+                print(f"Warning: cache invalidation listener on {channel} failed, retrying: {e}")
+                time.sleep(5)
+
+
+def get_invalidation_backend(name: str, dsn: Optional[str] = None) -> InvalidationBackend:
+    if name == "postgres":
+        if not dsn:
+            raise ValueError("The postgres invalidation backend needs a database dsn")
+        return PostgresNotifyBackend(dsn)
+    return InvalidationBackend()
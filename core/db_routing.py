@@ -0,0 +1,85 @@
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.cache import TTLCache, get_invalidation_backend
+from core.security import get_token_payload, optional_oauth2_scheme
+from db.session import READ_DATABASE_URL, AsyncReadSessionLocal, engine, get_db
+
+load_dotenv()
+
+
+# After a user's own commit their reads stay on the primary for this long, so replica lag never hides the write
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+READ_YOUR_WRITES_MAXSIZE = int(os.getenv("READ_YOUR_WRITES_MAXSIZE", "100000"))
+# "local" keeps the window inside the worker, "postgres" shares it with every worker through LISTEN/NOTIFY
+READ_YOUR_WRITES_BACKEND = os.getenv("READ_YOUR_WRITES_BACKEND", "local")
+READ_YOUR_WRITES_CHANNEL = "recent_writes"
+
+
+# User id -> True while the user is inside their read-your-writes window
+recent_writers = TTLCache("recent_writers", maxsize=READ_YOUR_WRITES_MAXSIZE, ttl=READ_YOUR_WRITES_SECONDS)
+
+recent_writes_backend = get_invalidation_backend(
+    READ_YOUR_WRITES_BACKEND,
+    dsn=engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+)
+
+
+def _token_user_id(token: Optional[str]) -> Optional[int]:
+    if not token:
+        return None
+
+    payload = get_token_payload(token=token)
+    if not payload:
+        return None
+    return payload.get("id")
+
+
+def mark_recent_write(user_id: int):
+    recent_writers.set(user_id, True)
+
+
+def publish_recent_write(session, user_id: int):
+    """Tell the other workers with the commit itself, they open the window only if it goes through"""
+    recent_writes_backend.publish_in_session(session, READ_YOUR_WRITES_CHANNEL, [{"user_id": user_id}])
+
+
+def start_recent_writes_listener():
+    recent_writes_backend.subscribe(
+        READ_YOUR_WRITES_CHANNEL,
+        lambda message: recent_writers.set(message["user_id"], True)
+    )
+
+
+async def get_write_db(
+    db: AsyncSession = Depends(get_db),
+    token: Optional[str] = Depends(optional_oauth2_scheme)
+):
+    """Primary session, every commit made on it opens the caller's read-your-writes window"""
+    user_id = _token_user_id(token)
+
+    if user_id is not None and READ_DATABASE_URL:
+        event.listen(db.sync_session, "before_commit", lambda session: publish_recent_write(session, user_id))
+        event.listen(db.sync_session, "after_commit", lambda session: mark_recent_write(user_id))
+
+    return db
+
+
+async def get_read_db(
+    primary_db: AsyncSession = Depends(get_db),
+    token: Optional[str] = Depends(optional_oauth2_scheme)
+):
+    """Replica session for read-only endpoints, the primary one while the caller's own writes may not have replicated"""
+    user_id = _token_user_id(token)
+
+    if not READ_DATABASE_URL or (user_id is not None and recent_writers.get(user_id)):
+        yield primary_db
+        return
+
+    async with AsyncReadSessionLocal() as db:
+        yield db
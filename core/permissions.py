@@ -4,13 +4,13 @@ from fastapi import Depends, HTTPException, status
 
 from core.security import get_current_user
 from user.models import UserRole
-from user.schemas import UserDB
+from user.schemas import CurrentUser
 
 
 def role_required(allowed_user_roles: List[UserRole]):
     
     def wrapper(
-        current_user: UserDB = Depends(get_current_user)
+        current_user: CurrentUser = Depends(get_current_user)
     ):
         if not current_user:
             raise HTTPException(
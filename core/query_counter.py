@@ -0,0 +1,143 @@
+import contextvars
+import os
+import re
+import time
+from collections import Counter
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+load_dotenv()
+
+
+# "off" only sets the headers, "warn" prints budget and repeated statement violations,
+# "raise" fails the request with QueryBudgetExceeded, meant for tests and benchmark runs
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "off")
+# The same statement executed more often than this in one request is reported as an N+1,
+# above the seven inserts of a doctor's weekly availability
+QUERY_REPEAT_LIMIT = int(os.getenv("QUERY_REPEAT_LIMIT", "10"))
+# Budget of the routes that do not declare their own, unset means no budget
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT")) if os.getenv("QUERY_BUDGET_DEFAULT") else None
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestQueries:
+    """Statements and database time of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[re.sub(r"\s+", " ", statement).strip()] += 1
+
+
+# Set by the middleware for the request running in the current task. SQLAlchemy runs the
+# statements of an AsyncSession in greenlets that share the context of the awaiting task.
+current_request_queries: contextvars.ContextVar[Optional[RequestQueries]] = contextvars.ContextVar(
+    "current_request_queries", default=None
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info["query_started_at"].pop()
+    queries = current_request_queries.get()
+    if queries is not None:
+        queries.record(statement, time.perf_counter() - started_at)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    started_at = exception_context.connection.info.get("query_started_at") if exception_context.connection else None
+    if started_at:
+        started_at.pop()
+
+
+def instrument_queries(engine):
+    """Count the statements of a sync engine, or of an AsyncEngine through its sync_engine, per request"""
+    engine = getattr(engine, "sync_engine", engine)
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def query_budget(max_queries: int):
+    """Declare the most statements a route may run, checked by QueryCounterMiddleware"""
+    def decorator(endpoint):
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorator
+
+
+def budget_violations(route, queries: RequestQueries):
+    budget = getattr(getattr(route, "endpoint", None), "query_budget", QUERY_BUDGET_DEFAULT)
+    violations = []
+
+    if budget is not None and queries.count > budget:
+        violations.append(f"{queries.count} statements, the budget is {budget}")
+
+    for statement, count in queries.statements.most_common():
+        if count <= QUERY_REPEAT_LIMIT:
+            break
+        violations.append(f"{count} times the same statement: {statement[:200]}")
+    return violations
+
+
+class QueryCounterMiddleware:
+    """Adds X-DB-Queries and a Server-Timing db entry to every response.
+
+    Statements run after the response started, like those of a streamed body, are not included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries()
+        token = current_request_queries.set(queries)
+
+        async def send_with_query_headers(message):
+            if message["type"] == "http.response.start":
+                self.check_budget(scope, queries)
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(queries.count).encode()))
+                headers.append((b"server-timing", f'db;dur={queries.seconds * 1000:.1f};desc="{queries.count} queries"'.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_query_headers)
+        finally:
+            current_request_queries.reset(token)
+
+    def check_budget(self, scope, queries: RequestQueries):
+        if QUERY_BUDGET_MODE == "off":
+            return
+
+        violations = budget_violations(scope.get("route"), queries)
+        if not violations:
+            return
+
+        route = scope.get("route")
+        message = f"{scope['method']} {getattr(route, 'path', scope['path'])}: " + "; ".join(violations)
+        if QUERY_BUDGET_MODE == "raise":
+            raise QueryBudgetExceeded(message)
+        print(f"Warning: query budget exceeded by {message}")
@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, Set
+
+from dotenv import load_dotenv
+
+from auth.models import RevokedToken
+from db.session import SessionLocal
+
+load_dotenv()
+
+
+REVOCATION_RELOAD_SECONDS = float(os.getenv("REVOCATION_RELOAD_SECONDS", "30"))
+
+
+class RevocationSet:
+    """In-memory set of revoked access token ids, rebuilt from the revoked_tokens table on an interval.
+
+    Only access tokens are kept here, they live minutes so the set stays small. Refresh tokens
+    are checked against the table itself when they are rotated.
+    """
+
+    def __init__(self):
+        self._revoked: Set[str] = set()
+        self._added_during_reload: Optional[Set[str]] = None
+        self._lock = threading.Lock()
+        self._reloader = None
+
+    def __contains__(self, jti: Optional[str]) -> bool:
+        return jti is not None and jti in self._revoked
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def add(self, jti: str):
+        """Call after the commit that stored the revocation"""
+        with self._lock:
+            self._revoked.add(jti)
+            if self._added_during_reload is not None:
+                self._added_during_reload.add(jti)
+
+    def reload(self):
+        with self._lock:
+            self._added_during_reload = set()
+
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            db.query(RevokedToken).filter(RevokedToken.expires_at < now).delete(synchronize_session=False)
+            db.commit()
+            revoked = {
+                jti for (jti,) in db.query(RevokedToken.jti).filter(RevokedToken.token_type == "access")
+            }
+        finally:
+            db.close()
+
+        # Swap the whole set, readers never see a half built one
+        with self._lock:
+            revoked |= self._added_during_reload # type: ignore
+            self._added_during_reload = None
+            self._revoked = revoked
+
+    def start_reloader(self, interval: float = REVOCATION_RELOAD_SECONDS):
+        if self._reloader is not None:
+            return
+
+        self._reloader = threading.Thread(target=self._reload_forever, args=(interval,), name="token-revocation-reload", daemon=True)
+        self._reloader.start()
+
+    def _reload_forever(self, interval: float):
+        while True:
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"Warning: could not reload revoked tokens, retrying: {e}")
+            time.sleep(interval)
+
+
+revoked_tokens = RevocationSet()
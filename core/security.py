@@ -1,23 +1,67 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import Depends
 from passlib.context import CryptContext
 import os
+import time
 from dotenv import load_dotenv
 
-from db.session import get_db
+from core.cache import TTLCache, get_invalidation_backend
+from core.revocation import revoked_tokens
+from db.session import engine, get_db
+from doctor.models import Doctor
+from patient.models import Patient
 from user.models import User
+from user.schemas import CurrentUser
 load_dotenv()
 from jose import jwt, JWTError
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt work factor, hashes with any other cost are rehashed on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt releases the GIL, a small dedicated pool keeps it off the event loop and caps the CPU it can take
+password_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
+# Same token, but missing is fine, for dependencies that only use it as a hint
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token", auto_error=False)
+
+
+# "session" resolves every token to a cached database snapshot, "stateless" trusts the identity claims of the token
+AUTH_TOKEN_MODE = os.getenv("AUTH_TOKEN_MODE", "session")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+# Claims are only as fresh as the token, so stateless access tokens are short lived and refreshed often
+STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES", "5"))
+REFRESH_TOKEN_EXPIRE_MINUTES = int(os.getenv("REFRESH_TOKEN_EXPIRE_MINUTES", str(7 * 24 * 60)))
+
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+
+
+IDENTITY_CACHE_TTL_SECONDS = float(os.getenv("IDENTITY_CACHE_TTL_SECONDS", "60"))
+IDENTITY_CACHE_MAXSIZE = int(os.getenv("IDENTITY_CACHE_MAXSIZE", "10000"))
+# "local" keeps invalidations inside the worker, "postgres" shares them through LISTEN/NOTIFY
+IDENTITY_CACHE_BACKEND = os.getenv("IDENTITY_CACHE_BACKEND", "local")
+IDENTITY_CACHE_CHANNEL = "identity_invalidation"
+
+# Decoded token -> (jti, CurrentUser snapshot), tagged with the user id
+identity_cache = TTLCache("identity", maxsize=IDENTITY_CACHE_MAXSIZE, ttl=IDENTITY_CACHE_TTL_SECONDS)
+
+identity_invalidation_backend = get_invalidation_backend(
+    IDENTITY_CACHE_BACKEND,
+    dsn=engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+)
 
 
 def get_password_hash(password: str):
@@ -27,6 +71,17 @@ def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+async def get_password_hash_async(password: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_hash_executor, get_password_hash, password)
+
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Verify off the event loop, returns (verified, new hash or None when the stored cost is current)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_hash_executor, pwd_context.verify_and_update, plain_password, hashed_password)
+
+
 def create_access_token(payload: dict):
     access_token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM) # type: ignore
     return access_token
@@ -42,19 +97,106 @@ def get_token_payload(token: str):
     return payload
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def identity_claims(current_user: CurrentUser) -> dict:
+    """Token claims that let stateless mode authorize a request without the database"""
+    return {
+        "role": current_user.user_role.value,
+        "status": current_user.status.value if current_user.status else None,
+        "is_profile_created": current_user.is_profile_created,
+        "doctor_id": current_user.doctor_id,
+        "patient_id": current_user.patient_id,
+    }
+
+
+def current_user_from_claims(payload: dict):
+    return CurrentUser(
+        id=payload["id"],
+        user_role=payload["role"],
+        status=payload.get("status"),
+        is_profile_created=payload.get("is_profile_created"),
+        doctor_id=payload.get("doctor_id"),
+        patient_id=payload.get("patient_id")
+    )
+
+
+async def load_current_user(db: AsyncSession, user_id: int):
+    row = (await db.execute(
+        select(
+            User.id,
+            User.user_role,
+            User.status,
+            User.is_profile_created,
+            Doctor.id.label("doctor_id"),
+            Patient.id.label("patient_id")
+        )
+        .outerjoin(Doctor, Doctor.user_id == User.id)
+        .outerjoin(Patient, Patient.user_id == User.id)
+        .filter(User.id == user_id)
+    )).first()
+
+    if not row:
+        return None
+    return CurrentUser.model_validate(row._asdict())
+
+
+async def invalidate_cached_user(db: AsyncSession, user_id: int):
+    """Call before the commit of any change to a user's role, status, profile or linked doctor/patient"""
+
+    def drop_local(session):
+        identity_cache.invalidate_tag(user_id)
+
+    event.listen(db.sync_session, "after_commit", drop_local, once=True)
+
+    # Sent with the transaction, a rolled back change never reaches the other workers
+    await identity_invalidation_backend.publish_in_transaction(db, IDENTITY_CACHE_CHANNEL, [{"user_id": user_id}])
+
+
+def start_identity_cache_listener():
+    identity_invalidation_backend.subscribe(
+        IDENTITY_CACHE_CHANNEL,
+        lambda message: identity_cache.invalidate_tag(message["user_id"])
+    )
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    cached = identity_cache.get(token)
+    if cached is not None:
+        jti, current_user = cached
+        if jti in revoked_tokens:
+            identity_cache.invalidate(token)
+            return None
+        return current_user
+
     payload = get_token_payload(token=token)
 
     if not payload and type(payload) is not dict:
         return None
+
+    # Refresh tokens are only accepted by /auth/refresh
+    if payload.get("type", ACCESS_TOKEN_TYPE) != ACCESS_TOKEN_TYPE:
+        return None
+
+    if payload.get("jti") in revoked_tokens:
+        return None
+
+    if AUTH_TOKEN_MODE == "stateless" and "role" in payload:
+        return current_user_from_claims(payload)
     
     user_id = payload.get("id", None)
 
     if not user_id:
         return None
     
-    current_user = db.query(User).filter(User.id == user_id).first()
+    current_user = await load_current_user(db, user_id)
 
     if not current_user:
         return None
+
+    # Never keep a snapshot past the expiry of its token
+    ttl = IDENTITY_CACHE_TTL_SECONDS
+    if payload.get("exp"):
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        identity_cache.set(token, (payload.get("jti"), current_user), tags=(current_user.id,), ttl=ttl)
+
     return current_user
@@ -0,0 +1,132 @@
+import bisect
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+# Upper bounds, in milliseconds, of the checkout wait histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Every instrumented engine registers its pool metrics here so they can be exposed by the admin api
+POOL_METRICS: Dict[str, "PoolMetrics"] = {}
+
+
+class PoolMetrics:
+    """Counters fed by the pool events and a histogram of the time spent waiting for a connection"""
+
+    def __init__(self, name: str, engine):
+        self.name = name
+        self.engine = engine
+        self._lock = threading.Lock()
+
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+
+        self._wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self._wait_count = 0
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+
+        POOL_METRICS[name] = self
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        wait_ms = seconds * 1000
+        with self._lock:
+            self._wait_buckets[bisect.bisect_left(WAIT_BUCKETS_MS, wait_ms)] += 1
+            self._wait_count += 1
+            self._wait_total_ms += wait_ms
+            self._wait_max_ms = max(self._wait_max_ms, wait_ms)
+            if timed_out:
+                self.timeouts += 1
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> dict:
+        # The engine swaps in a new pool on dispose(), always read the current one
+        pool = self.engine.pool
+
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for upper_bound, count in zip(WAIT_BUCKETS_MS + ("+Inf",), self._wait_buckets):
+                cumulative += count
+                buckets[str(upper_bound)] = cumulative
+
+            return {
+                "pool_size": pool.size(),
+                "max_overflow": getattr(pool, "_max_overflow", 0),
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                # overflow() counts down from -pool_size while the pool is still filling up
+                "overflow": max(0, pool.overflow()),
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "checkout_wait_ms": {
+                    "count": self._wait_count,
+                    "sum": round(self._wait_total_ms, 3),
+                    "max": round(self._wait_max_ms, 3),
+                    "avg": round(self._wait_total_ms / self._wait_count, 3) if self._wait_count else 0.0,
+                    "buckets": buckets,
+                },
+            }
+
+
+class _InstrumentedPoolMixin:
+    """Times _do_get, the call a checkout blocks in while every connection is taken.
+
+    Opening a new connection happens inside it too, so the first checkouts and the overflow
+    ones include the connect time.
+    """
+
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get() # type: ignore
+        except exc.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+
+        if self.metrics is not None:
+            self.metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate() # type: ignore
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument_engine(name: str, engine) -> PoolMetrics:
+    """Attach metrics to the pool of a sync engine, or of an AsyncEngine through its sync_engine"""
+    engine = getattr(engine, "sync_engine", engine)
+    metrics = PoolMetrics(name, engine)
+
+    if isinstance(engine.pool, _InstrumentedPoolMixin):
+        engine.pool.metrics = metrics
+
+    event.listen(engine, "connect", lambda *args: metrics._count("connects"))
+    event.listen(engine, "checkout", lambda *args: metrics._count("checkouts"))
+    event.listen(engine, "checkin", lambda *args: metrics._count("checkins"))
+    event.listen(engine, "invalidate", lambda *args: metrics._count("invalidations"))
+    return metrics
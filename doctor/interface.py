@@ -1,10 +1,15 @@
+from datetime import date
+from typing import List
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from appointment.slot_cache import invalidate_doctor_slots
+from core.security import invalidate_cached_user
+from appointment.slot_calendar import build_doctor_calendar
 from doctor.schemas import DoctorAvailabilityCreate, DoctorClinicWithAddress, DoctorCreate, DoctorData, QualificationCreate, InstituteCreate, UpdateDoctorVerificationData
-from user.models import User, UserRole
+from user.models import Address, User, UserRole
 from doctor.models import Doctor, DoctorAvailability, DoctorClinics, DoctorQualifications, DoctorVerification, VerificationStatus
-from user.interface import create_address
 from institution.models import Institute, Qualification
 from sqlalchemy.orm import joinedload, selectinload
 
@@ -12,8 +17,8 @@ from sqlalchemy.orm import joinedload, selectinload
 
 
 
-async def create_doctor(db: Session, user_id: int, doctor: DoctorData):
-    db_doctor = db.query(Doctor).filter(Doctor.user_id == user_id).first()
+async def create_doctor(db: AsyncSession, user_id: int, doctor: DoctorData):
+    db_doctor = await db.scalar(select(Doctor.id).filter(Doctor.user_id == user_id))
     
     if db_doctor:
         raise HTTPException(
@@ -27,16 +32,13 @@ async def create_doctor(db: Session, user_id: int, doctor: DoctorData):
     )
 
     db.add(doctor)
-    db.commit()
-    db.refresh(doctor)
     return doctor
 
 
-async def create_institution(db: Session, institution: InstituteCreate):
-    db_institute = (
-        db.query(Institute)
+async def create_institution(db: AsyncSession, institution: InstituteCreate):
+    db_institute = await db.scalar(
+        select(Institute)
         .filter(Institute.name == institution.name)
-        .first()
     )
     if db_institute:
         return db_institute
@@ -48,145 +50,76 @@ async def create_institution(db: Session, institution: InstituteCreate):
     institute_obj = Institute(**institution_dict)
 
     db.add(institute_obj)
-    db.commit()
-    db.refresh(institute_obj)
     return institute_obj
 
 
-async def create_qualification(
-    db: Session,
+def create_qualification(
+    db: AsyncSession,
     qualification: QualificationCreate, 
-    institute_id: int
+    institute: Institute
 ):
-    db_institute = db.query(Institute).filter(Institute.id == institute_id).first()
-
-    if not db_institute:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Institue is not found for this institute id {institute_id}"
-        )
-    
     qualification_obj = Qualification(
         **qualification.model_dump(), 
-        institute_id = institute_id
+        institute = institute
     )
 
     db.add(qualification_obj)
-    db.commit()
-    db.refresh(qualification_obj)
     return qualification_obj
         
-async def create_doctor_qualification(
-    db: Session, 
-    doctor_id: int, 
-    institute_id: int,     
+def create_doctor_qualification(
+    db: AsyncSession, 
+    doctor: Doctor, 
+    institute: Institute,     
     qualification: QualificationCreate
 ):
-    db_doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
-
-    if not db_doctor:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Doctor is not found for this doctor id {doctor_id}"
-        )
-    
-    db_institute = db.query(Institute).filter(Institute.id == institute_id).first()
-
-    if not db_institute:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Institue is not found for this institute id {institute_id}"
-        )
-    
-    qualification = await create_qualification(
+    qualification = create_qualification(
         db=db, 
         qualification=qualification, 
-        institute_id=institute_id
+        institute=institute
     )
     
     doctor_qualification = DoctorQualifications(
-        doctor_id=doctor_id, 
-        qualification_id = qualification.id
+        doctors=doctor, 
+        qualification = qualification
     )
 
     db.add(doctor_qualification)
-    db.commit()
-    db.refresh(doctor_qualification)
-    return doctor_qualification.qualification
+    return qualification
     
 
 
-async def create_doctor_clinic(
-    db: Session, 
+def create_doctor_clinic(
+    db: AsyncSession, 
     doctor_clinic_with_address: DoctorClinicWithAddress,
-    doctor_id: int
+    doctor: Doctor
 ):
-    db_doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
-
-    if not db_doctor:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Doctor is not found for this doctor id {doctor_id}"
-        )
-    
-    address = await create_address(
-        db=db, 
-        address_create=doctor_clinic_with_address.clinic_address # type: ignore
-    )
+    address = Address(**doctor_clinic_with_address.clinic_address.model_dump())
 
     clinic_obj = DoctorClinics(
         **doctor_clinic_with_address.clinic_info.model_dump(), 
-        doctor_id=doctor_id, 
-        address_id=address.id
+        doctor=doctor, 
+        address=address
     )
 
-    
-
     db.add(clinic_obj)
-    db.commit()
-    db.refresh(clinic_obj)
 
     response = {"clinic_info": clinic_obj, "clinic_address": address}
     return response
 
 
-async def create_doctor_availability(
-    db: Session,
-    doctor_id: int, 
-    clinic_id: int, 
+def create_doctor_availability(
+    db: AsyncSession,
+    doctor: Doctor, 
+    clinic: DoctorClinics, 
     doctor_availability_data: DoctorAvailabilityCreate
 ):
-    
-    # Check if doctor exists
-    db_doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
-    if not db_doctor:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Doctor not found for doctor id {doctor_id}"
-        )
-    
-    # Check if clinic exists
-    db_clinic = db.query(DoctorClinics).filter(DoctorClinics.id == clinic_id).first()
-    if not db_clinic:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Clinic not found for clinic id {clinic_id}"
-        )
-    
-    # Check if the clinic belongs to the doctor
-    if db_clinic.doctor_id != doctor_id: # type: ignore
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Clinic {clinic_id} does not belong to doctor {doctor_id}"
-        )
-    
     created_availabilities = []
     for day in doctor_availability_data.days_of_week:
         
         # Create availability for this day
         availability = DoctorAvailability(
-            doctor_id=doctor_id,
-            clinic_id=clinic_id,
+            doctor=doctor,
+            clinic=clinic,
             days_of_week=day,
             start_time=doctor_availability_data.start_time,
             end_time=doctor_availability_data.end_time,
@@ -196,16 +129,12 @@ async def create_doctor_availability(
         db.add(availability)
         created_availabilities.append(availability)
     
-    # Commit all changes
-    db.commit()
-    
-    # Refresh objects to get IDs
-    for availability in created_availabilities:
-        db.refresh(availability)
-    
-    # Format response
+    return created_availabilities
+
+
+def format_doctor_availability(availabilities: List[DoctorAvailability]):
     response = []
-    for availability in created_availabilities:
+    for availability in availabilities:
         response.append({
             "id": availability.id,
             "doctor_id": availability.doctor_id,
@@ -220,8 +149,9 @@ async def create_doctor_availability(
 
 
 
-async def create_doctor_profile(db: Session, user_id: int, doctor_profile_data: DoctorCreate):
-    db_user = db.query(User).filter(User.id == user_id).first()
+async def create_doctor_profile(db: AsyncSession, user_id: int, doctor_profile_data: DoctorCreate):
+    """Create the doctor with qualification, clinic and availability in one transaction, nothing is kept when a step fails"""
+    db_user = await db.scalar(select(User).filter(User.id == user_id))
 
     if not db_user:
         raise HTTPException(
@@ -229,44 +159,53 @@ async def create_doctor_profile(db: Session, user_id: int, doctor_profile_data:
             detail=f"User not found for given user id {user_id}"
         )
     
-    # make entry in doctor table using doctor data with user_id
-    # make entry in institute table using institute data
-    # make entry in qualification table using qualification data with institute_id
-    # make entry in doctorqualification table using doctor_id and qualification_id
-    # make entry in doctorclinic table using doctor_clinic_with_address using doctor_id
-    # after every entry store the response object of every interface in the response dictionary.
+    # Every step only adds objects linked through their relationships, a single flush
+    # inserts them all in dependency order and fills in the generated ids
 
     response = {}
 
-    doctor = await create_doctor(db=db, user_id=user_id, doctor=doctor_profile_data.doctor)
-    response["doctor"] = doctor
+    try:
+        doctor = await create_doctor(db=db, user_id=user_id, doctor=doctor_profile_data.doctor)
+        response["doctor"] = doctor
 
-    institute = await create_institution(db=db, institution=doctor_profile_data.institute)
-    response["institute"] = institute
+        institute = await create_institution(db=db, institution=doctor_profile_data.institute)
+        response["institute"] = institute
 
-    doctor_qualification = await create_doctor_qualification(
-        db=db,
-        doctor_id=doctor.id, # type: ignore
-        institute_id=institute.id, # type: ignore
-        qualification=doctor_profile_data.qualification
-    )
-    response["qualification"] = doctor_qualification
+        response["qualification"] = create_doctor_qualification(
+            db=db,
+            doctor=doctor,
+            institute=institute,
+            qualification=doctor_profile_data.qualification
+        )
 
-    doctor_clinic = await create_doctor_clinic(
-        db=db,
-        doctor_clinic_with_address=doctor_profile_data.doctor_clinic_with_address,
-        doctor_id=doctor.id # type: ignore
-    )
-    response["clinic_info"] = doctor_clinic
+        doctor_clinic = create_doctor_clinic(
+            db=db,
+            doctor_clinic_with_address=doctor_profile_data.doctor_clinic_with_address,
+            doctor=doctor
+        )
+        response["clinic_info"] = doctor_clinic
 
-    doctor_availability = await create_doctor_availability(
-        doctor_id=doctor.id, # type: ignore
-        clinic_id= doctor_clinic["clinic_info"].id,
-        doctor_availability_data=doctor_profile_data.doctor_availability,
-        db=db
-    )
+        availabilities = create_doctor_availability(
+            db=db,
+            doctor=doctor,
+            clinic=doctor_clinic["clinic_info"],
+            doctor_availability_data=doctor_profile_data.doctor_availability
+        )
+
+        db_user.is_profile_created = True # type: ignore
+        await db.flush()
+
+        # Build the slot calendar of the doctor from the new availability
+        await db.run_sync(build_doctor_calendar, doctor_id=doctor.id, start_date=date.today())
+        await invalidate_doctor_slots(db, doctor.id) # type: ignore
+        await invalidate_cached_user(db, user_id)
+
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
 
-    response["doctor_availability"] = doctor_availability
+    response["doctor_availability"] = format_doctor_availability(availabilities)
 
     return response
 
@@ -274,10 +213,10 @@ async def create_doctor_profile(db: Session, user_id: int, doctor_profile_data:
         
     
 
-def get_doctor_profile(db: Session, doctor_id: int):
+async def get_doctor_profile(db: AsyncSession, doctor_id: int):
     # Query with eager loading of all related data
-    doctor = (
-        db.query(Doctor)
+    doctor = await db.scalar(
+        select(Doctor)
         .filter(Doctor.id == doctor_id)
         .options(
             joinedload(Doctor.user),  # Load the user
@@ -287,7 +226,6 @@ def get_doctor_profile(db: Session, doctor_id: int):
             selectinload(Doctor.clinics)
             .joinedload(DoctorClinics.address)  # Load clinics and addresses
         )
-        .first()
     )
     
     if not doctor:
@@ -353,8 +291,8 @@ def get_doctor_profile(db: Session, doctor_id: int):
         })
     return doctor_info
 
-def get_doctor_by_user_id(db: Session, user_id: int):
-    db_user = db.query(User).filter(User.id == user_id).first()
+async def get_doctor_by_user_id(db: AsyncSession, user_id: int):
+    db_user = await db.scalar(select(User).filter(User.id == user_id))
 
     if not db_user:
         if not db_user:
@@ -363,7 +301,7 @@ def get_doctor_by_user_id(db: Session, user_id: int):
                 detail=f"User not found for given user id {user_id}"
             )
     
-    db_doctor = db.query(Doctor).filter(Doctor.user_id == user_id).first()
+    db_doctor = await db.scalar(select(Doctor).filter(Doctor.user_id == user_id))
     print("logging doctor id",db_doctor)
 
     if not db_doctor:
@@ -376,8 +314,8 @@ def get_doctor_by_user_id(db: Session, user_id: int):
 
         
 # create doctor verification
-def create_doctor_verification_req(db: Session, doctor_id: int):
-    db_doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
+async def create_doctor_verification_req(db: AsyncSession, doctor_id: int):
+    db_doctor = await db.scalar(select(Doctor).filter(Doctor.id == doctor_id))
 
     if not db_doctor:
         raise HTTPException(
@@ -389,16 +327,15 @@ def create_doctor_verification_req(db: Session, doctor_id: int):
         status=VerificationStatus.PENDING
     ) 
     db.add(verification)
-    db.commit()
-    db.refresh
+    await db.commit()
     return {"response": "verification_requested", "status": VerificationStatus.PENDING}
 
 
 
-def get_doctor_profile_with_verification(db:Session, skip: int = 0, limit: int = 10):
+async def get_doctor_profile_with_verification(db: AsyncSession, skip: int = 0, limit: int = 10):
     
-    doctors = (
-        db.query(Doctor).join(Doctor.verifications)
+    doctors = await db.scalars(
+        select(Doctor).join(Doctor.verifications)
         .options(
             joinedload(Doctor.user),
             selectinload(Doctor.doctor_qualifications)
@@ -409,7 +346,7 @@ def get_doctor_profile_with_verification(db:Session, skip: int = 0, limit: int =
             selectinload(Doctor.verifications)
                 .joinedload(DoctorVerification.admin)
         )
-        .offset(skip).limit(limit).all()
+        .offset(skip).limit(limit)
     )
     
     
@@ -490,9 +427,9 @@ def get_doctor_profile_with_verification(db:Session, skip: int = 0, limit: int =
     return response
 
 
-def get_doctor_verification_profile(db: Session, doctor_id: int):
+async def get_doctor_verification_profile(db: AsyncSession, doctor_id: int):
 
-    db_doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
+    db_doctor = await db.scalar(select(Doctor).filter(Doctor.id == doctor_id))
 
     if not db_doctor:
         raise HTTPException(
@@ -500,10 +437,9 @@ def get_doctor_verification_profile(db: Session, doctor_id: int):
             detail=f"Doctor not found for this doctor id: {doctor_id}"
         )
     
-    doctor_verification_record = (
-        db.query(DoctorVerification)
+    doctor_verification_record = await db.scalar(
+        select(DoctorVerification)
          .filter(DoctorVerification.doctor_id == doctor_id)
-         .first()
     )
 
     if not doctor_verification_record:
@@ -515,13 +451,13 @@ def get_doctor_verification_profile(db: Session, doctor_id: int):
 
 
 
-def update_doctor_verification_data(
-     db: Session,
+async def update_doctor_verification_data(
+     db: AsyncSession,
      verification_id: int, 
      update_doctor_verification: UpdateDoctorVerificationData,
      admin_id: int
 ):
-    db_doctor_verification = db.query(DoctorVerification).filter(DoctorVerification.id == verification_id).options(joinedload(DoctorVerification.doctor)).first() 
+    db_doctor_verification = await db.scalar(select(DoctorVerification).filter(DoctorVerification.id == verification_id).options(joinedload(DoctorVerification.doctor))) 
 
     if not db_doctor_verification:
         raise HTTPException(
@@ -529,7 +465,7 @@ def update_doctor_verification_data(
             detail=f"Doctor Verification details is not found for this: {verification_id}"
         )
 
-    db_admin_user = db.query(User).filter(User.id == admin_id).first()
+    db_admin_user = await db.scalar(select(User).filter(User.id == admin_id))
 
     if not db_admin_user:
         raise HTTPException(
@@ -556,8 +492,8 @@ def update_doctor_verification_data(
         db_doctor_verification.doctor.is_verified = False
 
 
-    db.commit()
-    db.refresh(db_doctor_verification)
+    await db.commit()
+    await db.refresh(db_doctor_verification)
 
     return db_doctor_verification
     
@@ -565,16 +501,16 @@ def update_doctor_verification_data(
 
 
  # interface for patients to get all the doctors
-def get_doctors_list_for_patients(db: Session, skip: int =0, limit: int = 10):
-    doctors = (
-        db.query(Doctor).filter(Doctor.is_verified == True)
+async def get_doctors_list_for_patients(db: AsyncSession, skip: int =0, limit: int = 10):
+    doctors = await db.scalars(
+        select(Doctor).filter(Doctor.is_verified == True)
         .options(
             joinedload(Doctor.user),
             selectinload(Doctor.doctor_qualifications)
                 .joinedload(DoctorQualifications.qualification),
             selectinload(Doctor.clinics)
                 .joinedload(DoctorClinics.address)
-        ).offset(skip).limit(limit).all()
+        ).order_by(Doctor.id).offset(skip).limit(limit)
     )
 
 
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, DECIMAL, String, Enum, Time, UniqueConstraint
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, DECIMAL, String, Enum, Time, UniqueConstraint, func, text
 from db.base_model import BaseModel
 from sqlalchemy.orm import relationship
 import enum
@@ -37,6 +37,12 @@ class Doctor(BaseModel):
     bio = Column(String)
     is_verified = Column(Boolean, default=False)
 
+    # Patients only ever list and search verified doctors
+    __table_args__ = (
+        Index('ix_doctors_verified_id', 'id', postgresql_where=text('is_verified')),
+        Index('ix_doctors_verified_speciality', func.lower(speciality), postgresql_where=text('is_verified')),
+    )
+
     # Relationship with DoctorClinics 
     clinics = relationship("DoctorClinics", back_populates= "doctor", cascade="all, delete-orphan")
 
@@ -3,4 +3,5 @@ from doctor.models import Doctor
 from institution.models import Institute
 from appointment.models import Appointment
 from patient.models import Patient
+from auth.models import RevokedToken
 from populate_db.api import TestUserRole
\ No newline at end of file
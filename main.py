@@ -1,9 +1,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from admin.admin_setup import create_initial_admin
+from appointment.slot_cache import start_slot_cache_listener
+from core.db_routing import start_recent_writes_listener
+from core.query_counter import QueryCounterMiddleware
+from core.revocation import revoked_tokens
+from core.security import start_identity_cache_listener
 import init 
 from db.base_class import Base
-from db.session import engine
+from db.session import async_engine, async_read_engine, engine
 
 
 from user.api import router as user_router
@@ -30,6 +35,17 @@ app = FastAPI(title="Patient Appointment System")
 @app.on_event("startup")
 async def startup_event():
     await create_initial_admin()
+    start_slot_cache_listener()
+    start_identity_cache_listener()
+    start_recent_writes_listener()
+    revoked_tokens.start_reloader()
+
+# Close the pooled connections, aiosqlite keeps the process alive until its connection threads end
+@app.on_event("shutdown")
+async def shutdown_event():
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
 
 app.add_middleware(
     CORSMiddleware,
@@ -37,8 +53,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["X-DB-Queries", "Server-Timing"],
 )
 
+# X-DB-Queries and Server-Timing on every response, QUERY_BUDGET_MODE enforces the declared budgets
+app.add_middleware(QueryCounterMiddleware)
+
 
 app.include_router(auth_router)
 app.include_router(admin_router)
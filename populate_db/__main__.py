@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import json
+import time as timer
+
+import init # noqa: F401  registers every model on the mapper
+from db.session import AsyncSessionLocal, async_engine
+from .interface import bulk_populate
+from .schema import TestUserRole, WorkloadProfile
+from .workload import generate_workload
+
+
+# Bulk seeding of benchmark datasets without going through the api:
+#
+#   python -m populate_db users --role doctor --count 10000
+#   python -m populate_db users --role patient --count 1000000 --chunk-size 5000
+#   python -m populate_db workload --seed 7 --doctors 2000 --patients 50000 --history-days 1095
+
+
+async def seed_users(role: TestUserRole, count: int, chunk_size: int, seed: int):
+    started = timer.perf_counter()
+    async with AsyncSessionLocal() as db:
+        await bulk_populate(db=db, no_of_users=count, role=role, chunk_size=chunk_size, seed=seed)
+    return {"created": count, "role": role.value, "seconds": round(timer.perf_counter() - started, 3)}
+
+
+async def seed_workload(profile: WorkloadProfile):
+    async with AsyncSessionLocal() as db:
+        return await generate_workload(db=db, profile=profile)
+
+
+async def run(job):
+    try:
+        return await job
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed benchmark datasets with multi-row inserts")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    users = commands.add_parser("users", help="test doctors or patients only")
+    users.add_argument("--role", type=TestUserRole, choices=list(TestUserRole), required=True)
+    users.add_argument("--count", type=int, required=True)
+    users.add_argument("--chunk-size", type=int, default=1000, help="users written per insert batch and commit")
+    users.add_argument("--seed", type=int, default=None)
+
+    workload = commands.add_parser("workload", help="doctors, patients, schedules and an appointment history")
+    # Every WorkloadProfile field is an option, --history-days for history_days and so on
+    for name, field in WorkloadProfile.model_fields.items():
+        workload.add_argument(f"--{name.replace('_', '-')}", type=field.annotation, default=field.default, help=field.description)
+
+    args = parser.parse_args()
+
+    if args.command == "users":
+        result = asyncio.run(run(seed_users(args.role, args.count, args.chunk_size, args.seed)))
+    else:
+        profile = WorkloadProfile(**{name: getattr(args, name) for name in WorkloadProfile.model_fields})
+        result = asyncio.run(run(seed_workload(profile)))
+
+    print(json.dumps(result, indent=2))
@@ -1,15 +1,26 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from .schema import TestUserRole
-from db.session import get_db
-from .interface import create_test_doctor, create_test_patient
+import time as timer
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from .schema import TestUserRole, WorkloadProfile
+from core.db_routing import get_write_db
+from .interface import bulk_populate, create_test_doctor, create_test_patient
+from .workload import generate_workload
 
 router = APIRouter(prefix="/populate_db", tags=["Populate DB"])
 
 
 
 @router.post("/populate_db")
-async def populate_db(no_of_users:int, role:TestUserRole, db: Session = Depends(get_db)):
+async def populate_db(no_of_users:int, role:TestUserRole, bulk: bool = False, chunk_size: int = Query(1000, ge=1, le=50000), db: AsyncSession = Depends(get_write_db)):
+
+    # Multi-row inserts with one shared password hash, for benchmark sized datasets
+    if bulk:
+        started = timer.perf_counter()
+        await bulk_populate(db=db, no_of_users=no_of_users, role=role, chunk_size=chunk_size)
+        return {
+            "message": f"Populated {no_of_users} {role.value} users in the database.",
+            "seconds": round(timer.perf_counter() - started, 3)
+        }
 
     if role == TestUserRole.DOCTOR:
        response =  await create_test_doctor(no_of_doctors=no_of_users, role=role, db=db)
@@ -20,3 +31,9 @@ async def populate_db(no_of_users:int, role:TestUserRole, db: Session = Depends(
        print(response)
 
     return {"message": f"Populated {no_of_users} {role.value} users in the database."}
+
+
+@router.post("/workload")
+async def populate_workload(profile: WorkloadProfile, db: AsyncSession = Depends(get_write_db)):
+    """Seed a reproducible dataset of doctors, patients and a skewed appointment history"""
+    return await generate_workload(db=db, profile=profile)
@@ -1,32 +1,61 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .schema import TestUserRole
 import random
+from datetime import date, time
+from typing import Optional
 from nanoid import generate
-from user.models import Gender
+from user.models import Address, Gender, User
 from user.api import user_register
 from doctor.interface import create_doctor_profile
+from doctor.models import Days, Doctor, DoctorAvailability, DoctorClinics, DoctorQualifications, DoctorVerification, VerificationStatus
+from patient.models import Patient
+from appointment.slot_calendar import build_doctor_calendars
+from core.security import get_password_hash_async
 from .utility import numeric_nanoid
-from institution.models import InstitutionType
+from institution.models import Institute, InstitutionType, Qualification
 from user.models import AddressType
 from doctor.schemas import DoctorCreate
-from user.interface import update_user_by_id
 
-from user.schemas import UserPartialUpdate, UserRegister, UserRole
+from user.schemas import UserRegister, UserRole
 
-async def create_test_user(db:Session, role:TestUserRole):
-    users = ["john", "jane", "doe", "alice", "bob"]
-    last_names = ["Smith", "Doe", "Johnson", "Brown", "Davis"]
+
+FIRST_NAMES = ["john", "jane", "doe", "alice", "bob"]
+LAST_NAMES = ["Smith", "Doe", "Johnson", "Brown", "Davis"]
+SPECIALITIES = ["Cardiology", "Dermatology", "Neurology", "Pediatrics", "Orthopedics"]
+DOCTOR_BIOS = [
+    "Known for providing exceptional patient care with a personalized approach.",
+    "Trusted for being a compassionate and understanding healthcare provider.",
+    "Dedicated to improving patient outcomes with a focus on well-being.",
+    "Highly regarded for building strong patient relationships and trust.",
+    "Experienced in delivering clear communication and patient education.",
+    "Committed to patient-centered care and overall wellness.",
+    "Recognized for thorough consultations and a caring attitude.",
+    "Appreciated for a warm and approachable manner.",
+    "Known for making patients feel comfortable and well-informed.",
+    "Admired for a patient-first philosophy and clear medical guidance."
+]
+QUALIFICATIONS = ["MBBS", "MD", "DNB", "MS", "MCh", "DM"]
+HOSPITALS = ["Apollo", "Fortis", "Max"]
+CITIES = ["Delhi", "Mumbai", "Bangalore"]
+STATES = ["Delhi", "Maharashtra", "Karnataka"]
+
+TEST_PASSWORD = "12345678"
+WORKING_DAYS = [Days.MONDAY, Days.TUESDAY, Days.WEDNESDAY, Days.THURSDAY, Days.FRIDAY]
+
+
+async def create_test_user(db: AsyncSession, role:TestUserRole):
     genders = ["male","female","others"]
 
 
-    first_name = random.choice(users)
-    last_name = random.choice(last_names)
+    first_name = random.choice(FIRST_NAMES)
+    last_name = random.choice(LAST_NAMES)
     gmail = f"{first_name.lower()}.{last_name.lower()}{generate(size=6)}@gmail.com"
     age = random.randint(18, 60)
     mobile_no = f"+91{random.randint(1000, 9999)}{numeric_nanoid(length=6)}"
     gender = Gender(random.choice(genders))
     username = f"{first_name.lower()}.{last_name.lower()}{generate(size=6)}"
-    password = "12345678"
+    password = TEST_PASSWORD
     user_role = UserRole(role.value)
     user = UserRegister(
         username=username,
@@ -45,44 +74,22 @@ async def create_test_user(db:Session, role:TestUserRole):
     return response
 
 
-async def create_test_doctor_profile(db: Session, user_id: int):
-    specialities = [ "Cardiology", "Dermatology", "Neurology", "Pediatrics", "Orthopedics"]
-    doctor_bios = [
-        "Known for providing exceptional patient care with a personalized approach.",
-        "Trusted for being a compassionate and understanding healthcare provider.",
-        "Dedicated to improving patient outcomes with a focus on well-being.",
-        "Highly regarded for building strong patient relationships and trust.",
-        "Experienced in delivering clear communication and patient education.",
-        "Committed to patient-centered care and overall wellness.",
-        "Recognized for thorough consultations and a caring attitude.",
-        "Appreciated for a warm and approachable manner.",
-        "Known for making patients feel comfortable and well-informed.",
-        "Admired for a patient-first philosophy and clear medical guidance."
-    ]
-    qualifications = [
-        "MBBS",
-        "MD",
-        "DNB",
-        "MS",
-        "MCh",
-        "DM"
-    ]
-
+async def create_test_doctor_profile(db: AsyncSession, user_id: int):
     doctor = {
-        "speciality": random.choice(specialities),
+        "speciality": random.choice(SPECIALITIES),
         "experience": random.randint(1,20),
         "consultation_fee": random.randint(500, 5000),
-        "bio": random.choice(doctor_bios),
+        "bio": random.choice(DOCTOR_BIOS),
     }
 
     qualification = {
-        "qualification_name": random.choice(qualifications),
+        "qualification_name": random.choice(QUALIFICATIONS),
         "course_duration": str(random.randint(1, 5))+ " years",
         "year_completed": random.randint(1990, 2023)
     }
 
     institute = {
-        "name": f"{random.choice(['Apollo', 'Fortis', 'Max'])} Hospital",
+        "name": f"{random.choice(HOSPITALS)} Hospital",
         "type": InstitutionType(random.choice(["university", "college", "hospital"]))
     }
 
@@ -96,19 +103,26 @@ async def create_test_doctor_profile(db: Session, user_id: int):
         "clinic_address": {
             "street_address": f"{random.randint(1, 1000)} Main St",
             "area_name": random.choice(["Downtown", "Uptown", "Suburb"]),
-            "city": random.choice(["Delhi", "Mumbai", "Bangalore"]),
-            "state": random.choice(["Delhi", "Maharashtra", "Karnataka"]),
+            "city": random.choice(CITIES),
+            "state": random.choice(STATES),
             "pincode": random.randint(100000, 999999),
             "country": random.choice(["India", "USA", "UK"]),
             "address_type": AddressType(random.choice(["home", "work", "other"]))
         }
     }
 
+    doctor_availability = {
+        "days_of_week": WORKING_DAYS,
+        "start_time": time(9, 0),
+        "end_time": time(17, 0)
+    }
+
     doctor_dict = {
         "doctor": doctor,
         "qualification": qualification,
         "institute": institute,
-        "doctor_clinic_with_address": doctor_clinic_with_address
+        "doctor_clinic_with_address": doctor_clinic_with_address,
+        "doctor_availability": doctor_availability
     }
 
     doctor_pydantic = DoctorCreate(**doctor_dict)
@@ -116,18 +130,204 @@ async def create_test_doctor_profile(db: Session, user_id: int):
     response = await create_doctor_profile(db=db, doctor_profile_data=doctor_pydantic, user_id=user_id)
     return response
 
-async def create_test_doctor(no_of_doctors:int, role:TestUserRole, db:Session):
+async def create_test_doctor(no_of_doctors:int, role:TestUserRole, db: AsyncSession):
     for _ in range(no_of_doctors):
         response = await create_test_user(db=db, role=role)
         doctor_response = await create_test_doctor_profile(db=db, user_id=response["user"].id)
-        user_update = UserPartialUpdate(is_profile_created=True)
-        doctor = doctor_response["doctor"]
-
-        update_user_by_id(db, doctor.user_id, user_update=user_update) # type: ignore
         print(doctor_response)
         print(response)
 
-async def create_test_patient(no_of_patients:int, role:TestUserRole, db:Session):
+async def create_test_patient(no_of_patients:int, role:TestUserRole, db: AsyncSession):
     for _ in range(no_of_patients):
         user = await create_test_user(db=db, role=role)
         print(user)
+
+
+# Bulk seeding
+#
+# Builds the rows of a whole chunk in memory and writes every table of the chunk with one
+# executemany insert, which SQLAlchemy sends as multi-row INSERT ... VALUES statements.
+# Every seeded user shares one bcrypt hash of TEST_PASSWORD and each chunk is its own commit,
+# seeded doctors get their slot calendar in the same commit.
+# All the random choices come from the rng passed in, so a seeded run on an empty database is reproducible.
+
+
+def office_hours(rng: random.Random):
+    """Weekly schedule of the plain bulk seeding, 9 to 5 on working days"""
+    return [(day, time(9, 0), time(17, 0)) for day in WORKING_DAYS]
+
+
+async def _insert_returning_ids(db: AsyncSession, model, rows: list):
+    result = await db.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), rows)
+    return result.all()
+
+
+async def _next_seed_number(db: AsyncSession):
+    # Seeded usernames, mobile and clinic phone numbers are numbered from the current max user id so reruns stay unique
+    return (await db.scalar(select(func.max(User.id))) or 0) + 1
+
+
+def _seed_user_row(rng: random.Random, number: int, role: UserRole, password_hash: str):
+    first_name = rng.choice(FIRST_NAMES)
+    last_name = rng.choice(LAST_NAMES)
+    return {
+        "username": f"{first_name}.{last_name.lower()}.seed{number}",
+        "first_name": first_name,
+        "last_name": last_name,
+        "age": rng.randint(18, 60),
+        "gender": rng.choice(list(Gender)),
+        "mobile_no": f"+90{number:010d}",
+        "gmail": f"{first_name}.{last_name.lower()}.seed{number}@gmail.com",
+        "user_role": role,
+        "password": password_hash,
+        "is_profile_created": True,
+    }
+
+
+async def _get_or_create_institutes(db: AsyncSession):
+    names = [f"{hospital} Hospital" for hospital in HOSPITALS]
+    institutes = dict((await db.execute(select(Institute.name, Institute.id).filter(Institute.name.in_(names)))).all())
+
+    missing = [{"name": name, "type": InstitutionType.HOSPITAL} for name in names if name not in institutes]
+    if missing:
+        institute_ids = await _insert_returning_ids(db, Institute, missing)
+        institutes.update(zip([row["name"] for row in missing], institute_ids))
+    return [institutes[name] for name in names]
+
+
+async def _bulk_insert_patients(db: AsyncSession, rng: random.Random, numbers: range, password_hash: str):
+    user_ids = await _insert_returning_ids(
+        db, User, [_seed_user_row(rng, number, UserRole.PATIENT, password_hash) for number in numbers]
+    )
+    return await _insert_returning_ids(db, Patient, [{"user_id": user_id} for user_id in user_ids])
+
+
+async def _bulk_insert_doctors(
+    db: AsyncSession,
+    rng: random.Random,
+    numbers: range,
+    password_hash: str,
+    institute_ids: list,
+    schedule=office_hours,
+    verified_ratio: float = 1.0
+):
+    """Insert the doctors of a chunk, returns (doctor_id, clinic_id, consultation_fee, weekly schedule) per doctor"""
+    user_ids = await _insert_returning_ids(
+        db, User, [_seed_user_row(rng, number, UserRole.DOCTOR, password_hash) for number in numbers]
+    )
+
+    doctor_rows = [
+        {
+            "user_id": user_id,
+            "speciality": rng.choice(SPECIALITIES),
+            "experience": rng.randint(1, 20),
+            "consultation_fee": rng.randint(500, 5000),
+            "bio": rng.choice(DOCTOR_BIOS),
+            "is_verified": rng.random() < verified_ratio,
+        }
+        for user_id in user_ids
+    ]
+    doctor_ids = await _insert_returning_ids(db, Doctor, doctor_rows)
+
+    # Verified doctors carry the approved request, the others are still pending or were rejected
+    await db.execute(insert(DoctorVerification), [
+        {
+            "doctor_id": doctor_id,
+            "status": VerificationStatus.APPROVED if row["is_verified"] else rng.choice([VerificationStatus.PENDING, VerificationStatus.REJECTED]),
+        }
+        for doctor_id, row in zip(doctor_ids, doctor_rows)
+    ])
+
+    qualification_ids = await _insert_returning_ids(db, Qualification, [
+        {
+            "institute_id": rng.choice(institute_ids),
+            "qualification_name": rng.choice(QUALIFICATIONS),
+            "course_duration": f"{rng.randint(1, 5)} years",
+            "year_completed": rng.randint(1990, 2023),
+        }
+        for _ in doctor_ids
+    ])
+    await db.execute(insert(DoctorQualifications), [
+        {"doctor_id": doctor_id, "qualification_id": qualification_id}
+        for doctor_id, qualification_id in zip(doctor_ids, qualification_ids)
+    ])
+
+    address_ids = await _insert_returning_ids(db, Address, [
+        {
+            "street_address": f"{rng.randint(1, 1000)} Main St",
+            "area_name": rng.choice(["Downtown", "Uptown", "Suburb"]),
+            "city": rng.choice(CITIES),
+            "state": rng.choice(STATES),
+            "pincode": rng.randint(100000, 999999),
+            "country": "India",
+            "address_type": AddressType.WORK,
+        }
+        for _ in doctor_ids
+    ])
+    clinic_ids = await _insert_returning_ids(db, DoctorClinics, [
+        {
+            "doctor_id": doctor_id,
+            "address_id": address_id,
+            "clinic_name": f"{rng.choice(['City', 'Town', 'Village'])} Clinic",
+            "clinic_phone": f"+92{number:010d}",
+            "is_primary_location": True,
+            "consultation_hours_notes": "See the weekly schedule",
+        }
+        for number, doctor_id, address_id in zip(numbers, doctor_ids, address_ids)
+    ])
+
+    doctors = [
+        (doctor_id, clinic_id, row["consultation_fee"], schedule(rng))
+        for doctor_id, clinic_id, row in zip(doctor_ids, clinic_ids, doctor_rows)
+    ]
+    await db.execute(insert(DoctorAvailability), [
+        {
+            "doctor_id": doctor_id,
+            "clinic_id": clinic_id,
+            "days_of_week": day,
+            "start_time": start_time,
+            "end_time": end_time,
+            "is_available": True,
+        }
+        for doctor_id, clinic_id, _, weekly_schedule in doctors
+        for day, start_time, end_time in weekly_schedule
+    ])
+
+    # The slot calendar of the chunk, as create_doctor_profile builds it for a single doctor
+    await db.run_sync(build_doctor_calendars, doctor_ids=doctor_ids, start_date=date.today())
+    return doctors
+
+
+async def bulk_populate(
+    db: AsyncSession,
+    no_of_users: int,
+    role: TestUserRole,
+    chunk_size: int = 1000,
+    seed: Optional[int] = None,
+    schedule=office_hours,
+    verified_ratio: float = 1.0
+):
+    """Seed no_of_users doctors with a clinic and a weekly schedule, or patients, chunk by chunk.
+
+    Returns the created ids, (doctor_id, clinic_id, fee, schedule) tuples for doctors and patient ids for patients.
+    """
+    rng = random.Random(seed)
+    password_hash = await get_password_hash_async(TEST_PASSWORD)
+    first_number = await _next_seed_number(db)
+
+    institute_ids = []
+    if role == TestUserRole.DOCTOR:
+        institute_ids = await _get_or_create_institutes(db)
+        await db.commit()
+
+    created = []
+    for chunk_start in range(0, no_of_users, chunk_size):
+        numbers = range(first_number + chunk_start, first_number + min(chunk_start + chunk_size, no_of_users))
+
+        if role == TestUserRole.DOCTOR:
+            created.extend(await _bulk_insert_doctors(db, rng, numbers, password_hash, institute_ids, schedule, verified_ratio))
+        else:
+            created.extend(await _bulk_insert_patients(db, rng, numbers, password_hash))
+        await db.commit()
+
+    return created
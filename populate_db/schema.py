@@ -1,5 +1,28 @@
 import enum
 
+from pydantic import BaseModel, Field
+
+
 class TestUserRole(enum.Enum):
     DOCTOR = "doctor"
-    PATIENT = "patient"
\ No newline at end of file
+    PATIENT = "patient"
+
+
+class WorkloadProfile(BaseModel):
+    """Sizes and shape of a synthetic dataset, the same profile on an empty database reproduces the same rows"""
+    seed: int = 42
+    doctors: int = Field(100, ge=1)
+    patients: int = Field(1000, ge=1)
+    # Appointment history before today and bookings ahead of it
+    history_days: int = Field(365, ge=0)
+    future_days: int = Field(30, ge=0)
+    slot_duration_minutes: int = Field(30, ge=5, le=240)
+    # Mean appointments of an average doctor on a working day, popular doctors get more
+    mean_daily_appointments: float = Field(6.0, ge=0)
+    # Zipf exponent of the doctor popularity, 0 spreads the appointments evenly
+    popularity_skew: float = Field(1.0, ge=0)
+    # How much more likely a slot in the morning or evening peak is booked than any other slot
+    peak_hour_weight: float = Field(3.0, ge=1)
+    cancellation_rate: float = Field(0.1, ge=0, le=1)
+    verified_ratio: float = Field(0.9, ge=0, le=1)
+    chunk_size: int = Field(1000, ge=1, le=50000)
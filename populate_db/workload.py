@@ -0,0 +1,173 @@
+import heapq
+import math
+import random
+import time as timer
+from collections import Counter
+from datetime import date, time, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from appointment.models import Appointment, AppointmentPayment, AppointmentStatus
+from appointment.slot_calendar import SLOT_HORIZON_DAYS, build_doctor_calendars
+from doctor.models import Days
+from .interface import bulk_populate
+from .schema import TestUserRole, WorkloadProfile
+
+
+# Synthetic workload for the slot, listing and booking benchmarks.
+#
+# Seeds patients and doctors through the bulk path, gives every doctor a weekly schedule of
+# morning and evening windows, then books a skewed appointment history around today: a few
+# popular doctors take most of the appointments, peak hours fill up first and a share of the
+# appointments is cancelled. The slot calendar of a doctor is rebuilt with every chunk that
+# books into its horizon, so the booked masks match the history. Every random choice comes
+# from one rng seeded by the profile, so the same profile on an empty database reproduces the
+# same rows (dates are relative to today).
+
+
+# Slots starting in these hours are peak_hour_weight times as likely to be booked
+PEAK_HOURS = {10, 11, 17, 18}
+
+REASONS_FOR_VISIT = ["Follow up", "Consultation", "Routine checkup", "Prescription refill", "Test results", "New symptoms"]
+
+# Days is declared Monday first, the same order as date.weekday()
+WEEK = list(Days)
+
+
+def weekly_schedule(rng: random.Random):
+    """Four to six working days with a morning window, and an evening one on some of them"""
+    schedule = []
+    for day in sorted(rng.sample(WEEK[:6], rng.randint(4, 6)), key=WEEK.index):
+        morning_start = rng.choice([8, 9, 10])
+        schedule.append((day, time(morning_start, 0), time(morning_start + rng.choice([3, 4]), 0)))
+        if rng.random() < 0.5:
+            schedule.append((day, time(17, 0), time(20, 0)))
+    return schedule
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    if mean <= 0:
+        return 0
+    if mean > 30:
+        return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+
+    # Knuth's multiplication method, fine for small means
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def _popularity(rng: random.Random, count: int, skew: float):
+    """Zipf weights over a shuffled doctor ranking, scaled so the average doctor has weight 1"""
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    weights = [1 / rank ** skew for rank in ranks]
+    scale = count / sum(weights)
+    return [weight * scale for weight in weights]
+
+
+def _slot_starts(schedule, slot_duration_minutes: int, peak_hour_weight: float):
+    """Start minutes and booking weights of every slot, per weekday"""
+    slots = {}
+    for day, start_time, end_time in schedule:
+        start_minute = start_time.hour * 60 + start_time.minute
+        end_minute = end_time.hour * 60 + end_time.minute
+        for minute in range(start_minute, end_minute - slot_duration_minutes + 1, slot_duration_minutes):
+            weight = peak_hour_weight if minute // 60 in PEAK_HOURS else 1.0
+            slots.setdefault(WEEK.index(day), []).append((minute, weight))
+    return slots
+
+
+def _weighted_sample(rng: random.Random, slots, count: int):
+    # Efraimidis-Spirakis: the count largest random() ** (1 / weight) keys are a weighted sample without replacement
+    return heapq.nlargest(count, slots, key=lambda slot: rng.random() ** (1 / slot[1]))
+
+
+def _minute_time(minute: int) -> time:
+    return time(minute // 60, minute % 60)
+
+
+def _doctor_appointments(rng: random.Random, profile: WorkloadProfile, doctor, popularity: float, patient_ids, today: date):
+    doctor_id, clinic_id, fee, schedule = doctor
+    slots_by_weekday = _slot_starts(schedule, profile.slot_duration_minutes, profile.peak_hour_weight)
+
+    for day_offset in range(-profile.history_days, profile.future_days):
+        appointment_date = today + timedelta(days=day_offset)
+        slots = slots_by_weekday.get(appointment_date.weekday())
+        if not slots:
+            continue
+
+        count = min(_poisson(rng, profile.mean_daily_appointments * popularity), len(slots), len(patient_ids))
+        # Distinct slots and distinct patients keep the day clear of overlaps and of double bookings
+        for (minute, _), patient_id in zip(_weighted_sample(rng, slots, count), rng.sample(patient_ids, count)):
+            if rng.random() < profile.cancellation_rate:
+                appointment_status = AppointmentStatus.CANCELLED
+            elif appointment_date < today:
+                appointment_status = AppointmentStatus.COMPLETED
+            else:
+                appointment_status = AppointmentStatus.SCHEDULED
+
+            yield {
+                "patient_id": patient_id,
+                "doctor_id": doctor_id,
+                "clinic_id": clinic_id,
+                "date": appointment_date,
+                "start_time": _minute_time(minute),
+                "end_time": _minute_time(minute + profile.slot_duration_minutes),
+                "fees": fee,
+                "reason_for_visit": rng.choice(REASONS_FOR_VISIT),
+                "payment_status": AppointmentPayment.COMPLETED if appointment_status == AppointmentStatus.COMPLETED else AppointmentPayment.PENDING,
+                "appointment_status": appointment_status,
+            }
+
+
+async def _insert_appointments(db: AsyncSession, rows: list, today: date):
+    """Insert a chunk of appointments and rebuild the calendars they book into, in one commit"""
+    await db.execute(insert(Appointment), rows)
+
+    horizon_end = today + timedelta(days=SLOT_HORIZON_DAYS)
+    booked_doctor_ids = {row["doctor_id"] for row in rows if today <= row["date"] < horizon_end}
+    await db.run_sync(build_doctor_calendars, doctor_ids=booked_doctor_ids, start_date=today)
+    await db.commit()
+
+
+async def generate_workload(db: AsyncSession, profile: WorkloadProfile):
+    started = timer.perf_counter()
+    rng = random.Random(profile.seed)
+    today = date.today()
+
+    patient_ids = await bulk_populate(
+        db=db, no_of_users=profile.patients, role=TestUserRole.PATIENT,
+        chunk_size=profile.chunk_size, seed=rng.randrange(2 ** 32)
+    )
+    doctors = await bulk_populate(
+        db=db, no_of_users=profile.doctors, role=TestUserRole.DOCTOR,
+        chunk_size=profile.chunk_size, seed=rng.randrange(2 ** 32),
+        schedule=weekly_schedule, verified_ratio=profile.verified_ratio
+    )
+
+    statuses = Counter()
+    rows = []
+    for doctor, popularity in zip(doctors, _popularity(rng, len(doctors), profile.popularity_skew)):
+        for row in _doctor_appointments(rng, profile, doctor, popularity, patient_ids, today):
+            rows.append(row)
+            statuses[row["appointment_status"].value] += 1
+
+            if len(rows) >= profile.chunk_size:
+                await _insert_appointments(db, rows, today)
+                rows = []
+
+    if rows:
+        await _insert_appointments(db, rows, today)
+
+    return {
+        "seed": profile.seed,
+        "doctors": len(doctors),
+        "patients": len(patient_ids),
+        "appointments": sum(statuses.values()),
+        "appointment_statuses": dict(statuses),
+        "seconds": round(timer.perf_counter() - started, 3),
+    }
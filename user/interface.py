@@ -1,17 +1,32 @@
 from fastapi import HTTPException, status
-from core.security import get_password_hash
-from user.models import Address, User, UserAddress
+from core.security import get_password_hash_async, invalidate_cached_user
+from user.models import Address, User, UserAddress, UserRole
 from user.schemas import AddressCreate, AddressUpdate, UserPartialUpdate, UserRegister
-from sqlalchemy.orm import Session, joinedload
+from patient.interface import create_patient
+from patient.schemas import CreatePatient
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
-async def create_user(db: Session, user_create: UserRegister):
-    db_user = db.query(User).filter(User.mobile_no == user_create.mobile_no).first()
-    if db_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="User with this mobile number already exists"
-        )
-    
+
+# Unique columns of users that turn a duplicate signup into a 400 at insert time
+REGISTRATION_CONFLICTS = {
+    "mobile_no": "User with this mobile number already exists",
+    "username": "User with this username already exists",
+}
+
+
+def _registration_conflict_detail(error: IntegrityError):
+    # Postgres names the column in the violated key, SQLite as users.<column>
+    message = str(error.orig)
+    for column, detail in REGISTRATION_CONFLICTS.items():
+        if column in message:
+            return detail
+    return None
+
+
+async def create_user(db: AsyncSession, user_create: UserRegister):
     if not user_create.first_name.strip() or not user_create.last_name.strip():
         raise HTTPException(
             status_code=422,
@@ -25,23 +40,51 @@ async def create_user(db: Session, user_create: UserRegister):
         )
 
 
-    hashed_password = get_password_hash(user_create.password)
+    hashed_password = await get_password_hash_async(user_create.password)
     user_create.password = hashed_password
 
     user = User(**user_create.model_dump()) 
     db.add(user)
-    db.commit()
-    db.refresh(user)
     return user
 
 
+async def register_user(db: AsyncSession, user_create: UserRegister):
+    """Insert the user and, for patients, their profile in one transaction"""
+    user = await create_user(db, user_create)
+
+    response = {"user": user}
+
+    if user_create.user_role == UserRole.PATIENT:
+        response["patient"] = create_patient(db=db, patient=CreatePatient(), user=user)
+        user.is_profile_created = True
+
+    if user_create.user_role == UserRole.DOCTOR:
+        response["doctor"] = None
+
+    try:
+        # The unique indexes are the duplicate check, a racing signup waits on them and then fails
+        await db.flush()
+    except IntegrityError as e:
+        await db.rollback()
+        conflict_detail = _registration_conflict_detail(e)
+        if conflict_detail is None:
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=conflict_detail
+        )
+
+    await db.commit()
+    return response
+
+
 # Get user by id
 
 
 
 
-def update_user_by_id(db: Session, user_id: int, user_update: UserPartialUpdate):
-    db_user = db.query(User).filter(User.id == user_id).first()
+async def update_user_by_id(db: AsyncSession, user_id: int, user_update: UserPartialUpdate):
+    db_user = await db.scalar(select(User).filter(User.id == user_id))
 
     if not db_user:
         raise HTTPException(
@@ -54,13 +97,14 @@ def update_user_by_id(db: Session, user_id: int, user_update: UserPartialUpdate)
     for field, value in update_data.items():
         setattr(db_user, field, value)
     
-    db.commit()
+    await invalidate_cached_user(db, user_id)
+    await db.commit()
     # db.refresh(db_user)
     return db_user
 
 
-def delete_user_by_id(db: Session, user_id: int):
-    db_user = db.query(User).filter(User.id == user_id).first()
+async def delete_user_by_id(db: AsyncSession, user_id: int):
+    db_user = await db.scalar(select(User).filter(User.id == user_id))
 
     if not db_user:
         raise HTTPException(
@@ -73,27 +117,28 @@ def delete_user_by_id(db: Session, user_id: int):
         "message": f"User {db_user.first_name} {db_user.last_name} has been deleted"
     }
 
-    db.delete(db_user)
-    db.commit()
+    await db.delete(db_user)
+    await invalidate_cached_user(db, user_id)
+    await db.commit()
     return user_copy
 
 
 # Address Interfaces
 
 
-async def create_address(db: Session, address_create: AddressCreate):
+async def create_address(db: AsyncSession, address_create: AddressCreate):
     """Create a new address in the database"""
     address = Address(**address_create.model_dump())
     db.add(address)
-    db.commit()
-    db.refresh(address)
+    await db.commit()
+    await db.refresh(address)
     return address
 
 
-async def create_user_address(db: Session, user_id: int, address_create: AddressCreate):
+async def create_user_address(db: AsyncSession, user_id: int, address_create: AddressCreate):
     """Create a new address and associate it with a user"""
     # First check if user exists
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).filter(User.id == user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -106,17 +151,20 @@ async def create_user_address(db: Session, user_id: int, address_create: Address
     # Create the user_address relationship
     user_address = UserAddress(user_id=user_id, address_id=address.id)
     db.add(user_address)
-    db.commit()
-    db.refresh(user_address)
+    await db.commit()
+    await db.refresh(user_address)
+
+    # The response carries the links, load them before the session closes
+    await db.refresh(address, attribute_names=["user_addresses"])
     
     return address
 
 
 
-def get_user_addresses(db: Session, user_id: int):
+async def get_user_addresses(db: AsyncSession, user_id: int):
     """Get all addresses for a user"""
     # Check if user exists
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).filter(User.id == user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
@@ -125,21 +173,20 @@ def get_user_addresses(db: Session, user_id: int):
     
     
     # Get the addresses with their relationships in a single query
-    addresses = (
-        db.query(Address)
+    addresses = await db.scalars(
+        select(Address)
         .join(UserAddress, UserAddress.address_id == Address.id)
         .filter(UserAddress.user_id == user_id)
-        .options(joinedload(Address.user_addresses))
-        .all()
+        .options(selectinload(Address.user_addresses))
     )
 
-    return addresses
+    return addresses.all()
 
 
-async def update_address(db: Session, address_id: int, address_update: AddressUpdate):
+async def update_address(db: AsyncSession, address_id: int, address_update: AddressUpdate):
     """Update an existing address in the database"""
     # Check if address exists
-    address = db.query(Address).filter(Address.id == address_id).first()
+    address = await db.scalar(select(Address).options(selectinload(Address.user_addresses)).filter(Address.id == address_id))
     if not address:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -151,6 +198,6 @@ async def update_address(db: Session, address_id: int, address_update: AddressUp
     for field, value in update_data.items():
         setattr(address, field, value)
     
-    db.commit()
-    db.refresh(address)
+    await db.commit()
+    await db.refresh(address)
     return address 
\ No newline at end of file
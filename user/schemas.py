@@ -3,7 +3,7 @@ from pydantic import BaseModel, Field
 
 from doctor.schemas import DoctorResponse
 from patient.schemas import PatientResponse
-from .models import AddressType, Gender, UserRole
+from .models import AddressType, Gender, UserRole, UserStatus
 
 
 
@@ -47,6 +47,16 @@ class UserResponse(UserBase):
 class UserDB(UserResponse):
     pass
 
+
+# Identity snapshot of an authenticated request, cached per token
+class CurrentUser(BaseModel):
+    id: int
+    user_role: UserRole
+    status: Optional[UserStatus] = None
+    is_profile_created: Optional[bool] = None
+    doctor_id: Optional[int] = None
+    patient_id: Optional[int] = None
+
 class UserResponseWithPatient(BaseModel):
     user: UserResponse
     patient: Optional[PatientResponse] = None